@@ -9,6 +9,8 @@ fi
 PROCESS_DIRECTORY="${1:-drell-yan_ll}"
 TOTAL_NEVENTS=1000000
 # This should be taken from the JSON config
+# generate_config.py --total-events plans the events per job from the measured
+# generation rate, the cores of a node and the walltime
 EVENTS_PER_JOB=5000
 
 # build seed array
@@ -7,14 +7,21 @@ if [ "${BASH_VERSION:0:1}" -lt 4 ]; then
 fi
 
 PROCESS_DIRECTORY="${1:-drell-yan_ll}"
+# Ranges file of momemta/plan_steps.py, with a job per step, under ${HOME} to
+# be visible in the container
+RANGES_PATH="${2:-}"
 
 NUMBER_OF_JOBS=200
+if [ -n "${RANGES_PATH}" ]; then
+    RANGES_PATH="$(realpath "${RANGES_PATH}")"
+    NUMBER_OF_JOBS="$(grep --count --invert-match '^#' "${RANGES_PATH}")"
+fi
 echo "# Submitting ${NUMBER_OF_JOBS} jobs"
 echo ""
 for n_job in $(seq 0 $((${NUMBER_OF_JOBS}-1)))
 do
     # qsub -v: comma separated list of strings of the form variable or variable=value.
-    qsub -v NUMBER_OF_STEPS="${NUMBER_OF_JOBS}",STEP_NUMBER="${n_job}" "${PROCESS_DIRECTORY}/momemta.pbs"
+    qsub -v NUMBER_OF_STEPS="${NUMBER_OF_JOBS}",STEP_NUMBER="${n_job}",RANGES_PATH="${RANGES_PATH}" "${PROCESS_DIRECTORY}/momemta.pbs"
 done
 echo ""
 echo "# Submitted ${NUMBER_OF_JOBS} jobs"
@@ -15,12 +15,24 @@ printf "\n# printenv:\n"
 printenv
 printf "\n\n"
 
-printf "# Unzip HEPMC file if needed\n\n" && \
-if [ -f "${INPUT_FILE_PATH}.gz" ]; then
-    gunzip "${INPUT_FILE_PATH}.gz"
+# Stream the HEPMC file into Delphes, decompressing it on the fly if needed, so
+# that the simulation starts right away and runs concurrently with the
+# decompression. pigz decompresses with separate threads for reading, writing
+# and checksumming.
+printf "# Stream HEPMC file into Delphes, decompressing it if needed\n\n"
+if [ -f "${INPUT_FILE_PATH}" ]; then
+    DECOMPRESS="cat"
+elif command -v pigz &> /dev/null; then
+    INPUT_FILE_PATH="${INPUT_FILE_PATH}.gz"
+    DECOMPRESS="pigz --decompress --stdout"
+else
+    INPUT_FILE_PATH="${INPUT_FILE_PATH}.gz"
+    DECOMPRESS="gzip --decompress --stdout"
 fi
 
-time DelphesHepMC2 \
+set -o pipefail
+# DelphesHepMC2 reads standard input given -
+time ${DECOMPRESS} "${INPUT_FILE_PATH}" | DelphesHepMC2 \
     /usr/local/venv/cards/delphes_card_ATLAS.tcl \
     delphes_output.root \
-    "${INPUT_FILE_PATH}"
+    -
@@ -21,6 +21,8 @@ printf "\n\n"
 
 mkdir -p configs/momemta/
 cp -r "${INPUTS_DIR}/momemta/${PHYSICS_PROCESS}"/* .
+# the driver machinery shared by the hypotheses
+cp "${INPUTS_DIR}/momemta/momemta_driver.h" .
 cp -r "${INPUTS_DIR}/configs/momemta/" configs/
 
 # Run this inside of the directory for the hypothesis
@@ -78,10 +80,13 @@ OUTPUT_PATH="${3:-momemta_weights.root}"
 NUMBER_OF_STEPS="${4:-0}"
 # N.B.: STEP_NUMBER is 0 indexed
 STEP_NUMBER="${5:-0}"
+# 0 uses all cores
+NUMBER_OF_THREADS="${6:-0}"
 
 # Current configuration in drell_yan.cxx requires running from top level of example dir
 time ./build/drell-yan_example \
   --input "${INPUT_PATH}" \
   --output "${OUTPUT_PATH}" \
   --nsteps "${NUMBER_OF_STEPS}" \
-  --step "${STEP_NUMBER}"
+  --step "${STEP_NUMBER}" \
+  --threads "${NUMBER_OF_THREADS}"
@@ -19,10 +19,14 @@ INPUT_PATH="${2:-../delphes/delphes_output.root}"
 OUTPUT_PATH=${3:-preprocessing_output.root}
 # Lumi is currently set to a default value and should be updated to something
 # more relevant
+# Checkpoints are written every 10 minutes so that a job stopped by the walltime
+# limit continues where it left off when it is resubmitted
 python "${INPUTS_DIR}"/preprocessing/scripts/SimpleAna.py \
     --input "${INPUT_PATH}" \
     --output "${OUTPUT_PATH}" \
     --lumi 1000.0 \
-    --XS 0
+    --XS 0 \
+    --checkpoint-interval 600 \
+    --resume
 
 unset ROOT_INCLUDE_PATH
@@ -0,0 +1,159 @@
+# Streaming reader of (gzipped) LHE files into NumPy arrays
+import gzip
+from collections import deque, namedtuple
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+# Fields of the first line of an <event> block
+event_dtype = np.dtype(
+    [
+        ("nparticles", np.int32),
+        ("process_id", np.int32),
+        ("weight", np.float64),
+        ("scale", np.float64),
+        ("aqed", np.float64),
+        ("aqcd", np.float64),
+    ]
+)
+
+# Fields of the particle lines of an <event> block
+particle_dtype = np.dtype(
+    [
+        ("id", np.int32),
+        ("status", np.int32),
+        ("mother1", np.int32),
+        ("mother2", np.int32),
+        ("color1", np.int32),
+        ("color2", np.int32),
+        ("px", np.float64),
+        ("py", np.float64),
+        ("pz", np.float64),
+        ("e", np.float64),
+        ("m", np.float64),
+        ("lifetime", np.float64),
+        ("spin", np.float64),
+    ]
+)
+
+# The particles of event i are particles[offsets[i] : offsets[i + 1]]
+LHEChunk = namedtuple("LHEChunk", ["events", "particles", "offsets"])
+
+
+def _open(path):
+    path = str(path)
+    if path.endswith(".gz"):
+        return gzip.open(path, "rt")
+    return open(path)
+
+
+def _to_records(text, dtype):
+    """
+    Parse whitespace separated lines of numbers into a structured array.
+    """
+    values = np.array(text.split(), dtype=np.float64)
+    values = values.reshape(-1, len(dtype.names))
+    records = np.empty(len(values), dtype=dtype)
+    for idx, name in enumerate(dtype.names):
+        records[name] = values[:, idx]
+    return records
+
+
+def _make_chunk(event_text, particle_text):
+    events = _to_records(event_text, event_dtype)
+    offsets = np.zeros(len(events) + 1, dtype=np.int64)
+    np.cumsum(events["nparticles"], out=offsets[1:])
+    return LHEChunk(events, _to_records(particle_text, particle_dtype), offsets)
+
+
+def _event_blocks(path, chunk_size):
+    """
+    The text of the event lines and of the particle lines of chunks of up to
+    chunk_size events. Multi-member gzip files are read transparently.
+    """
+    event_lines = []
+    particle_lines = []
+    with _open(path) as lhe_file:
+        lines = iter(lhe_file)
+        # the header can contain arbitrary text, events follow the <init> block
+        for line in lines:
+            if line.startswith("</init>"):
+                break
+        for line in lines:
+            if not line.startswith("<event"):
+                continue
+            header = next(lines)
+            event_lines.append(header)
+            nparticles = int(header.split(None, 1)[0])
+            particle_lines.extend(next(lines) for _ in range(nparticles))
+
+            if len(event_lines) == chunk_size:
+                yield "".join(event_lines), "".join(particle_lines)
+                event_lines = []
+                particle_lines = []
+
+    if event_lines:
+        yield "".join(event_lines), "".join(particle_lines)
+
+
+def read_lhe(path, chunk_size=100000, workers=1):
+    """
+    Iterate over the events of an LHE file in chunks of up to chunk_size
+    events. Only the text of a few chunks is held in memory at a time.
+
+    With workers > 1 the chunks are parsed in a pool of worker processes while
+    the file is decompressed and split into chunks, and are still delivered in
+    the order of the file.
+    """
+    blocks = _event_blocks(path, chunk_size)
+    if workers <= 1:
+        for block in blocks:
+            yield _make_chunk(*block)
+        return
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        pending = deque()
+        for block in blocks:
+            pending.append(executor.submit(_make_chunk, *block))
+            # bound the number of chunks in flight
+            if len(pending) > 2 * workers:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+
+def nth_particle(chunk, index):
+    """
+    The index-th particle of every event of the chunk, counting from the end
+    of the event for negative indices like a list.
+    """
+    if index >= 0:
+        return chunk.particles[chunk.offsets[:-1] + index]
+    return chunk.particles[chunk.offsets[1:] + index]
+
+
+def invariant_mass(p1, p2):
+    """
+    Invariant mass of the sums of the particles of two particle arrays.
+    """
+    mass2 = (
+        (p1["e"] + p2["e"]) ** 2
+        - (p1["px"] + p2["px"]) ** 2
+        - (p1["py"] + p2["py"]) ** 2
+        - (p1["pz"] + p2["pz"]) ** 2
+    )
+    return np.sqrt(np.maximum(mass2, 0.0))
+
+
+def pt(particles):
+    return np.hypot(particles["px"], particles["py"])
+
+
+def eta(particles):
+    # infinite for particles along the beam axis
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return np.arcsinh(particles["pz"] / pt(particles))
+
+
+def phi(particles):
+    return np.arctan2(particles["py"], particles["px"])
@@ -1,22 +1,12 @@
-import math
+import os
 from pathlib import Path
 
 import hist
 import matplotlib
 import matplotlib.pyplot as plt
 import mplhep
-import pylhe
 from hist import Hist
-
-
-def invariant_mass(p1, p2):
-    # c.f. https://github.com/scikit-hep/pylhe/blob/master/examples/zpeak.ipynb
-    return math.sqrt(
-        sum(
-            (1 if mu == "e" else -1) * math.pow((getattr(p1, mu) + getattr(p2, mu)), 2)
-            for mu in ["e", "px", "py", "pz"]
-        )
-    )
+from lhe_reader import invariant_mass, nth_particle, read_lhe
 
 
 def get_nbins(hist_range, width):
@@ -37,7 +27,7 @@ if __name__ == "__main__":
         storage=hist.storage.Weight(),
     )
 
-    # Use the generator provided by pylhe to read the events.
+    # Read the events in chunks of arrays
     lhe_path = (
         Path.cwd()
         .joinpath("drell-yan_output")
@@ -46,11 +36,10 @@ if __name__ == "__main__":
         .joinpath("unweighted_events.lhe.gz")
     )
 
-    # Slow given LHE needs parsing
-    for event in pylhe.readLHE(lhe_path):
+    for chunk in read_lhe(lhe_path, workers=os.cpu_count()):
         hist_1.fill(
-            invariant_mass(event.particles[-1], event.particles[-2]),
-            weight=event.eventinfo.weight,
+            invariant_mass(nth_particle(chunk, -1), nth_particle(chunk, -2)),
+            weight=chunk.events["weight"],
         )
 
     matplotlib.use("AGG")  # Set non-GUI backend
@@ -1,20 +1,11 @@
-import math
+import os
 from pathlib import Path
 
-import pylhe
+import numpy as np
+from lhe_reader import invariant_mass, nth_particle, read_lhe
 from ROOT import TH1F, TCanvas, gROOT, kTRUE
 
 
-def invariant_mass(p1, p2):
-    # c.f. https://github.com/scikit-hep/pylhe/blob/master/examples/zpeak.ipynb
-    return math.sqrt(
-        sum(
-            (1 if mu == "e" else -1) * math.pow((getattr(p1, mu) + getattr(p2, mu)), 2)
-            for mu in ["e", "px", "py", "pz"]
-        )
-    )
-
-
 def get_nbins(hist_range, width):
     return int((hist_range[1] - hist_range[0]) / width)
 
@@ -34,7 +25,7 @@ if __name__ == "__main__":
     )
     hist_1.SetFillColor(38)
 
-    # Use the generator provided by pylhe to read the events.
+    # Read the events in chunks of arrays
     lhe_path = (
         Path.cwd()
         .joinpath("drell-yan_output")
@@ -42,10 +33,11 @@ if __name__ == "__main__":
         .joinpath("run_01")
         .joinpath("unweighted_events.lhe.gz")
     )
-    for event in pylhe.readLHE(lhe_path):
-        hist_1.Fill(
-            invariant_mass(event.particles[-1], event.particles[-2]),
-            event.eventinfo.weight,
+    for chunk in read_lhe(lhe_path, workers=os.cpu_count()):
+        hist_1.FillN(
+            len(chunk.events),
+            invariant_mass(nth_particle(chunk, -1), nth_particle(chunk, -2)),
+            np.ascontiguousarray(chunk.events["weight"]),
         )
 
     canvas = TCanvas()
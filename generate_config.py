@@ -1,11 +1,51 @@
+import copy
+import hashlib
+import itertools
 import json
+import math
 import multiprocessing
+import sys
+from collections import namedtuple
 from pathlib import Path
 
 import click
 
 
-def json_to_mg5(config):
+def process_dir(config):
+    """
+    Name of the process directory of the config, content-hashed over the
+    process definition so that configs that only differ in their run options
+    share it.
+    """
+    process = json.dumps(
+        {"type": config["type"], "process": config["process"]}, sort_keys=True
+    )
+    digest = hashlib.sha256(process.encode()).hexdigest()[:12]
+    return f"{config['output']}_output_{digest}"
+
+
+def job_dir(config):
+    """
+    Name of the copy of the process directory launched by the launch-only card
+    of the config, one per seed as MadEvent writes into and locks the directory
+    it launches.
+    """
+    return f"{process_dir(config)}_seed_{config['options']['run'].get('iseed', 0)}"
+
+
+def json_to_mg5_build(config):
+    """
+    Card that only generates the process and writes its process directory,
+    run once before the launch cards of json_to_mg5(config, launch_only=True).
+    """
+    mg5_str = "# Build the process directory shared by the launch cards"
+    mg5_str += f"\ngenerate {config['process']}"
+    mg5_str += f"\noutput {process_dir(config)}"
+    mg5_str += "\n"
+    return mg5_str
+
+
+def json_to_mg5(config, launch_only=False):
     mg5_str = ""
 
     options = config.get("options", None)
@@ -21,9 +61,16 @@ def json_to_mg5(config):
             )
             mg5_str += f"\nset nb_core {nb_core}"
 
-    mg5_str += f"\ngenerate {config['process']}"
-    mg5_str += f"\noutput {config['output']}_output"
-    mg5_str += f"\nlaunch {config['output']}_output"
+    if launch_only:
+        # copy of the process directory written by json_to_mg5_build, so that
+        # jobs running at the same time don't share it
+        mg5_str += "\n# Launch a copy of the shared process directory"
+        mg5_str += f"\nshell cp -r {process_dir(config)}/. {job_dir(config)}"
+        mg5_str += f"\nlaunch {job_dir(config)}"
+    else:
+        mg5_str += f"\ngenerate {config['process']}"
+        mg5_str += f"\noutput {config['output']}_output"
+        mg5_str += f"\nlaunch {config['output']}_output"
 
     run_options = options.get("run", None)
     mg5_str += "\n# Set run card options"
@@ -47,6 +94,431 @@ def json_to_mg5(config):
     return mg5_str
 
 
+# Renderer and card file extension of each config type
+RENDERERS = {"madgraph5": (json_to_mg5, ".mg5")}
+
+# JSON object whose fields have arbitrary names and values of the same schema
+MappingOf = namedtuple("MappingOf", ["values"])
+
+
+def positive(value):
+    return None if value > 0 else "must be positive"
+
+
+def non_negative(value):
+    return None if value >= 0 else "must not be negative"
+
+
+def card_name(value):
+    if value and all(char.isalnum() or char in "_-." for char in value):
+        return None
+    return "must be a non-empty name of letters, digits, '_', '-' and '.'"
+
+
+# Schema of each config version. A schema is a type, a tuple of the allowed
+# values, a MappingOf, a dict of {field: (required, schema)} for JSON objects
+# with only these fields, or a list of schemas that all have to hold, where a
+# function gives the error of a value or None.
+SCHEMAS = {
+    "0.1.0": {
+        "type": (True, tuple(RENDERERS)),
+        "process": (True, str),
+        "output": (True, [str, card_name]),
+        "version": (True, str),
+        "options": (
+            True,
+            {
+                "madevent": (
+                    False,
+                    {
+                        "run_mode": (False, (0, 1, 2)),
+                        "nb_core": (False, [int, positive]),
+                    },
+                ),
+                "run": (
+                    True,
+                    {
+                        "shower": (False, str),
+                        "nevents": (False, [int, positive]),
+                        "iseed": (False, [int, non_negative]),
+                        "cuts": (False, MappingOf((int, float))),
+                    },
+                ),
+            },
+        ),
+    }
+}
+
+
+def _check(value, schema, path):
+    """
+    Errors of a value of a config against a schema.
+    """
+    if isinstance(schema, list):
+        errors = []
+        for check in schema:
+            errors += _check(value, check, path)
+            if errors:
+                break
+        return errors
+    # before tuple, which MappingOf is a subclass of
+    if isinstance(schema, MappingOf):
+        if not isinstance(value, dict):
+            return [f"{path}: must be an object"]
+        errors = []
+        for name, item in value.items():
+            errors += _check(item, schema.values, f"{path}.{name}")
+        return errors
+    if isinstance(schema, type):
+        # bool is a subclass of int but not a valid number in the configs
+        if isinstance(value, bool) or not isinstance(value, schema):
+            return [f"{path}: must be of type {schema.__name__}"]
+        return []
+    if isinstance(schema, tuple) and all(isinstance(t, type) for t in schema):
+        if isinstance(value, bool) or not isinstance(value, schema):
+            names = " or ".join(t.__name__ for t in schema)
+            return [f"{path}: must be of type {names}"]
+        return []
+    if isinstance(schema, tuple):
+        if isinstance(value, bool) or value not in schema:
+            return [f"{path}: must be one of {', '.join(map(str, schema))}"]
+        return []
+    if isinstance(schema, dict):
+        if not isinstance(value, dict):
+            return [f"{path}: must be an object"]
+        errors = [
+            f"{path}.{name}: unknown field" for name in value if name not in schema
+        ]
+        for name, (required, field_schema) in schema.items():
+            if name in value:
+                errors += _check(value[name], field_schema, f"{path}.{name}")
+            elif required:
+                errors.append(f"{path}.{name}: missing required field")
+        return errors
+    error = schema(value)
+    return [f"{path}: {error}"] if error else []
+
+
+def validate_config(config):
+    """
+    Errors of a config against the schema of its version, empty if it is valid.
+    """
+    if not isinstance(config, dict):
+        return ["config: must be an object"]
+    version = config.get("version")
+    if version not in SCHEMAS:
+        return [
+            f"config.version: unsupported version {version!r}, "
+            + f"supported versions are {', '.join(SCHEMAS)}"
+        ]
+    return _check(config, SCHEMAS[version], "config")
+
+
+def load_config(config_path):
+    """
+    The config of a JSON file, raising a click.ClickException if it is invalid.
+    """
+    try:
+        with open(Path(config_path).absolute()) as config_file:
+            config = json.load(config_file)
+    except (OSError, ValueError) as err:
+        raise click.ClickException(f"{config_path}: {err}")
+    errors = validate_config(config)
+    if errors:
+        raise click.ClickException(
+            f"{config_path} is not a valid config:\n  " + "\n  ".join(errors)
+        )
+    return config
+
+
+def config_hash(config, launch_only=False):
+    """
+    Hash of the contents a rendered card depends on, including the number of
+    CPUs that sets the default nb_core.
+    """
+    content = json.dumps(
+        {
+            "config": config,
+            "launch_only": launch_only,
+            "cpu_count": multiprocessing.cpu_count(),
+        },
+        sort_keys=True,
+    )
+    return hashlib.sha256(content.encode()).hexdigest()
+
+
+def render_card(config, launch_only=False):
+    """
+    The card of a validated config and its file extension.
+    """
+    renderer, file_extension = RENDERERS[config["type"]]
+    return renderer(config, launch_only), file_extension
+
+
+def check_configs(config_paths, output_path=None, launch_only=False):
+    """
+    Validate configs and, if output_path is given, render the cards of the valid
+    ones to it. Cards whose config is unchanged since they were rendered, by the
+    content hashes kept in .card_hashes.json, are not written again. Returns
+    the number of invalid configs.
+    """
+    n_invalid = 0
+    valid_configs = []
+    for config_path in config_paths:
+        try:
+            valid_configs.append(load_config(config_path))
+            click.echo(f"{config_path}: OK")
+        except click.ClickException as err:
+            click.echo(err.format_message(), err=True)
+            n_invalid += 1
+
+    if output_path is None:
+        return n_invalid
+
+    output_path.mkdir(parents=True, exist_ok=True)
+    hashes_path = output_path.joinpath(".card_hashes.json")
+    hashes = json.loads(hashes_path.read_text()) if hashes_path.exists() else {}
+    n_rendered = 0
+    for config in valid_configs:
+        card, file_extension = render_card(config, launch_only)
+        card_path = output_path.joinpath(config["output"] + file_extension)
+        key = config_hash(config, launch_only)
+        if hashes.get(card_path.name) == key and card_path.exists():
+            continue
+        if launch_only:
+            write_build_card(config, output_path)
+        card_path.write_text(card)
+        hashes[card_path.name] = key
+        n_rendered += 1
+    hashes_path.write_text(json.dumps(hashes, indent=2))
+    click.echo(
+        f"Rendered {n_rendered} cards to {output_path}, "
+        + f"{len(valid_configs) - n_rendered} unchanged"
+    )
+    return n_invalid
+
+
+def parse_seeds(seeds):
+    """
+    Seeds of a comma separated list of seeds and inclusive seed ranges, such as
+    "1-100,200".
+    """
+    seed_list = []
+    for part in seeds.split(","):
+        first, _, last = part.strip().partition("-")
+        if last:
+            seed_list.extend(range(int(first), int(last) + 1))
+        else:
+            seed_list.append(int(first))
+    return seed_list
+
+
+def set_option(config, key, value):
+    """
+    Set the value of the config entry of a dotted key such as
+    "options.run.cuts.ptl".
+    """
+    *parents, name = key.split(".")
+    for parent in parents:
+        config = config.setdefault(parent, {})
+    config[name] = value
+
+
+def grid_points(grid):
+    """
+    All combinations of the values of a grid mapping dotted config keys to
+    lists of values.
+    """
+    keys = list(grid)
+    return [dict(zip(keys, values)) for values in itertools.product(*grid.values())]
+
+
+def allocate_seeds(n_points, seeds=None, jobs=None, first_seed=1):
+    """
+    Distinct seeds of the jobs of each of n_points grid points. The seeds are
+    taken in order from the seeds given, which have to be exactly the seeds of
+    the jobs, or counted up from first_seed.
+    """
+    if seeds is None:
+        seeds = list(range(first_seed, first_seed + n_points * (jobs or 1)))
+    if len(set(seeds)) != len(seeds):
+        raise click.BadParameter("seeds must not repeat", param_hint="--seeds")
+    if 0 in seeds:
+        # MadGraph picks the seed of iseed 0 itself, the same for every job
+        raise click.BadParameter("seed 0 is not allowed", param_hint="--seeds")
+    if jobs is None:
+        jobs = len(seeds) // n_points
+    if jobs < 1 or len(seeds) < n_points * jobs:
+        raise click.BadParameter(
+            f"{len(seeds)} seeds are too few for {n_points} grid points",
+            param_hint="--seeds",
+        )
+    if len(seeds) > n_points * jobs:
+        unused = seeds[n_points * jobs :]
+        raise click.BadParameter(
+            f"{len(seeds)} seeds are more than the {n_points * jobs} jobs of {n_points} grid points, seeds {unused} would not be used",
+            param_hint="--seeds",
+        )
+    return [seeds[point * jobs : (point + 1) * jobs] for point in range(n_points)]
+
+
+def read_manifest(manifest_path):
+    if not manifest_path.exists():
+        return {"cards": []}
+    with open(manifest_path) as manifest_file:
+        return json.load(manifest_file)
+
+
+def write_build_card(config, output_path):
+    """
+    Write the build card of the process directory of the config and return its
+    name.
+    """
+    card_name = f"{process_dir(config)}_build.mg5"
+    with open(output_path.joinpath(card_name), "w") as outfile:
+        outfile.write(json_to_mg5_build(config))
+    return card_name
+
+
+def write_batch(
+    config, output_path, seeds=None, jobs=None, grid=None, launch_only=False
+):
+    """
+    Write the cards of every job of every grid point of the config to the
+    output directory and list them in its manifest.json. Seeds already used by
+    the cards of the manifest are not used again: without seeds the seeds are
+    counted up from the largest one used, and given seeds must not be used.
+
+    With launch_only the job cards copy a shared process directory, which is
+    written by one build card per distinct process, and launch their copy.
+    Returns the seeds of the written cards.
+    """
+    points = grid_points(grid) if grid else [{}]
+    manifest_path = output_path.joinpath("manifest.json")
+    manifest = read_manifest(manifest_path)
+    used_seeds = {card["seed"] for card in manifest["cards"]}
+
+    if seeds is None:
+        # extend the campaign with the seeds after those already used
+        first_seed = config["options"]["run"].get("iseed", 0) or 1
+        first_seed = max(first_seed, max(used_seeds, default=0) + 1)
+        point_seeds = allocate_seeds(len(points), jobs=jobs, first_seed=first_seed)
+    else:
+        point_seeds = allocate_seeds(len(points), seeds, jobs)
+        reused_seeds = used_seeds.intersection(itertools.chain(*point_seeds))
+        if reused_seeds:
+            raise click.BadParameter(
+                f"seeds {sorted(reused_seeds)} are already used by {manifest_path}",
+                param_hint="--seeds",
+            )
+
+    output_path.mkdir(parents=True, exist_ok=True)
+    for point_idx, (point, job_seeds) in enumerate(zip(points, point_seeds)):
+        point_config = copy.deepcopy(config)
+        for key, value in point.items():
+            set_option(point_config, key, value)
+
+        build = {}
+        if launch_only:
+            build = {
+                "process_dir": process_dir(point_config),
+                "build_card": write_build_card(point_config, output_path),
+            }
+
+        name = point_config["output"]
+        if grid:
+            name += f"_point_{point_idx}"
+        for seed in job_seeds:
+            point_config["options"]["run"]["iseed"] = seed
+            card_name = f"{name}_seed_{seed}.mg5"
+            with open(output_path.joinpath(card_name), "w") as outfile:
+                outfile.write(json_to_mg5(point_config, launch_only))
+            card = {"card": card_name, "seed": seed, "grid_point": point}
+            if launch_only:
+                card.update(build, job_dir=job_dir(point_config))
+            manifest["cards"].append(card)
+
+    with open(manifest_path, "w") as manifest_file:
+        json.dump(manifest, manifest_file, indent=2)
+    return list(itertools.chain(*point_seeds))
+
+
+def parse_walltime(walltime):
+    """
+    Seconds of a walltime given as [[HH:]MM:]SS, like the PBS walltime.
+    """
+    seconds = 0
+    for part in walltime.split(":"):
+        seconds = 60 * seconds + int(part)
+    return seconds
+
+
+def rate_key(config):
+    return f"{config['type']}:{config['process']}"
+
+
+def read_rates(rates_path):
+    if not rates_path.exists():
+        return {}
+    with open(rates_path) as rates_file:
+        return json.load(rates_file)
+
+
+def record_rate(rates_path, config, nevents, seconds, cores):
+    """
+    Add a measured run of nevents events taking seconds on cores to the rates
+    file, which keeps the events per core-second of every process averaged over
+    all recorded runs.
+    """
+    rates = read_rates(rates_path)
+    rate = rates.get(rate_key(config), {"events": 0, "core_seconds": 0.0})
+    rate["events"] += nevents
+    rate["core_seconds"] += seconds * cores
+    rate["events_per_core_second"] = rate["events"] / rate["core_seconds"]
+    rates[rate_key(config)] = rate
+    with open(rates_path, "w") as rates_file:
+        json.dump(rates, rates_file, indent=2)
+    return rate["events_per_core_second"]
+
+
+def plan_jobs(
+    total_events, cores_per_node, walltime, rate, nodes=None, walltime_fraction=0.8
+):
+    """
+    Split total_events into the fewest equal jobs that each fill one node of
+    cores_per_node cores and finish within walltime_fraction of the walltime
+    (in seconds) at the measured rate in events per core-second.
+    """
+    max_events = int(rate * cores_per_node * walltime * walltime_fraction)
+    if max_events < 1:
+        raise click.BadParameter(
+            "no event can be generated within the walltime at the measured rate",
+            param_hint="--walltime",
+        )
+    n_jobs = math.ceil(total_events / max_events)
+    nevents = math.ceil(total_events / n_jobs)
+    plan = {
+        "total_events": n_jobs * nevents,
+        "n_jobs": n_jobs,
+        "nevents": nevents,
+        "run_mode": 2,
+        "nb_core": cores_per_node,
+        "expected_seconds": nevents / (rate * cores_per_node),
+        "walltime_seconds": walltime,
+    }
+    if nodes:
+        # number of rounds of jobs when all nodes run one job at a time
+        plan["rounds"] = math.ceil(n_jobs / nodes)
+    return plan
+
+
+def read_plans(plans_path):
+    if not plans_path.exists():
+        return []
+    with open(plans_path) as plans_file:
+        return json.load(plans_file)
+
+
 @click.command()
 @click.option(
     "-c",
@@ -67,23 +539,166 @@ def json_to_mg5(config):
     type=int,
     help="Random seed (iseed) for MadGraph5 run_card.dat.",
 )
-def generate_config(config_path, output_path, random_seed):
-    with open(Path(config_path).absolute()) as config_file:
-        config = json.load(config_file)
+@click.option(
+    "--seeds",
+    "seeds",
+    type=parse_seeds,
+    help='Batch mode: seeds of the jobs, as a comma separated list of seeds and inclusive ranges such as "1-100,200".',
+)
+@click.option(
+    "--jobs",
+    "jobs",
+    type=int,
+    help="Batch mode: number of jobs per grid point. Defaults to all seeds given, split over the grid points.",
+)
+@click.option(
+    "--grid",
+    "grid_path",
+    help='Batch mode: path to a JSON file mapping dotted config keys, such as "options.run.nevents", to lists of values to generate cards for.',
+)
+@click.option(
+    "--launch-only",
+    "launch_only",
+    is_flag=True,
+    help="Write a build card that generates the process directory once and cards that only launch it.",
+)
+@click.option(
+    "--total-events",
+    "total_events",
+    type=int,
+    help="Planner: total number of events to generate, split into jobs that fit the nodes and walltime.",
+)
+@click.option(
+    "--cores-per-node",
+    "cores_per_node",
+    type=int,
+    help="Planner: number of cores of each node, all used by one job.",
+)
+@click.option(
+    "--walltime",
+    "walltime",
+    type=parse_walltime,
+    help="Planner: walltime of a job as [[HH:]MM:]SS.",
+)
+@click.option(
+    "--nodes",
+    "nodes",
+    type=int,
+    help="Planner: number of nodes available at the same time.",
+)
+@click.option(
+    "--rate",
+    "rate",
+    type=float,
+    help="Planner: events per core-second, instead of the rate measured for the process.",
+)
+@click.option(
+    "--rates",
+    "rates_path",
+    default=str(Path(__file__).absolute().parent.joinpath("configs", "rates.json")),
+    help="Path to the JSON file of the measured events per core-second of each process.",
+)
+@click.option(
+    "--check",
+    "check_path",
+    help="Validate a JSON config, or all JSON configs of a directory, and render the valid ones to --outpath if given.",
+)
+@click.option(
+    "--record-run",
+    "record_run",
+    type=(int, float, int),
+    help="Record the rate of a finished run of the config given as NEVENTS SECONDS CORES.",
+)
+def generate_config(
+    config_path,
+    output_path,
+    random_seed,
+    seeds,
+    jobs,
+    grid_path,
+    launch_only,
+    total_events,
+    cores_per_node,
+    walltime,
+    nodes,
+    rate,
+    rates_path,
+    record_run,
+    check_path,
+):
+    if check_path:
+        check_path = Path(check_path)
+        config_paths = (
+            sorted(check_path.glob("*.json")) if check_path.is_dir() else [check_path]
+        )
+        n_invalid = check_configs(
+            config_paths,
+            Path(output_path).absolute() if output_path else None,
+            launch_only,
+        )
+        sys.exit(1 if n_invalid else 0)
+
+    config = load_config(config_path)
+
+    if record_run:
+        rate = record_rate(Path(rates_path), config, *record_run)
+        click.echo(f"{rate_key(config)}: {rate:.3g} events per core-second")
+        return
 
     # Inject random seed if given at CLI
     if random_seed:
         config["options"]["run"]["iseed"] = random_seed
 
-    if config["type"] == "madgraph5":
-        output_config = json_to_mg5(config)
-        file_extension = ".mg5"
+    plan = None
+    if total_events:
+        if not (cores_per_node and walltime):
+            raise click.UsageError(
+                "--total-events requires --cores-per-node and --walltime"
+            )
+        if rate is None:
+            measured = read_rates(Path(rates_path)).get(rate_key(config))
+            if measured is None:
+                raise click.UsageError(
+                    f"no rate of {rate_key(config)} recorded in {rates_path}, pass --rate or record a run with --record-run"
+                )
+            rate = measured["events_per_core_second"]
+        plan = plan_jobs(total_events, cores_per_node, walltime, rate, nodes)
+        click.echo(json.dumps(plan, indent=2))
+        set_option(config, "options.madevent.run_mode", plan["run_mode"])
+        set_option(config, "options.madevent.nb_core", plan["nb_core"])
+        set_option(config, "options.run.nevents", plan["nevents"])
+        jobs = plan["n_jobs"]
+
+    if seeds or jobs or grid_path:
+        grid = None
+        if grid_path:
+            with open(Path(grid_path).absolute()) as grid_file:
+                grid = json.load(grid_file)
+        output_path = (
+            Path(output_path).absolute()
+            if output_path
+            else Path.cwd().joinpath("configs", config["type"])
+        )
+        written_seeds = write_batch(config, output_path, seeds, jobs, grid, launch_only)
+        if plan:
+            # a campaign extended by later plans keeps the plans of all its jobs
+            plan["seeds"] = written_seeds
+            plans_path = output_path.joinpath("plan.json")
+            plans = read_plans(plans_path)
+            with open(plans_path, "w") as plan_file:
+                json.dump(plans + [plan], plan_file, indent=2)
+        click.echo(f"Wrote {len(written_seeds)} cards to {output_path}")
+        return
+
+    output_config, file_extension = render_card(config, launch_only)
 
     output_path = (
         Path(output_path).absolute()
         if output_path
         else Path.cwd().joinpath("configs", config["type"])
     )
+    if launch_only:
+        write_build_card(config, output_path)
     out_path = output_path.joinpath(config["output"] + file_extension)
     with open(out_path, "w") as outfile:
         outfile.write(output_config)
@@ -0,0 +1,155 @@
+# Combine MoMEMta weights files into a single momemta tree in the entry order of
+# the preprocessing output, matching weights to events by their run and event
+# numbers, so that weights computed incrementally merge into the earlier ones
+import argparse
+import os
+import sys
+
+import numpy as np
+import uproot
+
+key_branches = ["run_number", "event_number"]
+
+
+# Keys of events, compared by run number first and then by event number
+key_dtype = np.dtype([("run_number", np.int64), ("event_number", np.int64)])
+
+
+def event_keys(run_numbers, event_numbers):
+    """
+    Keys of events from their run and event numbers, as compared by the
+    EventKey of the drivers.
+    """
+    keys = np.empty(len(run_numbers), dtype=key_dtype)
+    keys["run_number"] = run_numbers
+    keys["event_number"] = event_numbers
+    return keys
+
+
+def duplicate_keys(keys):
+    """
+    The keys that occur more than once.
+    """
+    unique_keys, counts = np.unique(keys, return_counts=True)
+    return unique_keys[counts > 1]
+
+
+def read_keys(input_path, chain):
+    with uproot.open(input_path) as input_file:
+        tree = input_file[chain]
+        if not set(key_branches) <= set(tree.keys()):
+            print(f"\nERROR: {input_path} has no run_number and event_number branches.")
+            print("       Rerun the preprocessing to add them.\n")
+            sys.exit(1)
+        arrays = tree.arrays(key_branches, library="np")
+    return event_keys(arrays["run_number"], arrays["event_number"])
+
+
+def read_weights(paths):
+    """
+    The branches of the momemta trees of the weights files, concatenated in
+    the order of the files, with has_weight set for the files of the drivers.
+    """
+    trees = []
+    for path in paths:
+        with uproot.open(path) as weights_file:
+            tree = weights_file["momemta"]
+            if not set(key_branches) <= set(tree.keys()):
+                print(f"\nERROR: {path} has no run_number and event_number branches.")
+                print(
+                    "       Recompute its weights from a preprocessing output with them.\n"
+                )
+                sys.exit(1)
+            arrays = tree.arrays(library="np")
+        arrays.setdefault("has_weight", np.ones(tree.num_entries, dtype=bool))
+        trees.append(arrays)
+    return {name: np.concatenate([tree[name] for tree in trees]) for name in trees[0]}
+
+
+def combine(input_keys, weights):
+    """
+    The weights of the events of the preprocessing output in its entry order,
+    taking the weights from the first file for events in more than one file,
+    and the number of events without weights. Events without weights keep
+    their entry with NaN weights so that the entries stay aligned with the
+    preprocessing output, and are told apart by has_weight.
+    """
+    # placeholder entries of earlier combined files hold no weights
+    if "has_weight" in weights:
+        weights = {
+            name: values[weights["has_weight"]]
+            for name, values in weights.items()
+            if name != "has_weight"
+        }
+    keys = event_keys(weights["run_number"], weights["event_number"])
+    unique_keys, first_rows = np.unique(keys, return_index=True)
+
+    positions = np.minimum(
+        np.searchsorted(unique_keys, input_keys), max(len(unique_keys) - 1, 0)
+    )
+    found = np.zeros(len(input_keys), dtype=bool)
+    if len(unique_keys) > 0:
+        found = unique_keys[positions] == input_keys
+    rows = first_rows[positions[found]]
+
+    combined = {}
+    for name, values in weights.items():
+        if name in key_branches:
+            column = input_keys[name].astype(values.dtype)
+        else:
+            column = np.zeros(len(input_keys), dtype=values.dtype)
+            if np.issubdtype(values.dtype, np.floating):
+                column[:] = np.nan
+            column[found] = values[rows]
+        combined[name] = column
+    combined["has_weight"] = found
+    return combined, int(np.count_nonzero(~found))
+
+
+def main(args):
+    input_keys = read_keys(args.input, args.chain)
+    duplicates = duplicate_keys(input_keys)
+    if len(duplicates) > 0:
+        run, event = duplicates[0]
+        print(
+            f"\nERROR: {args.input} has {len(duplicates)} run and event numbers of more than one event,"
+        )
+        print(
+            f"       such as run {run} event {event}. Preprocess every Delphes file only once.\n"
+        )
+        sys.exit(1)
+    weights = read_weights(args.weights)
+
+    combined, n_missing = combine(input_keys, weights)
+
+    # written next to the output first, as the output can be one of the inputs
+    tmp_output = f"{os.path.splitext(args.output)[0]}.tmp.root"
+    with uproot.recreate(tmp_output) as output_file:
+        output_file["momemta"] = combined
+    os.replace(tmp_output, args.output)
+
+    print(
+        f"Combined the weights of {len(input_keys) - n_missing} of {len(input_keys)} events into {args.output}"
+    )
+    if n_missing > 0:
+        print(
+            f"{n_missing} events have no weights yet (has_weight is false), compute them with --existing {args.output}"
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "weights", nargs="+", help="momemta_weights.root files to combine"
+    )
+    parser.add_argument(
+        "--input",
+        action="store",
+        required=True,
+        help="Preprocessing output the weights were computed from",
+    )
+    parser.add_argument("--chain", action="store", default="event_selection/hftree")
+    parser.add_argument("--output", action="store", default="momemta_weights.root")
+    args = parser.parse_args()
+
+    main(args)
@@ -46,8 +46,33 @@ cmake --build build \
 
 INPUT_PATH="${1:-/home/feickert/Code/GitHub/SCAILFIN/MadGraph5-simulation-configs/preprocessing/preprocessing_output.root}"
 OUTPUT_PATH="${2:-momemta_weights.root}"
+NUMBER_OF_STEPS="${3:-0}"
+# N.B.: STEP_NUMBER is 0 indexed
+STEP_NUMBER="${4:-0}"
+# 0 uses all cores
+NUMBER_OF_THREADS="${5:-1}"
+# Ranges file of ../plan_steps.py with the entries of each step, used over the
+# NUMBER_OF_STEPS steps of equal size if given
+RANGES_PATH="${6:-}"
+
+# Weights computed earlier, whose events are skipped, if given
+EXISTING_PATH="${7:-}"
+
+RANGES_OPTION=()
+if [ -n "${RANGES_PATH}" ]; then
+  RANGES_OPTION=(--ranges "${RANGES_PATH}")
+fi
+EXISTING_OPTION=()
+if [ -n "${EXISTING_PATH}" ]; then
+  EXISTING_OPTION=(--existing "${EXISTING_PATH}")
+fi
 
 # Current configuration in final_state_llbb.cxx requires running from top level of example dir
 time ./build/final_state_llbb \
   --input "${INPUT_PATH}" \
-  --output "${OUTPUT_PATH}"
+  --output "${OUTPUT_PATH}" \
+  --nsteps "${NUMBER_OF_STEPS}" \
+  --step "${STEP_NUMBER}" \
+  --threads "${NUMBER_OF_THREADS}" \
+  "${RANGES_OPTION[@]}" \
+  "${EXISTING_OPTION[@]}"
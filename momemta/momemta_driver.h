@@ -0,0 +1,511 @@
+#pragma once
+
+/*
+ * Machinery shared by the MoMEMta drivers: the command line, the entries of
+ * --nsteps and --step, --first and --last or --ranges, skipping the events with
+ * --existing weights, and computing the weights on --threads threads, each with
+ * its own MoMEMta instance. A driver only defines its Hypothesis, with
+ *
+ *   static std::vector<std::string> p4Branches();
+ *       the p4 branches of the particles, which the input has to have
+ *   Hypothesis(TTreeReader& treeReader);
+ *       sets up the readers of the branches of the particles
+ *   std::vector<momemta::Particle> particles();
+ *       the particles of the current entry, in the order of the Lua config
+ *
+ * and calls runDriver<Hypothesis>(argc, argv) from its main.
+ */
+
+#include <momemta/ConfigurationReader.h>
+#include <momemta/Logging.h>
+#include <momemta/MoMEMta.h>
+#include <momemta/Unused.h>
+
+#include <TROOT.h>
+#include <TTree.h>
+#include <TChain.h>
+#include <TTreeReader.h>
+#include <TTreeReaderArray.h>
+#include <TTreeReaderValue.h>
+
+#include <algorithm>
+#include <atomic>
+#include <chrono>
+#include <cmath>
+#include <fstream>
+#include <memory>
+#include <mutex>
+#include <iostream>
+#include <sstream>
+#include <string>
+#include <set>
+#include <thread>
+#include <utility>
+#include <vector>
+#include <stdlib.h>  // provide: exit, EXIT_FAILURE
+
+
+inline void normalizeInput(LorentzVector& p4) {
+    if (p4.M() > 0)
+        return;
+
+    // Increase the energy until M is positive
+    p4.SetE(p4.P());
+    while (p4.M2() < 0) {
+        double delta = p4.E() * 1e-5;
+        p4.SetE(p4.E() + delta);
+    };
+}
+
+/*
+ * The four-momentum of a particle from its p4 branch, which holds Px, Py, Pz
+ * and E next to each other so that it is read in one go.
+ */
+inline LorentzVector toLorentzVector(const TTreeReaderArray<float>& p4) {
+    return LorentzVector { p4[0], p4[1], p4[2], p4[3] };
+}
+
+struct EventWeight {
+    double weight;
+    double weight_err;
+    double time;
+    Long64_t run_number;
+    int event_number;
+};
+
+/*
+ * Hands out the indices of the entries to compute one at a time, so that
+ * threads that got cheap events go on with the next entries instead of idling
+ * while another thread integrates an expensive one.
+ */
+class EntryQueue {
+public:
+    EntryQueue(std::size_t nEntries) : nextIndex(0), nEntries(nEntries) {}
+
+    // The index of the next entry to compute, or -1 once all entries have been handed out
+    Long64_t next() {
+        Long64_t index = nextIndex++;
+        return index < nEntries ? index : -1;
+    }
+
+private:
+    std::atomic<Long64_t> nextIndex;
+    const Long64_t nEntries;
+};
+
+// Key of an event of the preprocessing output: its run and event numbers
+using EventKey = std::pair<Long64_t, int>;
+
+/*
+ * Keys of the events in the momemta trees of the --existing weights files,
+ * whose weights don't have to be computed again.
+ */
+inline std::set<EventKey> readExistingKeys(const std::vector<std::string>& existingPaths) {
+    std::set<EventKey> keys;
+    if (existingPaths.empty())
+        return keys;
+
+    TChain existing("momemta");
+    for (const std::string& existingPath : existingPaths)
+        existing.Add(existingPath.c_str());
+    TTreeReader treeReader(&existing);
+    TTreeReaderValue<Long64_t> run_number(treeReader, "run_number");
+    TTreeReaderValue<int> event_number(treeReader, "event_number");
+    // combine_weights.py keeps the events without weights as entries whose has_weight is false
+    std::unique_ptr<TTreeReaderValue<bool>> has_weight;
+    if (existing.GetBranch("has_weight") != nullptr)
+        has_weight = std::make_unique<TTreeReaderValue<bool>>(treeReader, "has_weight");
+    while (treeReader.Next()) {
+        if (!has_weight || **has_weight)
+            keys.emplace(*run_number, *event_number);
+    }
+
+    if (treeReader.GetEntryStatus() == TTreeReader::kEntryBadReader) {
+        std::cerr << "\n# ERROR: the --existing weights have no 64 bit run_number and event_number branches."
+        << " Recompute them from a current preprocessing output.\n" << std::endl;
+        exit(EXIT_FAILURE);
+    }
+    return keys;
+}
+
+/*
+ * Prints the number of events with computed weights every 5% of the events.
+ */
+class Progress {
+public:
+    Progress(Long64_t counter, Long64_t totalNEvents)
+        : counter(counter), totalNEvents(totalNEvents), fractionOfEvents(std::max<Long64_t>(totalNEvents / 20, 1)) {}
+
+    void add() {
+        Long64_t current = ++counter;
+        if (current % fractionOfEvents == 0)
+            print(current);
+    }
+
+    void print() { print(counter); }
+
+private:
+    void print(Long64_t current) {
+        std::lock_guard<std::mutex> lock(printMutex);
+        std::cout << "calculated weights for " << current << " events (" << std::round(current*100./totalNEvents)
+        << "% of " << totalNEvents << " events)\n";
+    }
+
+    std::atomic<Long64_t> counter;
+    const Long64_t totalNEvents;
+    const Long64_t fractionOfEvents;
+    std::mutex printMutex;
+};
+
+/*
+ * Compute the weights of the entries handed out by the queue with one MoMEMta
+ * instance, reading the particles of the Hypothesis with a TTreeReader of its
+ * own. The weight of entries[i] is stored in results[i], so the results are in
+ * entry order whichever thread computed them.
+ */
+template <typename Hypothesis>
+void computeWeights(const std::string& inputPath, const std::string& chainName, MoMEMta& weight,
+                    EntryQueue& queue, const std::vector<Long64_t>& entries, std::vector<EventWeight>& results,
+                    Progress& progress, std::atomic<bool>& failed) {
+
+    // Load events from input file, retrieve reconstructed particles and MET
+    TChain chain(chainName.c_str());
+    // Path needs to be findable inside of Docker container
+    chain.Add(inputPath.c_str());
+    TTreeReader treeReader(&chain);
+    Hypothesis hypothesis(treeReader);
+
+    Long64_t index;
+    while (!failed && (index = queue.next()) >= 0) {
+        Long64_t entry = entries.at(index);
+        if (treeReader.SetEntry(entry) != TTreeReader::kEntryValid) {
+            std::cerr << "\n# ERROR: could not read entry " << entry << " of " << inputPath << "\n" << std::endl;
+            failed = true;
+            return;
+        }
+
+        std::vector<momemta::Particle> particles = hypothesis.particles();
+
+        auto start_time = std::chrono::system_clock::now();
+        // Compute the weights!
+        // MoMEMta::computeWeights({vector of particles}, met)
+        // The MET is an optional argument (defaults to a null vector)
+        std::vector<std::pair<double, double>> weights = weight.computeWeights(particles);
+        auto end_time = std::chrono::system_clock::now();
+
+        // Retrieve the weight and uncertainty
+        EventWeight& result = results.at(index);
+        result.weight = weights.back().first;
+        result.weight_err = weights.back().second;
+        result.time = std::chrono::duration_cast<std::chrono::milliseconds>(end_time - start_time).count();
+
+        LOG(debug) << "Event " << entry << " result: " << result.weight << " +- " << result.weight_err;
+        LOG(info) << "Weight computed in " << result.time << "ms";
+
+        progress.add();
+    }
+}
+
+/*
+ * Read the first and last entries of a step from a ranges file, as written by
+ * momemta/plan_steps.py, with a "first last" line per step and # comments.
+ * Returns false if the file has no such step.
+ */
+inline bool readRange(const std::string& rangesPath, int stepNumber, Long64_t& first, Long64_t& last) {
+    std::ifstream rangesFile(rangesPath);
+    std::string line;
+    int step = 0;
+    while (std::getline(rangesFile, line)) {
+        if (line.empty() || line[0] == '#')
+            continue;
+        if (step++ == stepNumber) {
+            std::istringstream(line) >> first >> last;
+            return true;
+        }
+    }
+    return false;
+}
+
+/*
+ * Load an input sample of events, compute the weights of the events in the
+ * hypothesis with MoMEMta and save them in the momemta tree of the output file.
+ */
+template <typename Hypothesis>
+int runDriver(int argc, char** argv) {
+
+    std::string inputPath;  // required input
+    std::string outputPath;  // required input
+    std::string configPath {"drell-yan_example.lua"};  // default value
+    std::string chainName {"event_selection/hftree"};  // default value
+    int totalSteps {0};  // default value
+    int stepNumber {0};  // default value
+    int numberOfThreads {1};  // default value
+    Long64_t firstEntryNumber {-1};  // default value, from the first entry
+    Long64_t lastEntryNumber {-1};  // default value, to the last entry
+    std::string rangesPath;  // default value, no ranges file
+    std::vector<std::string> existingPaths;  // default value, compute all weights
+    std::vector <std::string> unusedCLIArguments;
+
+    for (int idx = 1; idx < argc; ++idx) {
+        // --input
+        if (std::string(argv[idx]) == "--input") {
+            if (idx + 1 < argc) { // Make sure not at the end of argv
+                inputPath = argv[++idx]; // value is argv entry after flag
+            } else {
+                std::cerr << "--input option requires one argument." << std::endl;
+                return 1;
+            }
+        }
+        // --output
+        else if (std::string(argv[idx]) == "--output") {
+            if (idx + 1 < argc) {
+                outputPath = argv[++idx];
+            } else {
+                std::cerr << "--output option requires one argument." << std::endl;
+                return 1;
+            }
+        }
+        // --chain
+        else if (std::string(argv[idx]) == "--chain") {
+            if (idx + 1 < argc) {
+                chainName = argv[++idx];
+            }
+        }
+        // --luaconfig
+        else if (std::string(argv[idx]) == "--luaconfig") {
+            if (idx + 1 < argc) {
+                configPath = argv[++idx];
+            }
+        }
+        // --nsteps
+        else if (std::string(argv[idx]) == "--nsteps") {
+            if (idx + 1 < argc) {
+                totalSteps = std::stoi(argv[++idx]);
+            }
+        }
+        // --step
+        else if (std::string(argv[idx]) == "--step") {
+            if (idx + 1 < argc) {
+                stepNumber = std::stoi(argv[++idx]);
+            }
+        }
+        // --threads
+        else if (std::string(argv[idx]) == "--threads") {
+            if (idx + 1 < argc) {
+                numberOfThreads = std::stoi(argv[++idx]);
+            }
+        }
+        // --first
+        else if (std::string(argv[idx]) == "--first") {
+            if (idx + 1 < argc) {
+                firstEntryNumber = std::stoll(argv[++idx]);
+            }
+        }
+        // --last
+        else if (std::string(argv[idx]) == "--last") {
+            if (idx + 1 < argc) {
+                lastEntryNumber = std::stoll(argv[++idx]);
+            }
+        }
+        // --ranges
+        else if (std::string(argv[idx]) == "--ranges") {
+            if (idx + 1 < argc) {
+                rangesPath = argv[++idx];
+            }
+        }
+        // --existing, can be given more than once
+        else if (std::string(argv[idx]) == "--existing") {
+            if (idx + 1 < argc) {
+                existingPaths.push_back(argv[++idx]);
+            }
+        }
+        else {
+            unusedCLIArguments.push_back(argv[idx]);
+        }
+    }
+
+    if (totalSteps > 0 && (stepNumber == totalSteps)) {
+        std::cerr << "\n# ERROR: CLI arguments --nsteps and --step are the same: "
+        << "--nsteps " << totalSteps << " --step " << stepNumber << "\n"
+        << "This would result in an error so exiting now.\n" << std::endl;
+        exit(EXIT_FAILURE);
+    }
+
+    // --threads 0 uses all cores
+    if (numberOfThreads < 1)
+        numberOfThreads = std::max(std::thread::hardware_concurrency(), 1u);
+
+    TChain chain(chainName.c_str());
+    // Path needs to be findable inside of Docker container
+    chain.Add(inputPath.c_str());
+    int totalNEvents = chain.GetEntries();
+
+    Long64_t firstEntry = 0;
+    Long64_t endEntry = totalNEvents;
+
+    // The entries of --step in the ranges file
+    if (!rangesPath.empty() && !readRange(rangesPath, stepNumber, firstEntryNumber, lastEntryNumber)) {
+        std::cerr << "\n# ERROR: the ranges file " << rangesPath << " has no step " << stepNumber << "\n" << std::endl;
+        exit(EXIT_FAILURE);
+    }
+
+    if (firstEntryNumber >= 0 || lastEntryNumber >= 0) {
+        // --last is inclusive like the printed event ranges
+        firstEntry = std::max<Long64_t>(firstEntryNumber, 0);
+        endEntry = lastEntryNumber >= 0 ? std::min<Long64_t>(lastEntryNumber + 1, totalNEvents) : totalNEvents;
+        if (firstEntry >= endEntry) {
+            std::cerr << "\n# ERROR: no entries between --first " << firstEntryNumber << " and --last "
+            << lastEntryNumber << " of the " << totalNEvents << " events\n" << std::endl;
+            exit(EXIT_FAILURE);
+        }
+
+        std::cout << "\n# calculating weights for event range: ("
+        << firstEntry << ", " << endEntry-1 << ")\n" << std::endl;
+    }
+    else if (totalSteps > 0) {
+        std::vector<int> steps {};
+        int stepSize {
+            static_cast<int>( std::round(totalNEvents/static_cast<float>(totalSteps)) )
+        };
+
+        for (int n = 0; n < totalSteps; ++n)
+            steps.push_back(n*stepSize);
+        // push_back outside of the loop instead of using `n <= totalSteps` as
+        // there will probably be a non-integer unrounded step size, so make
+        // the last step big enough to get the remainder
+        steps.push_back(totalNEvents);
+
+        std::cout << "\n# calculating weights for event range: ("
+        << steps.at(stepNumber) << ", " << steps.at(stepNumber+1)-1 << ")\n" << std::endl;
+
+        firstEntry = steps.at(stepNumber);
+        endEntry = steps.at(stepNumber+1);
+    }
+
+    for (const std::string& p4Branch : Hypothesis::p4Branches()) {
+        if (chain.GetBranch(p4Branch.c_str()) == nullptr) {
+            std::cerr << "\n# ERROR: " << inputPath << " has no " << p4Branch << " branch."
+            << " Rerun the preprocessing to add it.\n" << std::endl;
+            exit(EXIT_FAILURE);
+        }
+    }
+
+    // The entries of the range still to compute, skipping the events that have
+    // weights in the --existing files, with the run and event numbers of each
+    bool hasKeys = chain.GetBranch("run_number") != nullptr && chain.GetBranch("event_number") != nullptr;
+    if (!existingPaths.empty() && !hasKeys) {
+        std::cerr << "\n# ERROR: " << inputPath << " has no run_number and event_number branches to find the"
+        << " events with --existing weights. Rerun the preprocessing to add them.\n" << std::endl;
+        exit(EXIT_FAILURE);
+    }
+    std::set<EventKey> existingKeys = readExistingKeys(existingPaths);
+
+    std::vector<Long64_t> entries;
+    std::vector<EventWeight> results;
+    if (hasKeys) {
+        TTreeReader keyReader(&chain);
+        TTreeReaderValue<Long64_t> run_number(keyReader, "run_number");
+        TTreeReaderValue<int> event_number(keyReader, "event_number");
+        keyReader.SetEntriesRange(firstEntry, endEntry);
+        // Weights are matched to events by their keys, so they must be unique
+        std::set<EventKey> inputKeys;
+        while (keyReader.Next()) {
+            if (!inputKeys.emplace(*run_number, *event_number).second) {
+                std::cerr << "\n# ERROR: " << inputPath << " has more than one event with run " << *run_number
+                << " and event " << *event_number << ". Preprocess every Delphes file only once.\n" << std::endl;
+                exit(EXIT_FAILURE);
+            }
+            if (existingKeys.count({*run_number, *event_number}) > 0)
+                continue;
+            entries.push_back(keyReader.GetCurrentEntry());
+            results.push_back({0, 0, 0, *run_number, *event_number});
+        }
+        if (keyReader.GetEntryStatus() == TTreeReader::kEntryBadReader) {
+            std::cerr << "\n# ERROR: " << inputPath << " has no 64 bit run_number branch."
+            << " Rerun the preprocessing to add it.\n" << std::endl;
+            exit(EXIT_FAILURE);
+        }
+    }
+    else {
+        for (Long64_t entry = firstEntry; entry < endEntry; ++entry)
+            entries.push_back(entry);
+        results.resize(entries.size());
+    }
+    Long64_t skippedEntries = endEntry - firstEntry - static_cast<Long64_t>(entries.size());
+    if (!existingPaths.empty()) {
+        std::cout << "\n# skipping " << skippedEntries << " events with existing weights\n" << std::endl;
+    }
+
+    // No more threads than events
+    numberOfThreads = static_cast<int>(std::max<Long64_t>(std::min<Long64_t>(numberOfThreads, entries.size()), 1));
+    if (numberOfThreads > 1) {
+        // The threads each read the input with their own TChain
+        ROOT::EnableThreadSafety();
+    }
+
+    // Define output TTree, which will contain the weights we're computing (including uncertainty and computation time)
+    std::unique_ptr<TTree> out_tree = std::make_unique<TTree>("momemta", "momemta");
+    double weight_DY, weight_DY_err, weight_DY_time;
+    out_tree->Branch("weight_DY", &weight_DY);
+    out_tree->Branch("weight_DY_err", &weight_DY_err);
+    out_tree->Branch("weight_DY_time", &weight_DY_time);
+    // The run and event numbers of the preprocessing output to match the weights to the events
+    Long64_t run_number;
+    int event_number;
+    if (hasKeys) {
+        out_tree->Branch("run_number", &run_number);
+        out_tree->Branch("event_number", &event_number);
+    }
+
+    // Prepare MoMEMta to compute the weights
+
+    // logging::set_level(logging::level::debug);
+    logging::set_level(logging::level::error);
+
+    // Construct the ConfigurationReader from the Lua file
+    ConfigurationReader configuration(configPath);
+
+    std::cout << "\n# Loaded MoMEMta Lua configuration\n" << std::endl;
+
+    auto frozenConfiguration = configuration.freeze();
+
+    // Instantiate MoMEMta using a **frozen** configuration, one instance per
+    // thread as an instance integrates one event at a time. The instances are
+    // created up front as loading the matrix element and PDFs is not thread safe.
+    std::vector<std::unique_ptr<MoMEMta>> instances;
+    for (int n = 0; n < numberOfThreads; ++n)
+        instances.push_back(std::make_unique<MoMEMta>(frozenConfiguration));
+
+    std::cout << "\n# calculating weights with " << numberOfThreads << " threads\n" << std::endl;
+
+    EntryQueue queue(entries.size());
+    Progress progress(firstEntry + skippedEntries, totalNEvents);
+    std::atomic<bool> failed {false};
+
+    std::vector<std::thread> threads;
+    for (auto& instance : instances) {
+        threads.emplace_back(computeWeights<Hypothesis>, std::cref(inputPath), std::cref(chainName), std::ref(*instance),
+                             std::ref(queue), std::cref(entries), std::ref(results), std::ref(progress), std::ref(failed));
+    }
+    for (auto& thread : threads)
+        thread.join();
+
+    if (failed)
+        exit(EXIT_FAILURE);
+    progress.print();
+
+    // Fill the output in entry order
+    for (const EventWeight& result : results) {
+        weight_DY = result.weight;
+        weight_DY_err = result.weight_err;
+        weight_DY_time = result.time;
+        run_number = result.run_number;
+        event_number = result.event_number;
+        out_tree->Fill();
+    }
+
+    // Save output to TTree
+    out_tree->SaveAs(outputPath.c_str());
+
+    return 0;
+}
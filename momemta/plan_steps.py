@@ -0,0 +1,213 @@
+# Plan the entry ranges of the steps of a MoMEMta driver so that every step
+# takes about the same time, from the weight_DY_time of an earlier run or of a
+# quick sampling pass, instead of giving every step the same number of events
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+
+import numpy as np
+import uproot
+from combine_weights import event_keys, key_branches
+
+
+def read_times(path):
+    with uproot.open(path) as weights_file:
+        return weights_file["momemta"]["weight_DY_time"].array(library="np")
+
+
+def read_timings(timings_path, input_path, chain, n_entries):
+    """
+    Times of the entries of the input measured in an earlier run, and NaN for
+    the entries without. The times are matched to the entries by run and event
+    number if both files have them, and by position otherwise.
+    """
+    times = np.full(n_entries, np.nan)
+    with uproot.open(timings_path) as weights_file, uproot.open(
+        input_path
+    ) as input_file:
+        weights = weights_file["momemta"]
+        events = input_file[chain]
+        has_keys = set(key_branches) <= set(weights.keys()) & set(events.keys())
+        if not has_keys:
+            measured_times = weights["weight_DY_time"].array(library="np")[:n_entries]
+            times[: len(measured_times)] = measured_times
+            return times
+
+        weight_arrays = weights.arrays(key_branches + ["weight_DY_time"], library="np")
+        event_arrays = events.arrays(key_branches, library="np")
+
+    keys = event_keys(weight_arrays["run_number"], weight_arrays["event_number"])
+    order = np.argsort(keys)
+    input_keys = event_keys(event_arrays["run_number"], event_arrays["event_number"])
+    positions = np.minimum(np.searchsorted(keys[order], input_keys), len(keys) - 1)
+    if len(keys) > 0:
+        found = keys[order][positions] == input_keys
+        times[found] = weight_arrays["weight_DY_time"][order][positions[found]]
+    return times
+
+
+def count_entries(input_path, chain):
+    with uproot.open(input_path) as input_file:
+        return input_file[chain].num_entries
+
+
+def sample_times(command, n_entries, windows, window_size):
+    """
+    Times of windows of window_size entries spread evenly over the input,
+    computed with the driver, and NaN for the entries outside of the windows.
+    """
+    times = np.full(n_entries, np.nan)
+    starts = np.linspace(0, max(n_entries - window_size, 0), windows).astype(np.int64)
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for idx, first in enumerate(np.unique(starts)):
+            last = min(first + window_size, n_entries) - 1
+            output = os.path.join(tmp_dir, f"sample_{idx}.root")
+            print(f"Sampling entries {first} to {last}")
+            sys.stdout.flush()
+            subprocess.run(
+                command
+                + ["--output", output, "--first", str(first), "--last", str(last)],
+                stdout=subprocess.DEVNULL,
+                check=True,
+            )
+            times[first : last + 1] = read_times(output)
+    return times
+
+
+def estimate_costs(times, max_block=1000):
+    """
+    Cost of every entry: the measured time if there is one, and otherwise
+    interpolated between the mean times of blocks of measured entries. The
+    inputs are concatenations of samples, so the cost depends on the position.
+    """
+    measured = np.flatnonzero(~np.isnan(times))
+    if len(measured) == 0:
+        print("\nERROR: There are no measured times to plan the steps from.\n")
+        sys.exit(1)
+
+    # contiguous runs of measured entries, split into blocks of up to max_block
+    runs = np.split(measured, np.flatnonzero(np.diff(measured) > 1) + 1)
+    blocks = [
+        block
+        for run in runs
+        for block in np.array_split(run, -(-len(run) // max_block))
+    ]
+    centers = [block.mean() for block in blocks]
+    means = [times[block].mean() for block in blocks]
+
+    costs = times.copy()
+    unknown = np.flatnonzero(np.isnan(costs))
+    costs[unknown] = np.interp(unknown, centers, means)
+    return costs
+
+
+def balanced_ranges(costs, nsteps):
+    """
+    Split the entries into nsteps contiguous, non-empty (first, last) ranges
+    of about equal total cost.
+    """
+    n_entries = len(costs)
+    if nsteps > n_entries:
+        print(f"\nERROR: Can't split {n_entries} entries into {nsteps} steps.\n")
+        sys.exit(1)
+
+    # an entry starts the next step once the middle of its cost is past the target
+    cumulative = np.cumsum(costs) - costs / 2
+    targets = cumulative[-1] * np.arange(1, nsteps) / nsteps
+    bounds = [0, *np.searchsorted(cumulative, targets), n_entries]
+    for step in range(1, nsteps):
+        bounds[step] = min(
+            max(bounds[step], bounds[step - 1] + 1), n_entries - (nsteps - step)
+        )
+    return [(bounds[step], bounds[step + 1] - 1) for step in range(nsteps)]
+
+
+def equal_ranges(n_entries, nsteps):
+    """
+    The ranges of the --nsteps split of the drivers.
+    """
+    step_size = round(n_entries / nsteps)
+    bounds = [step * step_size for step in range(nsteps)] + [n_entries]
+    return [(bounds[step], bounds[step + 1] - 1) for step in range(nsteps)]
+
+
+def step_costs(costs, ranges):
+    return np.array([costs[first : last + 1].sum() for first, last in ranges])
+
+
+def write_ranges(path, ranges, costs):
+    with open(path, "w") as ranges_file:
+        ranges_file.write("# first last predicted_seconds\n")
+        for (first, last), cost in zip(ranges, costs):
+            ranges_file.write(f"{first} {last} {cost / 1000:.1f}\n")
+
+
+def main(args, driver_args):
+    n_entries = count_entries(args.input, args.chain)
+    times = np.full(n_entries, np.nan)
+    if args.timings:
+        times = read_timings(args.timings, args.input, args.chain, n_entries)
+    if args.sample_windows > 0:
+        command = [args.executable, "--input", args.input, "--chain", args.chain]
+        command += ["--threads", "0", *driver_args]
+        sampled = sample_times(
+            command, n_entries, args.sample_windows, args.sample_size
+        )
+        times = np.where(np.isnan(times), sampled, times)
+
+    costs = estimate_costs(times)
+    ranges = balanced_ranges(costs, args.nsteps)
+    planned = step_costs(costs, ranges)
+    equal = step_costs(costs, equal_ranges(n_entries, args.nsteps))
+    write_ranges(args.output, ranges, planned)
+
+    print(f"Wrote the ranges of {args.nsteps} steps to {args.output}")
+    print(
+        f"Predicted longest step: {planned.max() / 1000:.0f} s "
+        + f"(equal steps: {equal.max() / 1000:.0f} s, mean: {planned.mean() / 1000:.0f} s)"
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Options not listed here, like --luaconfig, are passed on to the driver of the sampling pass"
+    )
+    parser.add_argument("--input", action="store", required=True)
+    parser.add_argument("--chain", action="store", default="event_selection/hftree")
+    parser.add_argument("--nsteps", action="store", type=int, required=True)
+    parser.add_argument("--output", action="store", default="ranges.txt")
+    parser.add_argument(
+        "--timings",
+        action="store",
+        default=None,
+        help="momemta_weights.root of an earlier run over the input",
+    )
+    parser.add_argument(
+        "--executable",
+        action="store",
+        default=None,
+        help="MoMEMta driver of the sampling pass, e.g. ./build/drell-yan_example",
+    )
+    parser.add_argument(
+        "--sample-windows",
+        action="store",
+        type=int,
+        default=0,
+        help="Number of windows of entries spread over the input to time with the driver",
+    )
+    parser.add_argument(
+        "--sample-size",
+        action="store",
+        type=int,
+        default=10,
+        help="Number of entries per sampling window",
+    )
+    args, driver_args = parser.parse_known_args()
+    if args.sample_windows > 0 and not args.executable:
+        parser.error("--sample-windows requires --executable")
+    if not args.timings and args.sample_windows <= 0:
+        parser.error("plan from --timings of an earlier run or --sample-windows")
+
+    main(args, driver_args)
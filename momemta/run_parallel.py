@@ -0,0 +1,158 @@
+# Run the steps of a MoMEMta driver as parallel processes on the local cores and
+# merge their outputs in step order into a single momemta_weights.root
+import argparse
+import os
+import shutil
+import subprocess
+import sys
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+
+def step_output(steps_dir, step):
+    return os.path.join(steps_dir, f"step_{step:04d}.root")
+
+
+def count_ranges(path):
+    with open(path) as ranges_file:
+        return sum(1 for line in ranges_file if line.strip() and line[0] != "#")
+
+
+def run_step(command, steps_dir, step, step_args, threads):
+    """
+    Run a step of the driver, returning its exit code. The output of the step
+    is only moved in place once the step succeeded, so a later launch reruns
+    the failed steps only.
+    """
+    output = step_output(steps_dir, step)
+    if os.path.exists(output):
+        return 0
+    # TTree::SaveAs picks the format from the extension
+    partial_output = f"{os.path.splitext(output)[0]}.part.root"
+    command = command + step_args
+    command += [
+        "--output",
+        partial_output,
+        "--step",
+        str(step),
+        "--threads",
+        str(threads),
+    ]
+    with open(os.path.join(steps_dir, f"step_{step:04d}.log"), "w") as log:
+        returncode = subprocess.run(
+            command, stdout=log, stderr=subprocess.STDOUT
+        ).returncode
+    if returncode == 0:
+        os.replace(partial_output, output)
+    return returncode
+
+
+def merge_steps(steps_dir, nsteps, output, input_path, existing=None):
+    """
+    Merge the step outputs into the output, together with the existing weights
+    if the steps only computed the events missing from them.
+    """
+    step_outputs = [step_output(steps_dir, step) for step in range(nsteps)]
+    if existing is None:
+        subprocess.run(["hadd", "-f", output, *step_outputs], check=True)
+        return
+    combine_weights = os.path.join(os.path.dirname(__file__), "combine_weights.py")
+    subprocess.run(
+        [sys.executable, combine_weights, "--input", input_path, "--output", output]
+        + [existing, *step_outputs],
+        check=True,
+    )
+
+
+def main(args, driver_args):
+    steps_dir = f"{args.output}.steps"
+    os.makedirs(steps_dir, exist_ok=True)
+    command = [args.executable, "--input", args.input, *driver_args]
+    if args.existing:
+        command += ["--existing", args.existing]
+    if args.ranges:
+        step_args = ["--ranges", args.ranges]
+    else:
+        step_args = ["--nsteps", str(args.nsteps)]
+
+    print(
+        f"# Running {args.nsteps} steps with {args.jobs} processes of {args.threads} threads"
+    )
+    sys.stdout.flush()
+    failed = []
+    with ThreadPoolExecutor(max_workers=args.jobs) as executor:
+        futures = {
+            executor.submit(
+                run_step, command, steps_dir, step, step_args, args.threads
+            ): step
+            for step in range(args.nsteps)
+        }
+        for future in as_completed(futures):
+            step = futures[future]
+            if future.result() != 0:
+                failed.append(step)
+                print(f"Step {step} failed, see {steps_dir}/step_{step:04d}.log")
+            else:
+                print(f"Step {step} done")
+            sys.stdout.flush()
+
+    if failed:
+        print(f"\nERROR: {len(failed)} of {args.nsteps} steps failed.")
+        print("       Rerun the same command to run only the failed steps.\n")
+        sys.exit(1)
+
+    merge_steps(steps_dir, args.nsteps, args.output, args.input, args.existing)
+    shutil.rmtree(steps_dir)
+    print(f"Merged the weights of {args.nsteps} steps into {args.output}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Options not listed here, like --luaconfig and --chain, are passed on to the driver"
+    )
+    parser.add_argument(
+        "executable", help="MoMEMta driver, e.g. ./build/drell-yan_example"
+    )
+    parser.add_argument("--input", action="store", required=True)
+    parser.add_argument("--output", action="store", default="momemta_weights.root")
+    parser.add_argument(
+        "--jobs",
+        action="store",
+        type=int,
+        default=1,
+        help="Number of driver processes to run at once",
+    )
+    parser.add_argument(
+        "--threads",
+        action="store",
+        type=int,
+        default=None,
+        help="Number of threads of each driver process, by default the cores are shared between the processes",
+    )
+    parser.add_argument(
+        "--nsteps",
+        action="store",
+        type=int,
+        default=None,
+        help="Number of steps to split the events into, by default one per process",
+    )
+    parser.add_argument(
+        "--ranges",
+        action="store",
+        default=None,
+        help="Ranges file of plan_steps.py with the entries of each step, instead of --nsteps steps of equal size",
+    )
+    parser.add_argument(
+        "--existing",
+        action="store",
+        default=None,
+        help="Weights of an earlier run, whose events are skipped and which are combined with the new weights",
+    )
+    args, driver_args = parser.parse_known_args()
+    if args.threads is None:
+        args.threads = max(os.cpu_count() // args.jobs, 1)
+    if args.ranges:
+        args.nsteps = count_ranges(args.ranges)
+    elif args.nsteps is None:
+        args.nsteps = args.jobs
+
+    main(args, driver_args)
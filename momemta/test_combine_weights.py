@@ -0,0 +1,145 @@
+import numpy as np
+import pytest
+import uproot
+from combine_weights import combine, duplicate_keys, event_keys, main, read_weights
+
+# run numbers are 63 bit hashes of the file UUIDs
+RUN_A = 2**62 + 5
+RUN_B = 7
+
+
+def weights_of(runs, events, weights):
+    return {
+        "run_number": np.array(runs, dtype=np.int64),
+        "event_number": np.array(events, dtype=np.int32),
+        "weight_DY": np.array(weights, dtype=np.float64),
+    }
+
+
+def test_event_keys_keep_all_run_number_bits():
+    keys = event_keys([RUN_A, RUN_A - 2**32], [1, 1])
+    assert keys[0] != keys[1]
+
+
+def test_combine_orders_weights_like_the_input():
+    input_keys = event_keys([RUN_B, RUN_A, RUN_A], [3, 1, 2])
+    weights = weights_of([RUN_A, RUN_A, RUN_B], [1, 2, 3], [0.1, 0.2, 0.3])
+
+    combined, n_missing = combine(input_keys, weights)
+
+    assert n_missing == 0
+    assert combined["weight_DY"].tolist() == [0.3, 0.1, 0.2]
+    assert combined["run_number"].tolist() == [RUN_B, RUN_A, RUN_A]
+    assert combined["has_weight"].all()
+
+
+def test_combine_matches_run_and_event_number():
+    # same event number in another run
+    input_keys = event_keys([RUN_A], [1])
+    combined, n_missing = combine(input_keys, weights_of([RUN_B], [1], [0.5]))
+    assert n_missing == 1
+    assert not combined["has_weight"][0]
+
+
+def test_combine_takes_the_first_weights_of_an_event():
+    input_keys = event_keys([RUN_A], [1])
+    weights = weights_of([RUN_A, RUN_A], [1, 1], [0.1, 0.9])
+    combined, _ = combine(input_keys, weights)
+    assert combined["weight_DY"].tolist() == [0.1]
+
+
+def test_combine_keeps_events_without_weights_in_place():
+    input_keys = event_keys([RUN_A, RUN_A, RUN_A], [1, 2, 3])
+    weights = weights_of([RUN_A, RUN_A], [3, 1], [0.3, 0.1])
+
+    combined, n_missing = combine(input_keys, weights)
+
+    assert n_missing == 1
+    assert len(combined["weight_DY"]) == len(input_keys)
+    assert combined["has_weight"].tolist() == [True, False, True]
+    assert combined["event_number"].tolist() == [1, 2, 3]
+    assert combined["weight_DY"][[0, 2]].tolist() == [0.1, 0.3]
+    assert np.isnan(combined["weight_DY"][1])
+
+
+def test_combine_without_any_weights():
+    input_keys = event_keys([RUN_A, RUN_A], [1, 2])
+    combined, n_missing = combine(input_keys, weights_of([], [], []))
+    assert n_missing == 2
+    assert not combined["has_weight"].any()
+
+
+def test_combine_ignores_placeholders_of_earlier_combined_files():
+    input_keys = event_keys([RUN_A, RUN_A], [1, 2])
+    earlier, _ = combine(input_keys, weights_of([RUN_A], [1], [0.1]))
+    new = dict(weights_of([RUN_A], [2], [0.2]), has_weight=np.ones(1, dtype=bool))
+    weights = {name: np.concatenate([earlier[name], new[name]]) for name in earlier}
+
+    combined, n_missing = combine(input_keys, weights)
+
+    assert n_missing == 0
+    assert combined["weight_DY"].tolist() == [0.1, 0.2]
+
+
+def test_duplicate_keys():
+    keys = event_keys([RUN_A, RUN_A, RUN_B, RUN_A], [1, 2, 1, 1])
+    assert duplicate_keys(keys).tolist() == [(RUN_A, 1)]
+    assert len(duplicate_keys(event_keys([RUN_A, RUN_B], [1, 1]))) == 0
+
+
+def write_tree(path, name, branches):
+    with uproot.recreate(path) as root_file:
+        root_file[name] = branches
+
+
+def test_read_weights_flags_driver_outputs(tmp_path):
+    path = str(tmp_path.joinpath("weights.root"))
+    write_tree(path, "momemta", weights_of([RUN_A], [1], [0.1]))
+    weights = read_weights([path])
+    assert weights["has_weight"].tolist() == [True]
+
+
+class Args:
+    chain = "event_selection/hftree"
+
+
+def test_main_refuses_duplicate_events(tmp_path):
+    args = Args()
+    args.input = str(tmp_path.joinpath("preprocessing.root"))
+    args.weights = [str(tmp_path.joinpath("weights.root"))]
+    args.output = str(tmp_path.joinpath("combined.root"))
+    write_tree(
+        args.input,
+        args.chain,
+        {
+            "run_number": np.array([RUN_A, RUN_A], dtype=np.int64),
+            "event_number": np.array([1, 1], dtype=np.int32),
+        },
+    )
+    write_tree(args.weights[0], "momemta", weights_of([RUN_A], [1], [0.1]))
+
+    with pytest.raises(SystemExit):
+        main(args)
+
+
+def test_main_writes_an_entry_per_event(tmp_path):
+    args = Args()
+    args.input = str(tmp_path.joinpath("preprocessing.root"))
+    args.weights = [str(tmp_path.joinpath("weights.root"))]
+    args.output = str(tmp_path.joinpath("combined.root"))
+    write_tree(
+        args.input,
+        args.chain,
+        {
+            "run_number": np.array([RUN_A, RUN_B], dtype=np.int64),
+            "event_number": np.array([1, 1], dtype=np.int32),
+        },
+    )
+    write_tree(args.weights[0], "momemta", weights_of([RUN_B], [1], [0.5]))
+
+    main(args)
+
+    with uproot.open(args.output) as combined_file:
+        combined = combined_file["momemta"].arrays(library="np")
+    assert combined["has_weight"].tolist() == [False, True]
+    assert combined["weight_DY"][1] == 0.5
@@ -0,0 +1,70 @@
+import numpy as np
+import pytest
+import uproot
+from plan_steps import (
+    balanced_ranges,
+    equal_ranges,
+    estimate_costs,
+    read_timings,
+    step_costs,
+)
+
+
+def test_estimate_costs_keeps_measured_times():
+    times = np.array([1.0, np.nan, 3.0, np.nan])
+    costs = estimate_costs(times, max_block=1)
+    assert costs.tolist() == [1.0, 2.0, 3.0, 3.0]
+
+
+def test_estimate_costs_without_measurements():
+    with pytest.raises(SystemExit):
+        estimate_costs(np.full(3, np.nan))
+
+
+def test_balanced_ranges_cover_all_entries():
+    costs = np.array([1.0] * 90 + [10.0] * 10)
+    ranges = balanced_ranges(costs, 4)
+    assert ranges[0][0] == 0
+    assert ranges[-1][1] == len(costs) - 1
+    for (_, last), (first, _) in zip(ranges, ranges[1:]):
+        assert first == last + 1
+    # the expensive entries at the end get steps of their own
+    planned = step_costs(costs, ranges)
+    assert planned.max() < step_costs(costs, equal_ranges(len(costs), 4)).max()
+
+
+def test_balanced_ranges_are_not_empty():
+    costs = np.array([100.0, 1.0, 1.0])
+    assert balanced_ranges(costs, 3) == [(0, 0), (1, 1), (2, 2)]
+
+
+def test_balanced_ranges_of_too_few_entries():
+    with pytest.raises(SystemExit):
+        balanced_ranges(np.ones(2), 3)
+
+
+def test_equal_ranges():
+    assert equal_ranges(10, 3) == [(0, 2), (3, 5), (6, 9)]
+
+
+def test_read_timings_matches_events_by_key(tmp_path):
+    timings_path = str(tmp_path.joinpath("weights.root"))
+    input_path = str(tmp_path.joinpath("preprocessing.root"))
+    run = 2**62 + 1
+    with uproot.recreate(timings_path) as weights_file:
+        weights_file["momemta"] = {
+            "run_number": np.array([run, run], dtype=np.int64),
+            "event_number": np.array([3, 1], dtype=np.int32),
+            "weight_DY_time": np.array([30.0, 10.0]),
+        }
+    with uproot.recreate(input_path) as input_file:
+        input_file["event_selection/hftree"] = {
+            "run_number": np.array([run, run, run], dtype=np.int64),
+            "event_number": np.array([1, 2, 3], dtype=np.int32),
+        }
+
+    times = read_timings(timings_path, input_path, "event_selection/hftree", 3)
+
+    assert times[0] == 10.0
+    assert np.isnan(times[1])
+    assert times[2] == 30.0
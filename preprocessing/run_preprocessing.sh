@@ -8,10 +8,14 @@ INPUT_PATH="${1:-delphes_output.root}"
 OUTPUT_PATH=${2:-preprocessing_output.root}
 # Lumi is currently set to a default value and should be updated to something
 # more relevant
+# Checkpoints are written every 10 minutes so that a job stopped by the walltime
+# limit continues where it left off when it is resubmitted
 python scripts/SimpleAna.py \
     --input "${INPUT_PATH}" \
     --output "${OUTPUT_PATH}" \
     --lumi 1000.0 \
-    --XS 0
+    --XS 0 \
+    --checkpoint-interval 600 \
+    --resume
 
 unset ROOT_INCLUDE_PATH
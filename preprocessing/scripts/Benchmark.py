@@ -0,0 +1,402 @@
+# Throughput benchmarks of the preprocessing on synthetic Delphes files, timing
+# DelphesEvent, Hists.fill, Hists.write and whole SimpleAna.py runs separately
+# and comparing them against a stored baseline to catch regressions
+import argparse
+import importlib.util
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+import ROOT
+from DelphesBranches import prune_branches
+from HistCollections import DelphesEvent, EventCuts, Hists, run_number
+from Metrics import peak_rss_mb
+from SimpleAna import EVENT_CUTS, setup_root, used_branches
+
+# Writes a Delphes tree with the branches read by the preprocessing, with
+# Poisson distributed numbers of electrons, muons and jets per event sorted by
+# PT like the Delphes collections
+write_delphes_code = """
+#include <algorithm>
+#include <functional>
+#include <vector>
+#include "TClonesArray.h"
+#include "TFile.h"
+#include "TMath.h"
+#include "TRandom3.h"
+#include "TTree.h"
+#include "classes/DelphesClasses.h"
+
+std::vector<double> benchmark_pts(TRandom3 &random, double mean)
+{
+    std::vector<double> pts(random.Poisson(mean));
+    for (double &pt : pts)
+        pt = 10. + random.Exp(40.);
+    std::sort(pts.begin(), pts.end(), std::greater<double>());
+    return pts;
+}
+
+template <typename Lepton>
+void benchmark_fill_leptons(TClonesArray &leptons, TRandom3 &random, double mean)
+{
+    std::vector<double> pts = benchmark_pts(random, mean);
+    for (std::size_t idx = 0; idx < pts.size(); ++idx) {
+        Lepton *lepton = static_cast<Lepton *>(leptons.ConstructedAt(idx));
+        lepton->PT = pts[idx];
+        lepton->Eta = random.Uniform(-3., 3.);
+        lepton->Phi = random.Uniform(-TMath::Pi(), TMath::Pi());
+        lepton->Charge = random.Rndm() < 0.5 ? -1 : 1;
+    }
+}
+
+void benchmark_write_delphes(const char *path, Long64_t nevents, double electrons,
+                             double muons, double jets, double btag_fraction,
+                             double tautag_fraction, UInt_t seed)
+{
+    TFile file(path, "RECREATE");
+    TTree tree("Delphes", "Analysis tree");
+    TClonesArray event_array("HepMCEvent"), met_array("MissingET"),
+        electron_array("Electron"), muon_array("Muon"), jet_array("Jet");
+    TClonesArray *event_branch = &event_array, *met_branch = &met_array,
+                 *electron_branch = &electron_array, *muon_branch = &muon_array,
+                 *jet_branch = &jet_array;
+    tree.Branch("Event", &event_branch, 64000);
+    tree.Branch("MissingET", &met_branch, 64000);
+    tree.Branch("Electron", &electron_branch, 64000);
+    tree.Branch("Muon", &muon_branch, 64000);
+    tree.Branch("Jet", &jet_branch, 64000);
+
+    TRandom3 random(seed);
+    for (Long64_t entry = 0; entry < nevents; ++entry) {
+        for (TClonesArray *array : {event_branch, met_branch, electron_branch,
+                                    muon_branch, jet_branch})
+            array->Clear("C");
+
+        HepMCEvent *event = static_cast<HepMCEvent *>(event_array.ConstructedAt(0));
+        event->Number = entry + 1;
+        event->Weight = random.Uniform(0.5, 1.5);
+
+        MissingET *met = static_cast<MissingET *>(met_array.ConstructedAt(0));
+        met->MET = random.Exp(50.);
+        met->Eta = random.Uniform(-3., 3.);
+        met->Phi = random.Uniform(-TMath::Pi(), TMath::Pi());
+
+        benchmark_fill_leptons<Electron>(electron_array, random, electrons);
+        benchmark_fill_leptons<Muon>(muon_array, random, muons);
+
+        std::vector<double> pts = benchmark_pts(random, jets);
+        for (std::size_t idx = 0; idx < pts.size(); ++idx) {
+            Jet *jet = static_cast<Jet *>(jet_array.ConstructedAt(idx));
+            jet->PT = pts[idx];
+            jet->Eta = random.Uniform(-5., 5.);
+            jet->Phi = random.Uniform(-TMath::Pi(), TMath::Pi());
+            jet->Mass = random.Uniform(0., 20.);
+            jet->BTag = random.Rndm() < btag_fraction;
+            jet->TauTag = random.Rndm() < tautag_fraction;
+        }
+        tree.Fill();
+    }
+    file.Write();
+    file.Close();
+}
+"""
+
+
+def write_delphes(path, args):
+    ROOT.gInterpreter.Declare(write_delphes_code)
+    ROOT.benchmark_write_delphes(
+        path,
+        args.events,
+        args.electrons,
+        args.muons,
+        args.jets,
+        args.btag_fraction,
+        args.tautag_fraction,
+        args.seed,
+    )
+
+
+def stage(seconds, nevents):
+    return {"seconds": seconds, "events_per_second": nevents / seconds}
+
+
+def time_stages(input_path, work_dir):
+    """
+    Seconds spent reading the entries, constructing the DelphesEvents and
+    selecting their objects (DelphesEvent.select), filling the histograms and
+    the trees of the Hists of all events and of the selected events, and
+    writing the Hists, in the event loop of SimpleAna.
+    """
+    chain = ROOT.TChain("Delphes")
+    chain.Add(input_path)
+    prune_branches(chain, used_branches("loop"))
+    nevents = chain.GetEntries()
+    file_run_number = run_number(input_path)
+    cuts = EventCuts(**EVENT_CUTS)
+
+    outfile = ROOT.TFile.Open(os.path.join(work_dir, "stages.root"), "RECREATE")
+    all_events = Hists("all_events", outfile)
+    event_selection = Hists("event_selection", outfile)
+
+    read = construct = fill = 0.0
+    clock = time.perf_counter
+    for entry in range(nevents):
+        start = clock()
+        chain.GetEntry(entry)
+        read_done = clock()
+        delphes_event = DelphesEvent(
+            chain, run_number=file_run_number, cuts=cuts
+        ).select()
+        construct_done = clock()
+        all_events.fill(delphes_event, delphes_event.weight)
+        if len(delphes_event.leptons) >= 2:
+            event_selection.fill(delphes_event, delphes_event.weight)
+        fill_done = clock()
+        read += read_done - start
+        construct += construct_done - read_done
+        fill += fill_done - construct_done
+
+    start = clock()
+    all_events.flush()
+    event_selection.flush()
+    fill += clock() - start
+    tree_fill = all_events.tree_fill_seconds + event_selection.tree_fill_seconds
+
+    start = clock()
+    all_events.write()
+    event_selection.write()
+    outfile.Close()
+    write = clock() - start
+
+    return {
+        "read": stage(read, nevents),
+        "delphes_event": stage(construct, nevents),
+        "hists_fill": stage(fill - tree_fill, nevents),
+        "tree_fill": stage(tree_fill, nevents),
+        "hists_write": stage(write, nevents),
+    }
+
+
+def time_simpleana(input_path, work_dir, nevents, engine):
+    """
+    Wall time and peak memory of a SimpleAna.py run over the input.
+    """
+    command = [
+        sys.executable,
+        os.path.join(os.path.dirname(os.path.abspath(__file__)), "SimpleAna.py"),
+        "--input",
+        input_path,
+        "--output",
+        os.path.join(work_dir, f"simpleana_{engine}.root"),
+        "--engine",
+        engine,
+    ]
+    start = time.perf_counter()
+    process = subprocess.Popen(command, stdout=subprocess.DEVNULL)
+    _, status, usage = os.wait4(process.pid, 0)
+    seconds = time.perf_counter() - start
+    if not os.WIFEXITED(status) or os.WEXITSTATUS(status) != 0:
+        print(f"\nERROR: {' '.join(command)} failed.\n")
+        sys.exit(1)
+    result = stage(seconds, nevents)
+    result["peak_rss_mb"] = usage.ru_maxrss / 1024
+    return result
+
+
+def best_of(runs):
+    """
+    The fastest of the repeated runs of each stage.
+    """
+    return {
+        name: min((run[name] for run in runs), key=lambda result: result["seconds"])
+        for name in runs[0]
+    }
+
+
+def run_benchmarks(args, work_dir):
+    input_path = os.path.join(work_dir, "delphes_benchmark.root")
+    start = time.perf_counter()
+    write_delphes(input_path, args)
+    print(
+        f"Wrote {args.events} synthetic events in {time.perf_counter() - start:.1f} s"
+    )
+
+    engines = ["loop"]
+    if args.columnar:
+        engines.append("columnar")
+
+    runs = []
+    for repeat in range(args.repeat):
+        print(f"Run {repeat + 1} of {args.repeat}")
+        sys.stdout.flush()
+        stages = time_stages(input_path, work_dir)
+        for engine in engines:
+            stages[f"simpleana_{engine}"] = time_simpleana(
+                input_path, work_dir, args.events, engine
+            )
+        runs.append(stages)
+
+    return {
+        "config": {
+            "events": args.events,
+            "electrons": args.electrons,
+            "muons": args.muons,
+            "jets": args.jets,
+            "btag_fraction": args.btag_fraction,
+            "tautag_fraction": args.tautag_fraction,
+            "seed": args.seed,
+        },
+        "machine": {
+            "platform": platform.platform(),
+            "python": platform.python_version(),
+            "root": ROOT.gROOT.GetVersion(),
+            "cpu_count": os.cpu_count(),
+        },
+        "stages": best_of(runs),
+        "peak_rss_mb": peak_rss_mb(),
+    }
+
+
+def compare(results, baseline, tolerance):
+    """
+    Print the throughput of every stage against the baseline and return the
+    stages that are slower than the baseline by more than the tolerance.
+    """
+    if results["config"] != baseline["config"]:
+        print("\nERROR: The baseline was measured with other benchmark options:")
+        print(f"       {baseline['config']}\n")
+        sys.exit(1)
+
+    regressions = []
+    print(f"\n{'stage':<18} {'events/s':>12} {'baseline':>12} {'change':>8}")
+    for name, result in results["stages"].items():
+        if name not in baseline["stages"]:
+            continue
+        current = result["events_per_second"]
+        reference = baseline["stages"][name]["events_per_second"]
+        change = current / reference - 1
+        print(f"{name:<18} {current:>12.0f} {reference:>12.0f} {change:>+8.1%}")
+        if change < -tolerance:
+            regressions.append(name)
+    return regressions
+
+
+def main(args):
+    setup_root()
+    work_dir = tempfile.mkdtemp(prefix="preprocessing_benchmark_", dir=args.work_dir)
+    try:
+        results = run_benchmarks(args, work_dir)
+    finally:
+        shutil.rmtree(work_dir)
+
+    with open(args.output, "w") as output_file:
+        json.dump(results, output_file, indent=2)
+    print(f"\nWrote the results to {args.output}")
+    for name, result in results["stages"].items():
+        print(f"{name:<18} {result['events_per_second']:>12.0f} events/s")
+    print(f"Peak RSS of the stages: {results['peak_rss_mb']:.0f} MB")
+
+    if args.write_baseline:
+        with open(args.baseline, "w") as baseline_file:
+            json.dump(results, baseline_file, indent=2)
+        print(f"Wrote the baseline to {args.baseline}")
+        return
+    if args.baseline:
+        with open(args.baseline) as baseline_file:
+            baseline = json.load(baseline_file)
+        regressions = compare(results, baseline, args.tolerance)
+        if regressions:
+            print(
+                f"\nERROR: {', '.join(regressions)} slower than the baseline by more than {args.tolerance:.0%}\n"
+            )
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--events", action="store", type=int, default=20000)
+    parser.add_argument(
+        "--electrons",
+        action="store",
+        type=float,
+        default=1.5,
+        help="Mean number of electrons per event",
+    )
+    parser.add_argument(
+        "--muons",
+        action="store",
+        type=float,
+        default=1.5,
+        help="Mean number of muons per event",
+    )
+    parser.add_argument(
+        "--jets",
+        action="store",
+        type=float,
+        default=5.0,
+        help="Mean number of jets per event",
+    )
+    parser.add_argument(
+        "--btag-fraction",
+        action="store",
+        type=float,
+        default=0.2,
+        help="Fraction of the jets that are b-tagged",
+    )
+    parser.add_argument(
+        "--tautag-fraction",
+        action="store",
+        type=float,
+        default=0.05,
+        help="Fraction of the jets that are tau-tagged",
+    )
+    parser.add_argument("--seed", action="store", type=int, default=1)
+    parser.add_argument(
+        "--repeat",
+        action="store",
+        type=int,
+        default=3,
+        help="Number of runs, of which the fastest is reported for each stage",
+    )
+    parser.add_argument(
+        "--columnar",
+        action="store_true",
+        help="Also time SimpleAna.py with the columnar engine",
+    )
+    parser.add_argument("--output", action="store", default="benchmark.json")
+    parser.add_argument(
+        "--baseline",
+        action="store",
+        default=None,
+        help="Results of an earlier benchmark to compare against",
+    )
+    parser.add_argument(
+        "--write-baseline",
+        action="store_true",
+        help="Write the results to --baseline instead of comparing against it",
+    )
+    parser.add_argument(
+        "--tolerance",
+        action="store",
+        type=float,
+        default=0.1,
+        help="Fraction by which a stage can be slower than the baseline",
+    )
+    parser.add_argument(
+        "--work-dir",
+        action="store",
+        default=None,
+        help="Directory of the synthetic input and the outputs, a temporary directory by default",
+    )
+    args = parser.parse_args()
+    if args.write_baseline and not args.baseline:
+        parser.error("--write-baseline requires --baseline")
+    if args.columnar and importlib.util.find_spec("awkward") is None:
+        parser.error("--columnar requires uproot and awkward")
+
+    main(args)
@@ -0,0 +1,88 @@
+# Periodic snapshots of the histograms and trees of a SimpleAna run, so that a
+# run stopped by the walltime limit or preemption can be resumed with --resume
+import json
+import os
+import sys
+import time
+
+import ROOT
+from HistCollections import Hists
+
+
+def checkpoint_path(output):
+    return f"{output}.checkpoint.root"
+
+
+def read_checkpoint(path, run):
+    """
+    State of the checkpoint of a run, or None if there is no checkpoint. The
+    checkpoint has to be of the same run, with the same inputs and options.
+    """
+    if not os.path.exists(path):
+        return None
+    checkpoint_file = ROOT.TFile.Open(path)
+    state = json.loads(checkpoint_file.Get("checkpoint").GetTitle())
+    checkpoint_file.Close()
+
+    if state["run"] != run:
+        print(
+            f"\nERROR: The checkpoint {path} is of a run with other inputs or options."
+        )
+        print("       Rerun with the original options or remove the checkpoint.\n")
+        sys.exit(1)
+    return state
+
+
+def restore(path, hists):
+    """
+    Add the histograms and trees of the checkpoint to the empty hists. The
+    restored histograms are identical to those at the checkpoint, so filling
+    the remaining events gives the same output as an uninterrupted run.
+    """
+    checkpoint_file = ROOT.TFile.Open(path)
+    for coll in hists:
+        coll.merge(coll.load(checkpoint_file))
+    checkpoint_file.Close()
+
+
+class Checkpoint:
+    """
+    Writes the state of the hists of a run to a checkpoint file at most every
+    interval seconds. The checkpoint file is replaced atomically, so it is
+    always complete.
+    """
+
+    def __init__(self, path, interval, run, hists, branches=None):
+        self.path = path
+        self.interval = interval
+        self.run = run
+        self.hists = hists
+        self.branches = branches
+        self.saved_at = time.monotonic()
+
+    def maybe_save(self, next_entry, entry):
+        if self.interval <= 0 or time.monotonic() - self.saved_at < self.interval:
+            return
+        self.save(next_entry, entry)
+
+    def save(self, next_entry, entry):
+        """
+        Save the hists after entry events, with next_entry the chain entry to
+        continue from.
+        """
+        tmp_path = f"{self.path}.tmp"
+        checkpoint_file = ROOT.TFile.Open(tmp_path, "RECREATE")
+        for coll in self.hists:
+            snapshot = Hists(coll.tag, checkpoint_file, branches=self.branches)
+            snapshot.merge(coll)
+            snapshot.write()
+
+        state = {"run": self.run, "next_entry": next_entry, "entry": entry}
+        checkpoint_file.cd()
+        ROOT.TNamed("checkpoint", json.dumps(state)).Write()
+        checkpoint_file.Close()
+        os.replace(tmp_path, self.path)
+
+        self.saved_at = time.monotonic()
+        print(f"Checkpoint after {entry} events written to {self.path}")
+        sys.stdout.flush()
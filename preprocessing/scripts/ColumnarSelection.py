@@ -0,0 +1,411 @@
+# Columnar counterpart of HistCollections.DelphesEvent: the same event_cuts are
+# applied to whole chunks of Delphes events at once with uproot/awkward arrays
+import awkward as ak
+import numpy as np
+import uproot
+from EventCuts import EventCuts
+
+DELPHES_BRANCHES = [
+    "Event.Weight",
+    "Event.Number",
+    "MissingET.MET",
+    "MissingET.Eta",
+    "MissingET.Phi",
+    "Electron.PT",
+    "Electron.Eta",
+    "Electron.Phi",
+    "Electron.Charge",
+    "Muon.PT",
+    "Muon.Eta",
+    "Muon.Phi",
+    "Muon.Charge",
+    "Jet.PT",
+    "Jet.Eta",
+    "Jet.Phi",
+    "Jet.Mass",
+    "Jet.BTag",
+    "Jet.TauTag",
+]
+
+# Top-level Delphes branches of DELPHES_BRANCHES
+delphes_branches = sorted({branch.split(".")[0] for branch in DELPHES_BRANCHES})
+
+# PDG ID of the negatively charged lepton of each collection
+ELECTRON_PID = 11
+MUON_PID = 13
+
+default_fill = -999
+
+
+def iterate_delphes(file_ranges, step_size="100 MB", branches=None):
+    """
+    Yield chunks of the Delphes tree as awkward arrays for every
+    (path, entry_start, entry_stop) range of input files, in order.
+    """
+    for path, entry_start, entry_stop in file_ranges:
+        with uproot.open(path) as input_file:
+            yield from input_file["Delphes"].iterate(
+                DELPHES_BRANCHES if branches is None else branches,
+                step_size=step_size,
+                entry_start=entry_start,
+                entry_stop=entry_stop,
+            )
+
+
+def lorentz_components(pt, eta, phi, mass):
+    """
+    Kinematics of flat arrays of objects computed with the same arithmetic as
+    TLorentzVector::SetPtEtaPhiM followed by the TLorentzVector getters. The
+    NumPy functions can round differently from the C math library in the last
+    bit, so the components agree with those of the loop engine to a relative
+    1e-12, and the masses, for which E^2 - p^2 cancels, to 1e-7 of E.
+    """
+    pt, eta, phi, mass = (
+        np.asarray(component, dtype=np.float64) for component in (pt, eta, phi, mass)
+    )
+    px = pt * np.cos(phi)
+    py = pt * np.sin(phi)
+    pz = pt * np.sinh(eta)
+    p2 = px * px + py * py + pz * pz
+    energy = np.sqrt(p2 + mass * mass)
+    return vector_components(px, py, pz, energy)
+
+
+def vector_components(px, py, pz, energy):
+    p2 = px * px + py * py + pz * pz
+    p = np.sqrt(p2)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        cos_theta = np.where(p == 0, 1.0, pz / p)
+        eta = np.where(
+            cos_theta * cos_theta < 1,
+            -0.5 * np.log((1.0 - cos_theta) / (1.0 + cos_theta)),
+            np.where(pz == 0, 0.0, np.where(pz > 0, 10e10, -10e10)),
+        )
+    m2 = energy * energy - p2
+    return {
+        "Px": px,
+        "Py": py,
+        "Pz": pz,
+        "E": energy,
+        "Pt": np.sqrt(px * px + py * py),
+        "Eta": eta,
+        "Phi": np.where((px == 0) & (py == 0), 0.0, np.arctan2(py, px)),
+        "M": np.where(m2 < 0, -np.sqrt(np.abs(m2)), np.sqrt(np.abs(m2))),
+    }
+
+
+def _nth(collection, index):
+    """
+    The index-th object of every event, None for events with too few objects.
+    """
+    return ak.pad_none(collection, index + 1, axis=1)[:, index]
+
+
+def _to_numpy(array, default=default_fill, dtype=np.float64):
+    return np.asarray(ak.to_numpy(ak.fill_none(array, default)), dtype=dtype)
+
+
+class ColumnarEvents:
+    """
+    A chunk of Delphes events with the DelphesEvent object selection applied as
+    masked array operations.
+
+    Every collection is a jagged record array holding, per event, the objects
+    DelphesEvent would hold in the list of the same name and in the same order.
+    """
+
+    collections = [
+        "leptons",
+        "elecs",
+        "muons",
+        "sorted_leptons",
+        "jets",
+        "excl_jets",
+        "tau_tags",
+        "btags",
+        "sorted_jets",
+        "sorted_bjets",
+    ]
+
+    def __init__(self, arrays, high_lumi=False, run_number=0, cuts=None, **kwargs):
+        """
+        Select the objects of the events with the cuts, or with EventCuts of
+        high_lumi and the keyword arguments if no cuts are given.
+        """
+        cuts = cuts if cuts is not None else EventCuts(high_lumi, **kwargs)
+        # Only one event weight and one MET per event
+        self.weight = _to_numpy(ak.firsts(arrays["Event.Weight"]), default=0)
+        self.run_number = run_number
+        self.event_number = _to_numpy(
+            ak.firsts(arrays["Event.Number"]), default=0, dtype=np.int32
+        )
+        self.met = {
+            field: _to_numpy(ak.firsts(arrays[f"MissingET.{field}"]), default=0)
+            for field in ["MET", "Eta", "Phi"]
+        }
+
+        electrons = self._leptons(arrays, "Electron", ELECTRON_PID)
+        muons = self._leptons(arrays, "Muon", MUON_PID)
+        self.elecs = electrons[
+            (electrons.PT > cuts.electron_pt) & (abs(electrons.Eta) < cuts.electron_eta)
+        ]
+        self.muons = muons[(muons.PT > cuts.muon_pt) & (abs(muons.Eta) < cuts.muon_eta)]
+        self.leptons = ak.concatenate([self.elecs, self.muons], axis=1)
+        self.sorted_leptons = self._sorted(self.leptons)
+
+        jets = ak.zip(
+            {
+                field: arrays[f"Jet.{field}"]
+                for field in ["PT", "Eta", "Phi", "Mass", "BTag", "TauTag"]
+            }
+        )
+        self.btag_eta = cuts.btag_eta
+
+        jet_mask = (jets.PT > cuts.jet_pt) & (abs(jets.Eta) < cuts.jet_eta)
+        self.tau_tags = jets[jets.TauTag != 0]
+        self.btags = jets[(jets.BTag != 0) & (abs(jets.Eta) < self.btag_eta)]
+        self.jets = jets[jet_mask]
+        self.excl_jets = jets[jet_mask & (jets.TauTag == 0) & (jets.BTag == 0)]
+
+        self.sorted_jets = self._sorted(self.jets)
+        self.sorted_bjets = self._sorted(self.btags)
+
+    @staticmethod
+    def _leptons(arrays, name, pid):
+        leptons = ak.zip(
+            {field: arrays[f"{name}.{field}"] for field in ["PT", "Eta", "Phi"]}
+        )
+        # Delphes leptons are smeared generator leptons, so the flavour of the
+        # collection and the reconstructed charge give the generator PID
+        leptons["PID"] = -pid * arrays[f"{name}.Charge"]
+        leptons["Mass"] = ak.zeros_like(leptons.PT)
+        return leptons
+
+    @staticmethod
+    def _sorted(collection):
+        # stable, like sorted(..., reverse=True), so pT ties keep their order
+        return collection[
+            ak.argsort(collection.PT, axis=1, ascending=False, stable=True)
+        ]
+
+    def count(self, name):
+        """
+        Number of objects per event in the named collection.
+        """
+        return ak.to_numpy(ak.num(getattr(self, name), axis=1))
+
+    def __len__(self):
+        return len(self.weight)
+
+    def __getitem__(self, mask):
+        """
+        The subset of events selected by a boolean mask.
+        """
+        selected = ColumnarEvents.__new__(ColumnarEvents)
+        selected.weight = self.weight[mask]
+        selected.run_number = self.run_number
+        selected.event_number = self.event_number[mask]
+        selected.met = {field: values[mask] for field, values in self.met.items()}
+        selected.btag_eta = self.btag_eta
+        for name in self.collections:
+            setattr(selected, name, getattr(self, name)[mask])
+        return selected
+
+
+def _objects(collection, weight):
+    """
+    Flattened objects of a collection and the event weight of each of them.
+    """
+    counts = ak.to_numpy(ak.num(collection, axis=1))
+    flat = {
+        field: np.asarray(ak.to_numpy(ak.flatten(collection[field])), dtype=np.float64)
+        for field in ["PT", "Eta", "Phi"]
+    }
+    return flat, np.repeat(weight, counts)
+
+
+def _nth_p4(collection, index):
+    """
+    Four momentum components of the index-th object of a collection and a mask
+    of the events that have such an object.
+    """
+    nth = _nth(collection, index)
+    present = ~ak.to_numpy(ak.is_none(nth))
+    p4 = lorentz_components(
+        _to_numpy(nth.PT, default=0),
+        _to_numpy(nth.Eta, default=0),
+        _to_numpy(nth.Phi, default=0),
+        _to_numpy(nth.Mass, default=0),
+    )
+    return present, p4
+
+
+def _p4_branches(present, p4, prefix, names):
+    return {
+        f"{prefix}{name}": np.where(present, p4[component], default_fill)
+        for name, component in names.items()
+    }
+
+
+def _p4_array(present, p4):
+    """
+    The (Px, Py, Pz, E) rows of the p4 branches of the objects.
+    """
+    components = np.stack([p4[c] for c in ["Px", "Py", "Pz", "E"]], axis=1)
+    return np.where(present[:, np.newaxis], components, default_fill)
+
+
+def hist_columns(events, weight):
+    """
+    The per-histogram (values, weights) arrays and per-event output branch
+    columns Hists.fill would produce for every event of the chunk.
+    """
+    values = {}
+    columns = {
+        "weight": np.asarray(weight, dtype=np.float32),
+        "run_number": np.full(len(events), events.run_number, dtype=np.int64),
+        "event_number": events.event_number,
+    }
+
+    n_objects = {
+        "nElec": "elecs",
+        "nMuon": "muons",
+        "nTau": "tau_tags",
+        "nbjets": "btags",
+        "njet": "jets",
+        "nleptons": "leptons",
+    }
+    for name, collection in n_objects.items():
+        counts = events.count(collection)
+        values[name] = (np.asarray(counts, dtype=np.float64), weight)
+        columns[name] = np.asarray(counts, dtype=np.int32)
+
+    met = lorentz_components(
+        events.met["MET"], events.met["Eta"], events.met["Phi"], 0.0
+    )
+    # TLorentzVector sum of the MET and all selected muons, summed in order
+    muons = lorentz_components(
+        ak.flatten(events.muons.PT),
+        ak.flatten(events.muons.Eta),
+        ak.flatten(events.muons.Phi),
+        0.0,
+    )
+    muon_sums = {}
+    counts = events.count("muons")
+    for component in ["Px", "Py", "Pz", "E"]:
+        muon_sums[component] = _to_numpy(
+            ak.sum(ak.unflatten(muons[component], counts), axis=1), default=0
+        )
+    met_invismu = vector_components(
+        *(
+            met[component] + muon_sums[component]
+            for component in ["Px", "Py", "Pz", "E"]
+        )
+    )
+    values["MET"] = (met["Pt"], weight)
+    values["MET_invismu"] = (met_invismu["Pt"], weight)
+    columns["MET"] = met["Pt"]
+    columns["METPhi"] = met["Phi"]
+    columns["MET_invismu"] = met_invismu["Pt"]
+    columns["METPhi_invismu"] = met_invismu["Phi"]
+
+    # kinematics of every object and of the first object of each collection
+    for hist_prefix, collection in [
+        ("b", events.btags),
+        ("j", events.excl_jets),
+        ("e", events.elecs),
+        ("m", events.muons),
+        ("t", events.tau_tags),
+    ]:
+        flat, object_weight = _objects(collection, weight)
+        for field in ["PT", "Eta", "Phi"]:
+            values[f"{hist_prefix}{field}"] = (flat[field], object_weight)
+
+    for hist_prefix, collection in [
+        ("e", events.elecs),
+        ("m", events.muons),
+        ("t", events.tau_tags),
+    ]:
+        first = _nth(collection, 0)
+        present = ~ak.to_numpy(ak.is_none(first))
+        for field in ["PT", "Eta", "Phi"]:
+            values[f"l{hist_prefix}{field}"] = (
+                _to_numpy(first[field])[present],
+                weight[present],
+            )
+
+    first_tau = _nth(events.tau_tags, 0)
+    for field in ["PT", "Eta", "Phi"]:
+        columns[f"tau1{field}"] = _to_numpy(first_tau[field])
+
+    # non-b/tau-jets
+    jet_names = {"PT": "Pt", "Eta": "Eta", "Phi": "Phi"}
+    jet1_present, jet1_p4 = _nth_p4(events.excl_jets, 0)
+    jet2_present, jet2_p4 = _nth_p4(events.excl_jets, 1)
+    columns.update(_p4_branches(jet1_present, jet1_p4, "j1", jet_names))
+    columns.update(_p4_branches(jet2_present, jet2_p4, "j2", jet_names))
+    dijet = vector_components(
+        *(jet1_p4[c] + jet2_p4[c] for c in ["Px", "Py", "Pz", "E"])
+    )
+    values["mjj"] = (dijet["M"][jet2_present], weight[jet2_present])
+    columns["mjj"] = np.where(jet2_present, dijet["M"], default_fill)
+
+    # b-jets
+    bjet_names = {
+        "_PT": "Pt",
+        "_Eta": "Eta",
+        "_Phi": "Phi",
+    }
+    for index, prefix in enumerate(["bjet1", "bjet2"]):
+        present, p4 = _nth_p4(events.sorted_bjets, index)
+        columns.update(_p4_branches(present, p4, prefix, bjet_names))
+        columns[f"{prefix}_p4"] = _p4_array(present, p4)
+
+    # Leptons
+    lepton_names = {
+        "_Pt": "Pt",
+        "_Eta": "Eta",
+        "_Phi": "Phi",
+        "_M": "M",
+    }
+    for index, prefix in enumerate(["lep1", "lep2"]):
+        present, p4 = _nth_p4(events.sorted_leptons, index)
+        columns.update(_p4_branches(present, p4, prefix, lepton_names))
+        columns[f"{prefix}_p4"] = _p4_array(present, p4)
+        columns[f"{prefix}_PID"] = _to_numpy(
+            _nth(events.sorted_leptons, index).PID, dtype=np.int32
+        )
+
+    return values, columns
+
+
+def unscaled_columns(events):
+    """
+    hist_columns of the events with their Delphes event weights, keeping the
+    weight column in double precision so that it can be scaled exactly by
+    scale_columns. The values of each histogram are (values, weights, rows),
+    with the row of the event of each value, so that they can be sliced to a
+    subset of the events.
+    """
+    values, columns = hist_columns(events, np.arange(len(events)))
+    values = {
+        name: (hist_values, events.weight[rows], rows)
+        for name, (hist_values, rows) in values.items()
+    }
+    columns["weight"] = events.weight
+    return values, columns
+
+
+def scale_columns(values, columns, weightscale):
+    """
+    The hist_columns of weights scaled by weightscale from unscaled_columns.
+    """
+    values = {
+        name: (hist_values, hist_weights * weightscale)
+        for name, (hist_values, hist_weights, _) in values.items()
+    }
+    columns = dict(
+        columns,
+        weight=np.asarray(columns["weight"] * weightscale, dtype=np.float32),
+    )
+    return values, columns
@@ -0,0 +1,52 @@
+# Only the Delphes branches the event selection and the histograms use are read,
+# all others are disabled so their baskets are never read or decompressed
+import sys
+
+import ROOT
+
+
+def prune_branches(chain, branches):
+    """
+    Disable all branches of the chain except the given top-level branches and
+    their sub-branches and _size branches.
+    """
+    chain.SetBranchStatus("*", 0)
+    for branch in branches:
+        chain.SetBranchStatus(branch, 1)
+        chain.SetBranchStatus(f"{branch}.*", 1)
+        chain.SetBranchStatus(f"{branch}_size", 1)
+
+
+def branch_bytes(input_files, branches, tree_name="Delphes"):
+    """
+    Compressed bytes in the input files of the given top-level branches and of
+    all other branches.
+    """
+    used_bytes = 0
+    skipped_bytes = 0
+    for input_file in input_files:
+        root_file = ROOT.TFile.Open(input_file)
+        for branch in root_file.Get(tree_name).GetListOfBranches():
+            # "*" includes the bytes of all sub-branches
+            zip_bytes = branch.GetZipBytes("*")
+            name = branch.GetName()
+            if name.endswith("_size"):
+                name = name[: -len("_size")]
+            if name in branches:
+                used_bytes += zip_bytes
+            else:
+                skipped_bytes += zip_bytes
+        root_file.Close()
+    return used_bytes, skipped_bytes
+
+
+def report_branch_bytes(input_files, branches):
+    used_bytes, skipped_bytes = branch_bytes(input_files, branches)
+    total_bytes = max(used_bytes + skipped_bytes, 1)
+    print(
+        f"Reading branches {', '.join(sorted(branches))}: "
+        + f"{used_bytes / 1e6:.1f} MB of {total_bytes / 1e6:.1f} MB compressed "
+        + f"({100 * used_bytes / total_bytes:.1f}%), "
+        + f"skipping {skipped_bytes / 1e6:.1f} MB"
+    )
+    sys.stdout.flush()
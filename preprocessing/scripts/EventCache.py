@@ -0,0 +1,219 @@
+# On-disk cache of the selected per-event columns and per-object histogram
+# values of the columnar engine, so re-runs that only change the luminosity,
+# cross section or histogram binning skip reading Delphes and the selection
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+
+import numpy as np
+from SumOfWeights import file_fingerprint
+
+# Bump when the cached contents change
+cache_version = 4
+
+
+def cache_key(path, event_cuts):
+    """
+    Key of the selected events of an input file with the given event_cuts. The
+    entries of a key are cached as chunks, so that any range of entries of the
+    file can be read from the chunks covering it.
+    """
+    event_cuts = dict(event_cuts)
+    event_cuts.setdefault("high_lumi", False)
+    key = {
+        "version": cache_version,
+        "file": file_fingerprint(path),
+        "event_cuts": event_cuts,
+    }
+    return hashlib.sha256(json.dumps(key, sort_keys=True).encode()).hexdigest()
+
+
+def _save_chunk(path, chunk):
+    arrays = {}
+    for tag, (values, columns) in chunk.items():
+        for name, (hist_values, hist_weights, hist_rows) in values.items():
+            arrays[f"{tag}/values/{name}"] = hist_values
+            arrays[f"{tag}/weights/{name}"] = hist_weights
+            arrays[f"{tag}/rows/{name}"] = hist_rows
+        for name, column in columns.items():
+            arrays[f"{tag}/columns/{name}"] = column
+    np.savez_compressed(path, **arrays)
+
+
+def _load_chunk(path):
+    chunk = {}
+    with np.load(path) as arrays:
+        for key in arrays.files:
+            tag, kind, name = key.split("/")
+            values, columns = chunk.setdefault(tag, ({}, {}))
+            if kind == "columns":
+                columns[name] = arrays[key]
+            elif kind == "values":
+                values[name] = (
+                    arrays[key],
+                    arrays[f"{tag}/weights/{name}"],
+                    arrays[f"{tag}/rows/{name}"],
+                )
+    return chunk
+
+
+def slice_chunk(chunk, entry_start, entry_stop):
+    """
+    The events of a chunk in the [entry_start, entry_stop) entries of the
+    input file, selected by their entry column, with the rows of the histogram
+    values renumbered to the remaining events.
+    """
+    sliced = {}
+    for tag, (values, columns) in chunk.items():
+        entries = columns["entry"]
+        selected = (entries >= entry_start) & (entries < entry_stop)
+        new_rows = np.cumsum(selected) - 1
+        sliced_values = {}
+        for name, (hist_values, hist_weights, hist_rows) in values.items():
+            keep = selected[hist_rows]
+            sliced_values[name] = (
+                hist_values[keep],
+                hist_weights[keep],
+                new_rows[hist_rows[keep]],
+            )
+        sliced_columns = {name: column[selected] for name, column in columns.items()}
+        sliced[tag] = (sliced_values, sliced_columns)
+    return sliced
+
+
+def _chunk_name(entry_start, entry_stop):
+    return f"entries_{entry_start:012d}_{entry_stop:012d}.npz"
+
+
+def _chunk_entries(name):
+    """
+    The [entry_start, entry_stop) entries of a chunk file from its name.
+    """
+    _, entry_start, entry_stop = os.path.splitext(name)[0].split("_")
+    return int(entry_start), int(entry_stop)
+
+
+def covering_chunks(chunk_entries, entry_start, entry_stop):
+    """
+    The (entry_start, entry_stop) of chunks, among the chunk_entries, that
+    cover the [entry_start, entry_stop) entries in order, or None if the
+    chunks leave a gap. Where chunks overlap, the one reaching furthest is
+    taken.
+    """
+    covering = []
+    entry = entry_start
+    while entry < entry_stop:
+        candidates = [
+            (start, stop) for start, stop in chunk_entries if start <= entry < stop
+        ]
+        if not candidates:
+            return None
+        chunk = max(candidates, key=lambda candidate: candidate[1])
+        covering.append(chunk)
+        entry = chunk[1]
+    return covering
+
+
+def _directory_bytes(path):
+    return sum(entry.stat().st_size for entry in os.scandir(path) if entry.is_file())
+
+
+class EventCache:
+    """
+    Directory of cache entries, one subdirectory per key with a compressed
+    .npz file per chunk of entries of the input file. The least recently used
+    entries are evicted once the entries take up more than max_bytes.
+
+    A chunk maps tags of Hists to the (values, columns) of unscaled_columns,
+    with the input file entry of each event in the entry column.
+    """
+
+    def __init__(self, cache_dir, max_bytes):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def load(self, key, entry_start, entry_stop):
+        """
+        Iterator over the cached chunks of the key covering the [entry_start,
+        entry_stop) entries in order, sliced to these entries, or None if the
+        cached chunks don't cover all of them.
+        """
+        entry_dir = os.path.join(self.cache_dir, key)
+        try:
+            chunk_files = {
+                _chunk_entries(name): name
+                for name in os.listdir(entry_dir)
+                if not name.startswith(".")
+            }
+        except OSError:
+            return None
+        covering = covering_chunks(chunk_files, entry_start, entry_stop)
+        if covering is None:
+            return None
+        # mark the entry as recently used
+        os.utime(entry_dir)
+        return (
+            slice_chunk(
+                _load_chunk(os.path.join(entry_dir, chunk_files[entries])),
+                entry_start,
+                entry_stop,
+            )
+            for entries in covering
+        )
+
+    def store(self, key, chunks):
+        """
+        Pass through the chunks while writing them to the cache entry of the
+        key. Each chunk only becomes visible once it has been written, so
+        processes reading other ranges of the same file can add their chunks
+        to the entry concurrently.
+        """
+        entry_dir = os.path.join(self.cache_dir, key)
+        os.makedirs(entry_dir, exist_ok=True)
+        for chunk in chunks:
+            entries = chunk["all_events"][1]["entry"]
+            if len(entries) > 0:
+                fd, tmp_path = tempfile.mkstemp(
+                    prefix=".tmp_", suffix=".npz", dir=entry_dir
+                )
+                os.close(fd)
+                try:
+                    _save_chunk(tmp_path, chunk)
+                    os.replace(
+                        tmp_path,
+                        os.path.join(
+                            entry_dir, _chunk_name(entries[0], entries[-1] + 1)
+                        ),
+                    )
+                finally:
+                    if os.path.exists(tmp_path):
+                        os.remove(tmp_path)
+            yield chunk
+        self.evict(keep=key)
+
+    def evict(self, keep=None):
+        """
+        Remove the least recently used entries, except keep, until the entries
+        take up at most max_bytes.
+        """
+        entries = []
+        for entry in os.scandir(self.cache_dir):
+            if entry.is_dir() and not entry.name.startswith("."):
+                try:
+                    size = _directory_bytes(entry.path)
+                    entries.append((entry.stat().st_mtime, size, entry))
+                except OSError:
+                    continue
+
+        total_bytes = sum(size for _, size, _ in entries)
+        for _, size, entry in sorted(entries, key=lambda entry: entry[0]):
+            if total_bytes <= self.max_bytes:
+                break
+            if entry.name == keep:
+                continue
+            shutil.rmtree(entry.path, ignore_errors=True)
+            total_bytes -= size
+            print(f"Evicted cache entry {entry.name} ({size / 1e6:.1f} MB)")
@@ -0,0 +1,33 @@
+# Object selection thresholds shared by the loop, columnar and RDataFrame
+# engines, kept apart from HistCollections so that they can be used without ROOT
+
+
+class EventCuts:
+    """
+    Object selection thresholds of DelphesEvent and ColumnarEvents, parsed once
+    per run from the event_cuts keyword arguments. Unknown keywords are
+    ignored.
+    """
+
+    __slots__ = (
+        "electron_pt",
+        "electron_eta",
+        "muon_pt",
+        "muon_eta",
+        "jet_pt",
+        "jet_eta",
+        "btag_eta",
+    )
+
+    def __init__(self, high_lumi=False, **kwargs):
+        # reasonable values: 25 GeV, 2.5 eta
+        self.electron_pt = kwargs.pop("e_pt_cut", 0.0)  # GeV
+        self.electron_eta = kwargs.pop("e_eta_cut", 0.0)
+        self.muon_pt = kwargs.pop("mu_pt_cut", self.electron_pt)  # GeV
+        self.muon_eta = kwargs.pop("mu_eta_cut", self.electron_eta)
+        # reasonable values: 25 GeV, 4.5 eta
+        self.jet_pt = kwargs.pop("jet_pt_cut", 0.0)  # GeV
+        self.jet_eta = kwargs.pop("jet_eta_cut", 0.0)
+        # reasonable values: 4.0 eta
+        bjet_eta_cut = kwargs.pop("bjet_eta_cut", self.jet_eta)
+        self.btag_eta = bjet_eta_cut if not high_lumi else 4.0
@@ -1,75 +1,455 @@
 # Code inspired by and based partially on https://gitlab.cern.ch/scipp/mario-mapyde
+import hashlib
+import time
 from array import array
+from collections import namedtuple
+from itertools import repeat
+from operator import attrgetter, methodcaller
 
+import numpy as np
 import ROOT
+from EventCuts import EventCuts
 from ROOT import TH1F
 
 
+class _memoized:
+    """
+    Attribute of a DelphesEvent computed by the decorated method on first
+    access and kept in the slot of the same name with a leading underscore.
+    """
+
+    def __init__(self, compute):
+        self.compute = compute
+        self.slot = f"_{compute.__name__}"
+        self.__doc__ = compute.__doc__
+
+    def __get__(self, event, owner=None):
+        if event is None:
+            return self
+        try:
+            return getattr(event, self.slot)
+        except AttributeError:
+            value = self.compute(event)
+            setattr(event, self.slot, value)
+            return value
+
+
 class DelphesEvent:
-    def __init__(self, event, high_lumi=False, **kwargs):
+    """
+    View of a Delphes event with the selected objects of the event cuts. The
+    weight, MET and object collections are only computed when they are first
+    used, so reading only the weight or the leptons skips the jets.
+    """
+
+    # Delphes branches read by the selection
+    delphes_branches = ["Event", "MissingET", "Electron", "Muon", "Jet"]
+
+    __slots__ = (
+        "event",
+        "cuts",
+        # run_number and event_number identify the event across outputs
+        "run_number",
+        "_event_info",
+        "_met",
+        "_elecs",
+        "_muons",
+        "_leptons",
+        "_sorted_leptons",
+        "_jet_selection",
+        "_sorted_jets",
+        "_sorted_bjets",
+    )
+
+    def __init__(self, event, high_lumi=False, run_number=0, cuts=None, **kwargs):
+        """
+        Select the objects of the event with the cuts, or with EventCuts of
+        high_lumi and the keyword arguments if no cuts are given. Pass the
+        cuts of a run to skip parsing the keyword arguments for every event.
+        """
         self.event = event
+        self.cuts = cuts if cuts is not None else EventCuts(high_lumi, **kwargs)
+        self.run_number = run_number
+
+    # memoized selections forced by select
+    selections = (
+        "event_info",
+        "met",
+        "sorted_leptons",
+        "jet_selection",
+        "sorted_jets",
+        "sorted_bjets",
+    )
+
+    def select(self):
+        """
+        Select all objects of the event now instead of on first use, so that
+        the selection is timed apart from filling the histograms. Returns the
+        event.
+        """
+        for name in self.selections:
+            getattr(self, name)
+        return self
+
+    @_memoized
+    def event_info(self):
         # Only one event
         try:
-            weight = event.Event[0].Weight
+            return self.event.Event[0].Weight, self.event.Event[0].Number
         except AttributeError:
-            weight = 0
-        self.weight = weight
-
-        # reasonable values: 25 GeV, 2.5 eta
-        electron_pt_cut = kwargs.pop("e_pt_cut", 0.0)  # GeV
-        electron_eta_cut = kwargs.pop("e_eta_cut", 0.0)
-        muon_pt_cut = kwargs.pop("mu_pt_cut", electron_pt_cut)  # GeV
-        muon_eta_cut = kwargs.pop("mu_eta_cut", electron_eta_cut)
-        # reasonable values: 25 GeV, 4.5 eta
-        jet_pt_cut = kwargs.pop("jet_pt_cut", 0.0)  # GeV
-        jet_eta_cut = kwargs.pop("jet_eta_cut", 0.0)
-        # reasonable values: 4.0 eta
-        bjet_eta_cut = kwargs.pop("bjet_eta_cut", jet_eta_cut)
-
-        # self.met=TLorentzVector()
+            return 0, 0
+
+    @property
+    def weight(self):
+        return self.event_info[0]
+
+    @property
+    def event_number(self):
+        return self.event_info[1]
+
+    @property
+    def btag_eta(self):
+        return self.cuts.btag_eta
+
+    @_memoized
+    def met(self):
         # Only one MET
         try:
-            met = event.MissingET[0].P4()
+            return self.event.MissingET[0].P4()
         except AttributeError:
-            met = None
-        self.met = met
-
-        self.leptons = []
-        self.elecs = []
-        for electron in event.Electron:
-            if electron.PT > electron_pt_cut and abs(electron.Eta) < electron_eta_cut:
-                self.elecs.append(electron)
-                self.leptons.append(electron)
-        self.muons = []
-        for muon in event.Muon:
-            if muon.PT > muon_pt_cut and abs(muon.Eta) < muon_eta_cut:
-                self.muons.append(muon)
-                self.leptons.append(muon)
-
-        self.sorted_leptons = sorted(self.leptons, key=lambda lep: lep.PT, reverse=True)
-
-        self.jets = []
-        self.excl_jets = []
-        self.tau_tags = []
-        self.btags = []
-
-        self.btag_eta = bjet_eta_cut if not high_lumi else 4.0
-
-        for jet in event.Jet:
+            return None
+
+    @_memoized
+    def elecs(self):
+        cuts = self.cuts
+        return [
+            electron
+            for electron in self.event.Electron
+            if electron.PT > cuts.electron_pt and abs(electron.Eta) < cuts.electron_eta
+        ]
+
+    @_memoized
+    def muons(self):
+        cuts = self.cuts
+        return [
+            muon
+            for muon in self.event.Muon
+            if muon.PT > cuts.muon_pt and abs(muon.Eta) < cuts.muon_eta
+        ]
+
+    @_memoized
+    def leptons(self):
+        return self.elecs + self.muons
+
+    @_memoized
+    def sorted_leptons(self):
+        return sorted(self.leptons, key=lambda lep: lep.PT, reverse=True)
+
+    @_memoized
+    def jet_selection(self):
+        """
+        The jets, non-b/tau-jets, tau-tagged jets and b-tagged jets, selected
+        in a single pass over the jets.
+        """
+        jets = []
+        excl_jets = []
+        tau_tags = []
+        btags = []
+        cuts = self.cuts
+        for jet in self.event.Jet:
             if jet.TauTag:
-                self.tau_tags.append(jet)
-            if jet.BTag and abs(jet.Eta) < self.btag_eta:
-                self.btags.append(jet)
-            if jet.PT > jet_pt_cut and abs(jet.Eta) < jet_eta_cut:
-                self.jets.append(jet)
+                tau_tags.append(jet)
+            if jet.BTag and abs(jet.Eta) < cuts.btag_eta:
+                btags.append(jet)
+            if jet.PT > cuts.jet_pt and abs(jet.Eta) < cuts.jet_eta:
+                jets.append(jet)
                 if not (jet.TauTag or jet.BTag):
-                    self.excl_jets.append(jet)
-
-        self.sorted_jets = sorted(self.jets, key=lambda jet: jet.PT, reverse=True)
-        self.sorted_bjets = sorted(self.btags, key=lambda jet: jet.PT, reverse=True)
+                    excl_jets.append(jet)
+        return jets, excl_jets, tau_tags, btags
+
+    @property
+    def jets(self):
+        return self.jet_selection[0]
+
+    @property
+    def excl_jets(self):
+        return self.jet_selection[1]
+
+    @property
+    def tau_tags(self):
+        return self.jet_selection[2]
+
+    @property
+    def btags(self):
+        return self.jet_selection[3]
+
+    @_memoized
+    def sorted_jets(self):
+        return sorted(self.jets, key=lambda jet: jet.PT, reverse=True)
+
+    @_memoized
+    def sorted_bjets(self):
+        return sorted(self.btags, key=lambda jet: jet.PT, reverse=True)
+
+
+# Declarative description of the histograms and output tree branches of Hists.
+#
+# source is either a collection of the DelphesEvent or one of the EVENT_VECTORS.
+# For collections, objects selects the values that are filled:
+#   "count": the number of objects in the collection
+#   "all": the attribute of every object in the collection
+#   n: the attribute of the n-th object in the collection
+#   "value": the event attribute named source itself, such as the event number
+# Event vectors are TLorentzVectors (None if the event has no such object) and
+# attribute is the name of the TLorentzVector method giving the value, or "P4"
+# for the (Px, Py, Pz, E) array of a branch of length 4 read by MoMEMta.
+# If there is no object to take the value from, the histogram is not filled and
+# the branch is set to default_fill.
+HistSpec = namedtuple(
+    "HistSpec",
+    ["key", "name", "title", "nbins", "low", "high", "source", "objects", "attribute"],
+)
+BranchSpec = namedtuple(
+    "BranchSpec",
+    ["name", "type", "source", "objects", "attribute", "length"],
+    defaults=[1],
+)
+
+default_fill = -999
+
+# fmt: off
+HIST_SPECS = [
+    # Basics
+    HistSpec("nElec", "nElec", "nElec;Number of Electrons;Events", 10, 0, 10, "elecs", "count", None),
+    HistSpec("nMuon", "nMuon", "nMuon;Number of Muons;Events", 10, 0, 10, "muons", "count", None),
+    HistSpec("nTau", "nTau", "nTau;Number of Taus;Events", 10, 0, 10, "tau_tags", "count", None),
+    HistSpec("nbjets", "nbjets", "nbjets;Number of b-jets;Events", 10, 0, 10, "btags", "count", None),
+    HistSpec("njet", "njets", "njets;Number of jets;Events", 10, 0, 10, "jets", "count", None),
+    HistSpec("nleptons", "nleptons", "nleptons;Number of Leptons (e/#mu);Events", 10, 0, 10, "leptons", "count", None),
+    # B-jets
+    HistSpec("bPT", "bPT", "bPT;p_{T,b-jets};Events/(10GeV)", 50, 0, 500, "btags", "all", "PT"),
+    HistSpec("bPhi", "bPhi", "bPhi;#phi(b-jets);Events/(0.4)", 20, -4, 4, "btags", "all", "Phi"),
+    HistSpec("bEta", "bEta", "bEta;#eta(b-jets);Events/(0.5)", 20, -5, 5, "btags", "all", "Eta"),
+    # Jets
+    HistSpec("jPT", "jPT", "jPT;p_{T,jets};Events/(10GeV)", 50, 0, 500, "excl_jets", "all", "PT"),
+    HistSpec("jPhi", "jPhi", "jPhi;#phi(jets);Events/(0.4)", 20, -4, 4, "excl_jets", "all", "Phi"),
+    HistSpec("jEta", "jEta", "jEta;#eta(jets);Events/(0.5)", 20, -5, 5, "excl_jets", "all", "Eta"),
+    HistSpec("mjj", "mjj", "mjj;m(jj);Events/(100 GeV)", 100, 0, 10000, "dijet", None, "M"),
+    # Electrons
+    HistSpec("ePT", "ePT", "ePT;p^{e}_{T};Events/(10GeV)", 50, 0, 500, "elecs", "all", "PT"),
+    HistSpec("ePhi", "ePhi", "ePhi;#phi(elecs);Events/(0.4)", 20, -4, 4, "elecs", "all", "Phi"),
+    HistSpec("eEta", "eEta", "eEta;#eta(elecs);Events/(0.5)", 20, -5, 5, "elecs", "all", "Eta"),
+    HistSpec("lePT", "lePT", "lePT;p^{lead-e}_{T};Events/(10GeV)", 50, 0, 500, "elecs", 0, "PT"),
+    HistSpec("lePhi", "lePhi", "lePhi;#phi(leading-e);Events/(0.4)", 20, -4, 4, "elecs", 0, "Phi"),
+    HistSpec("leEta", "leEta", "leEta;#eta(leading-e);Events/(0.5)", 20, -5, 5, "elecs", 0, "Eta"),
+    # Muons
+    HistSpec("mPT", "mPT", "mPT;p^{#mu}_{T};Events/(10GeV)", 50, 0, 500, "muons", "all", "PT"),
+    HistSpec("mPhi", "mPhi", "mPhi;#phi(muons);Events/(0.4)", 20, -4, 4, "muons", "all", "Phi"),
+    HistSpec("mEta", "mEta", "mEta;#eta(muons);Events/(0.5)", 20, -5, 5, "muons", "all", "Eta"),
+    HistSpec("lmPT", "lmPT", "lmPT;p^{lead-#mu}_{T};Events/(10GeV)", 50, 0, 500, "muons", 0, "PT"),
+    HistSpec("lmPhi", "lmPhi", "lmPhi;#phi(leading-#mu);Events/(0.4)", 20, -4, 4, "muons", 0, "Phi"),
+    HistSpec("lmEta", "lmEta", "lmEta;#eta(leading-#mu);Events/(0.5)", 20, -5, 5, "muons", 0, "Eta"),
+    # Taus
+    HistSpec("tPT", "tPT", "tPT;p^{#tau}_{T};Events/(10GeV)", 50, 0, 500, "tau_tags", "all", "PT"),
+    HistSpec("tPhi", "tPhi", "tPhi;#phi(taus);Events/(0.4)", 20, -4, 4, "tau_tags", "all", "Phi"),
+    HistSpec("tEta", "tEta", "tEta;#eta(taus);Events/(0.5)", 20, -5, 5, "tau_tags", "all", "Eta"),
+    HistSpec("ltPT", "ltPT", "ltPT;p^{lead-#tau}_{T};Events/(10GeV)", 50, 0, 500, "tau_tags", 0, "PT"),
+    HistSpec("ltPhi", "ltPhi", "ltPhi;#phi(leading-#tau);Events/(0.4)", 20, -4, 4, "tau_tags", 0, "Phi"),
+    HistSpec("ltEta", "ltEta", "ltEta;#eta(leading-#tau);Events/(0.5)", 20, -5, 5, "tau_tags", 0, "Eta"),
+    # MET
+    HistSpec("MET", "MET", "MET;E_{T}^{miss} [GeV];Events/(10 GeV)", 100, 0, 1000, "met", None, "Pt"),
+    HistSpec("MET_invismu", "MET_invismu", "MET;E_{T}^{miss} [GeV];Events/(10 GeV)", 100, 0, 1000, "met_invismu", None, "Pt"),
+]
+
+BRANCH_SPECS = [
+    BranchSpec("run_number", "q", "run_number", "value", None),
+    BranchSpec("event_number", "i", "event_number", "value", None),
+
+    BranchSpec("MET", "f", "met", None, "Pt"),
+    BranchSpec("METPhi", "f", "met", None, "Phi"),
+    BranchSpec("MET_invismu", "f", "met_invismu", None, "Pt"),
+    BranchSpec("METPhi_invismu", "f", "met_invismu", None, "Phi"),
+
+    BranchSpec("nElec", "i", "elecs", "count", None),
+    BranchSpec("nMuon", "i", "muons", "count", None),
+    BranchSpec("nTau", "i", "tau_tags", "count", None),
+    BranchSpec("nbjets", "i", "btags", "count", None),
+    BranchSpec("njet", "i", "jets", "count", None),
+    BranchSpec("nleptons", "i", "leptons", "count", None),
+
+    # PID is taken with the lepton_pid of the Hists
+    BranchSpec("lep1_PID", "i", "sorted_leptons", 0, "PID"),
+    BranchSpec("lep1_Pt", "f", "lep1", None, "Pt"),
+    BranchSpec("lep1_Eta", "f", "lep1", None, "Eta"),
+    BranchSpec("lep1_Phi", "f", "lep1", None, "Phi"),
+    BranchSpec("lep1_M", "f", "lep1", None, "M"),
+    BranchSpec("lep1_p4", "f", "lep1", None, "P4", 4),
+
+    BranchSpec("lep2_PID", "i", "sorted_leptons", 1, "PID"),
+    BranchSpec("lep2_Pt", "f", "lep2", None, "Pt"),
+    BranchSpec("lep2_Eta", "f", "lep2", None, "Eta"),
+    BranchSpec("lep2_Phi", "f", "lep2", None, "Phi"),
+    BranchSpec("lep2_M", "f", "lep2", None, "M"),
+    BranchSpec("lep2_p4", "f", "lep2", None, "P4", 4),
+
+    BranchSpec("tau1PT", "f", "tau_tags", 0, "PT"),
+    BranchSpec("tau1Eta", "f", "tau_tags", 0, "Eta"),
+    BranchSpec("tau1Phi", "f", "tau_tags", 0, "Phi"),
+
+    BranchSpec("j1PT", "f", "jet1", None, "Pt"),
+    BranchSpec("j1Eta", "f", "jet1", None, "Eta"),
+    BranchSpec("j1Phi", "f", "jet1", None, "Phi"),
+    BranchSpec("j2PT", "f", "jet2", None, "Pt"),
+    BranchSpec("j2Eta", "f", "jet2", None, "Eta"),
+    BranchSpec("j2Phi", "f", "jet2", None, "Phi"),
+    BranchSpec("mjj", "f", "dijet", None, "M"),
+
+    BranchSpec("bjet1_PT", "f", "bjet1", None, "Pt"),
+    BranchSpec("bjet1_Eta", "f", "bjet1", None, "Eta"),
+    BranchSpec("bjet1_Phi", "f", "bjet1", None, "Phi"),
+    BranchSpec("bjet1_p4", "f", "bjet1", None, "P4", 4),
+
+    BranchSpec("bjet2_PT", "f", "bjet2", None, "Pt"),
+    BranchSpec("bjet2_Eta", "f", "bjet2", None, "Eta"),
+    BranchSpec("bjet2_Phi", "f", "bjet2", None, "Phi"),
+    BranchSpec("bjet2_p4", "f", "bjet2", None, "P4", 4),
+]
+# fmt: on
+
+# Branches read by the MoMEMta drivers in momemta/
+MOMEMTA_BRANCHES = [
+    "run_number",
+    "event_number",
+    "lep1_PID",
+    "lep1_p4",
+    "lep2_p4",
+    "bjet1_p4",
+    "bjet2_p4",
+]
+
+
+def _nth_p4(collection, index):
+    def p4(event):
+        objects = getattr(event, collection)
+        return objects[index].P4() if len(objects) > index else None
+
+    return p4
+
+
+def _met_invismu(event):
+    if event.met is None:
+        return None
+    muons_momentum = ROOT.TLorentzVector()
+    muons_momentum.SetPtEtaPhiM(0, 0, 0, 0)
+    for muon in event.muons:
+        muons_momentum += muon.P4()
+    return event.met + muons_momentum
+
+
+def _dijet(event):
+    if len(event.excl_jets) < 2:
+        return None
+    return event.excl_jets[0].P4() + event.excl_jets[1].P4()
+
+
+# Four vectors of an event available as sources of the specs
+EVENT_VECTORS = {
+    "met": attrgetter("met"),
+    "met_invismu": _met_invismu,
+    # event.sorted_leptons are pT sorted in descending order
+    "lep1": _nth_p4("sorted_leptons", 0),
+    "lep2": _nth_p4("sorted_leptons", 1),
+    # non-b/tau-jets
+    "jet1": _nth_p4("excl_jets", 0),
+    "jet2": _nth_p4("excl_jets", 1),
+    "dijet": _dijet,
+    "bjet1": _nth_p4("sorted_bjets", 0),
+    "bjet2": _nth_p4("sorted_bjets", 1),
+}
+
+
+def _p4_components(p4):
+    return p4.Px(), p4.Py(), p4.Pz(), p4.E()
+
+
+def file_uuid(path):
+    """
+    UUID of a ROOT file, which ROOT writes into every file it creates and which
+    stays the same when the file is moved or copied.
+    """
+    root_file = ROOT.TFile.Open(path)
+    if not root_file or root_file.IsZombie():
+        raise OSError(f"Cannot open {path}")
+    uuid = root_file.GetUUID().AsString()
+    root_file.Close()
+    return uuid
+
+
+def run_number(path):
+    """
+    Number identifying the events of a Delphes file. Delphes events carry an
+    event number but no run number, so this is a 63 bit hash of the UUID of the
+    file, which unlike its path differs between files written to the same path
+    and is kept when the file is moved.
+    """
+    digest = hashlib.sha256(file_uuid(path).encode()).digest()
+    return int.from_bytes(digest[:8], "big") & 0x7FFFFFFFFFFFFFFF
+
+
+# PDG ID of the negatively charged lepton of each Delphes lepton class
+lepton_pids = {"Electron": 11, "Muon": 13}
+
+
+def lepton_pid(lepton):
+    """
+    PDG ID of a Delphes electron or muon from its class and charge. Delphes
+    leptons are smeared generator leptons, so this is the PID of the generator
+    particle without following the TRef to it.
+    """
+    return -lepton_pids[type(lepton).__name__] * lepton.Charge
+
+
+def truth_lepton_pid(lepton):
+    """
+    PDG ID of the generator particle referenced by the lepton.
+    """
+    return lepton.Particle.GetObject().PID
+
+
+# Copies rows of buffered NumPy columns into the buffers bound to the branches
+# of a tree and fills it, so that flushing a batch of events is a single call
+ROOT.gInterpreter.Declare(
+    """
+#include <cstring>
+#include "TTree.h"
+
+void hists_fill_tree(TTree *tree, Long64_t nentries, int ncolumns,
+                     const ULong64_t *columns, const ULong64_t *buffers,
+                     const ULong64_t *row_sizes)
+{
+    for (Long64_t entry = 0; entry < nentries; ++entry) {
+        for (int column = 0; column < ncolumns; ++column) {
+            std::memcpy(reinterpret_cast<char *>(buffers[column]),
+                        reinterpret_cast<const char *>(columns[column])
+                            + entry * row_sizes[column],
+                        row_sizes[column]);
+        }
+        tree->Fill();
+    }
+}
+"""
+)
+
+# ROOT leaf types and NumPy types of the array typecodes of the tree branches
+leaf_types = {"f": "F", "i": "I", "q": "L"}
+column_dtypes = {"f": np.float32, "i": np.int32, "q": np.int64}
 
 
 class Hists:
+    # Delphes branches read by fill, beyond those of DelphesEvent
+    delphes_branches = []
+    # Delphes branches additionally read when truth_pid is set
+    truth_delphes_branches = ["Particle"]
+
     def add_branch(self, branch_name, branch_type, branch_len=1, default=0):
         self.branches[branch_name] = array(branch_type, branch_len * [default])
         branch_name_mod = branch_name
@@ -78,13 +458,28 @@ class Hists:
         self.tree.Branch(
             branch_name,
             self.branches[branch_name],
-            f"{branch_name_mod}/{branch_type.upper()}",
-        )
-
-    def __init__(self, tag, topdir, detaillevel=99):
+            f"{branch_name_mod}/{leaf_types[branch_type]}",
+        )
+
+    def __init__(
+        self,
+        tag,
+        topdir,
+        detaillevel=99,
+        truth_pid=False,
+        branches=None,
+        batch_size=10000,
+    ):
+        """
+        Book the HIST_SPECS histograms and the BRANCH_SPECS branches of the
+        hftree, or only the named branches if branches is given. The histogram
+        fills and branch values of up to batch_size events are buffered before
+        they are written to the histograms and the hftree.
+        """
         self.topdir = topdir
         self.hists = {}
         self.tag = tag
+        self.lepton_pid = truth_lepton_pid if truth_pid else lepton_pid
 
         self.newdir = topdir.mkdir(tag)
         self.newdir.cd()
@@ -92,245 +487,170 @@ class Hists:
         self.detaillevel = detaillevel
         self.collections = {}
 
-        # Make all the histograms here (!)
-
-        # Basics
-        self.hists["nElec"] = TH1F(
-            "h_" + tag + "_nElec", tag + "_nElec;Number of Electrons;Events", 10, 0, 10
-        )
-        self.hists["nMuon"] = TH1F(
-            "h_" + tag + "_nMuon", tag + "_nMuon;Number of Muons;Events", 10, 0, 10
-        )
-        self.hists["nTau"] = TH1F(
-            "h_" + tag + "_nTau", tag + "_nTau;Number of Taus;Events", 10, 0, 10
-        )
-        self.hists["nbjets"] = TH1F(
-            "h_" + tag + "_nbjets", tag + "_nbjets;Number of b-jets;Events", 10, 0, 10
-        )
-        self.hists["njet"] = TH1F(
-            "h_" + tag + "_njets", tag + "_njets;Number of jets;Events", 10, 0, 10
-        )
-        self.hists["nleptons"] = TH1F(
-            "h_" + tag + "_nleptons",
-            tag + "_nleptons;Number of Leptons (e/#mu);Events",
-            10,
-            0,
-            10,
-        )
-
-        # B-jets
-        self.hists["bPT"] = TH1F(
-            "h_" + tag + "_bPT", tag + "_bPT;p_{T,b-jets};Events/(10GeV)", 50, 0, 500
-        )
-        self.hists["bPhi"] = TH1F(
-            "h_" + tag + "_bPhi", tag + "_bPhi;#phi(b-jets);Events/(0.4)", 20, -4, 4
-        )
-        self.hists["bEta"] = TH1F(
-            "h_" + tag + "_bEta", tag + "_bEta;#eta(b-jets);Events/(0.5)", 20, -5, 5
-        )
-
-        # Jets
-        self.hists["jPT"] = TH1F(
-            "h_" + tag + "_jPT", tag + "_jPT;p_{T,jets};Events/(10GeV)", 50, 0, 500
-        )
-        self.hists["jPhi"] = TH1F(
-            "h_" + tag + "_jPhi", tag + "_jPhi;#phi(jets);Events/(0.4)", 20, -4, 4
-        )
-        self.hists["jEta"] = TH1F(
-            "h_" + tag + "_jEta", tag + "_jEta;#eta(jets);Events/(0.5)", 20, -5, 5
-        )
-        self.hists["mjj"] = TH1F(
-            "h_" + tag + "_mjj", tag + "_mjj;m(jj);Events/(100 GeV)", 100, 0, 10000
-        )
-
-        # Electrons
-        self.hists["ePT"] = TH1F(
-            "h_" + tag + "_ePT", tag + "_ePT;p^{e}_{T};Events/(10GeV)", 50, 0, 500
-        )
-        self.hists["ePhi"] = TH1F(
-            "h_" + tag + "_ePhi", tag + "_ePhi;#phi(elecs);Events/(0.4)", 20, -4, 4
-        )
-        self.hists["eEta"] = TH1F(
-            "h_" + tag + "_eEta", tag + "_eEta;#eta(elecs);Events/(0.5)", 20, -5, 5
-        )
-        self.hists["lePT"] = TH1F(
-            "h_" + tag + "_lePT",
-            tag + "_lePT;p^{lead-e}_{T};Events/(10GeV)",
-            50,
-            0,
-            500,
-        )
-        self.hists["lePhi"] = TH1F(
-            "h_" + tag + "_lePhi",
-            tag + "_lePhi;#phi(leading-e);Events/(0.4)",
-            20,
-            -4,
-            4,
-        )
-        self.hists["leEta"] = TH1F(
-            "h_" + tag + "_leEta",
-            tag + "_leEta;#eta(leading-e);Events/(0.5)",
-            20,
-            -5,
-            5,
-        )
-
-        # Muons
-        self.hists["mPT"] = TH1F(
-            "h_" + tag + "_mPT", tag + "_mPT;p^{#mu}_{T};Events/(10GeV)", 50, 0, 500
-        )
-        self.hists["mPhi"] = TH1F(
-            "h_" + tag + "_mPhi", tag + "_mPhi;#phi(muons);Events/(0.4)", 20, -4, 4
-        )
-        self.hists["mEta"] = TH1F(
-            "h_" + tag + "_mEta", tag + "_mEta;#eta(muons);Events/(0.5)", 20, -5, 5
-        )
-        self.hists["lmPT"] = TH1F(
-            "h_" + tag + "_lmPT",
-            tag + "_lmPT;p^{lead-#mu}_{T};Events/(10GeV)",
-            50,
-            0,
-            500,
-        )
-        self.hists["lmPhi"] = TH1F(
-            "h_" + tag + "_lmPhi",
-            tag + "_lmPhi;#phi(leading-#mu);Events/(0.4)",
-            20,
-            -4,
-            4,
-        )
-        self.hists["lmEta"] = TH1F(
-            "h_" + tag + "_lmEta",
-            tag + "_lmEta;#eta(leading-#mu);Events/(0.5)",
-            20,
-            -5,
-            5,
-        )
-
-        # Taus
-        self.hists["tPT"] = TH1F(
-            "h_" + tag + "_tPT", tag + "_tPT;p^{#tau}_{T};Events/(10GeV)", 50, 0, 500
-        )
-        self.hists["tPhi"] = TH1F(
-            "h_" + tag + "_tPhi", tag + "_tPhi;#phi(taus);Events/(0.4)", 20, -4, 4
-        )
-        self.hists["tEta"] = TH1F(
-            "h_" + tag + "_tEta", tag + "_tEta;#eta(taus);Events/(0.5)", 20, -5, 5
-        )
-        self.hists["ltPT"] = TH1F(
-            "h_" + tag + "_ltPT",
-            tag + "_ltPT;p^{lead-#tau}_{T};Events/(10GeV)",
-            50,
-            0,
-            500,
-        )
-        self.hists["ltPhi"] = TH1F(
-            "h_" + tag + "_ltPhi",
-            tag + "_ltPhi;#phi(leading-#tau);Events/(0.4)",
-            20,
-            -4,
-            4,
-        )
-        self.hists["ltEta"] = TH1F(
-            "h_" + tag + "_ltEta",
-            tag + "_ltEta;#eta(leading-#tau);Events/(0.5)",
-            20,
-            -5,
-            5,
-        )
-
-        # MET
-        self.hists["MET"] = TH1F(
-            "h_" + tag + "_MET",
-            tag + "_MET;E_{T}^{miss} [GeV];Events/(10 GeV)",
-            100,
-            0,
-            1000,
-        )
-        self.hists["MET_invismu"] = TH1F(
-            "h_" + tag + "_MET_invismu",
-            tag + "_MET;E_{T}^{miss} [GeV];Events/(10 GeV)",
-            100,
-            0,
-            1000,
-        )
+        for spec in HIST_SPECS:
+            self.hists[spec.key] = TH1F(
+                f"h_{tag}_{spec.name}",
+                f"{tag}_{spec.title}",
+                spec.nbins,
+                spec.low,
+                spec.high,
+            )
 
         for i, j in self.hists.items():
             j.Sumw2()
 
+        # values and weights of the fills of each histogram not yet passed to
+        # FillN
+        self.hist_buffers = {key: (array("d"), array("d")) for key in self.hists}
+
         self.branches = {}
         self.tree = ROOT.TTree("hftree", "hftree")
-        self.add_branch("MET", "f")
-        self.add_branch("METPhi", "f")
-        self.add_branch("MET_invismu", "f")
-        self.add_branch("METPhi_invismu", "f")
-
-        self.add_branch("nElec", "i")
-        self.add_branch("nMuon", "i")
-        self.add_branch("nTau", "i")
-        self.add_branch("nbjets", "i")
-        self.add_branch("njet", "i")
-        self.add_branch("nleptons", "i")
-
-        # self.add_branch("lep1_p4", "TLorentzVector")
-        self.add_branch("lep1_PID", "i")
-        self.add_branch("lep1_Pt", "f")
-        self.add_branch("lep1_Eta", "f")
-        self.add_branch("lep1_Phi", "f")
-        self.add_branch("lep1_M", "f")
-
-        # Temporary hack to get 4-momentum components out
-        self.add_branch("lep1_Px", "f")
-        self.add_branch("lep1_Py", "f")
-        self.add_branch("lep1_Pz", "f")
-        self.add_branch("lep1_E", "f")
-
-        # self.add_branch("lep2_p4", "TLorentzVector")
-        self.add_branch("lep2_PID", "i")
-        self.add_branch("lep2_Pt", "f")
-        self.add_branch("lep2_Eta", "f")
-        self.add_branch("lep2_Phi", "f")
-        self.add_branch("lep2_M", "f")
-
-        # Temporary hack to get 4-momentum components out
-        self.add_branch("lep2_Px", "f")
-        self.add_branch("lep2_Py", "f")
-        self.add_branch("lep2_Pz", "f")
-        self.add_branch("lep2_E", "f")
-
-        self.add_branch("tau1PT", "f")
-        self.add_branch("tau1Eta", "f")
-        self.add_branch("tau1Phi", "f")
-
-        self.add_branch("j1PT", "f")
-        self.add_branch("j1Eta", "f")
-        self.add_branch("j1Phi", "f")
-        self.add_branch("j2PT", "f")
-        self.add_branch("j2Eta", "f")
-        self.add_branch("j2Phi", "f")
-        self.add_branch("mjj", "f")
-
-        self.add_branch("bjet1_PT", "f")
-        self.add_branch("bjet1_Eta", "f")
-        self.add_branch("bjet1_Phi", "f")
-        # Temporary hack to get 4-momentum components out
-        self.add_branch("bjet1_Px", "f")
-        self.add_branch("bjet1_Py", "f")
-        self.add_branch("bjet1_Pz", "f")
-        self.add_branch("bjet1_E", "f")
-
-        self.add_branch("bjet2_PT", "f")
-        self.add_branch("bjet2_Eta", "f")
-        self.add_branch("bjet2_Phi", "f")
-        # Temporary hack to get 4-momentum components out
-        self.add_branch("bjet2_Px", "f")
-        self.add_branch("bjet2_Py", "f")
-        self.add_branch("bjet2_Pz", "f")
-        self.add_branch("bjet2_E", "f")
-
+        for spec in BRANCH_SPECS:
+            if branches is None or spec.name in branches:
+                self.add_branch(spec.name, spec.type, spec.length)
         self.add_branch("weight", "f")
 
+        # seconds spent filling the tree, reported by the metrics of SimpleAna
+        self.tree_fill_seconds = 0.0
+
+        self._book_columns(batch_size)
+        self._compile_fill_plan()
+
+    def _book_columns(self, batch_size):
+        """
+        Preallocate a NumPy column of batch_size rows for each branch, preset
+        to default_fill, together with the addresses flush passes to
+        hists_fill_tree.
+        """
+        self.batch_size = batch_size
+        self.row = 0
+        self.columns = {}
+        for name, buffer in self.branches.items():
+            shape = (batch_size,) if len(buffer) == 1 else (batch_size, len(buffer))
+            self.columns[name] = np.full(
+                shape, default_fill, dtype=column_dtypes[buffer.typecode]
+            )
+
+        self._column_addresses = np.array(
+            [column.ctypes.data for column in self.columns.values()], dtype=np.uint64
+        )
+        self._buffer_addresses = np.array(
+            [buffer.buffer_info()[0] for buffer in self.branches.values()],
+            dtype=np.uint64,
+        )
+        self._row_sizes = np.array(
+            [column.strides[0] for column in self.columns.values()], dtype=np.uint64
+        )
+
+    def flush_hists(self):
+        """
+        Fill the buffered values into the histograms with FillN.
+        """
+        for key, (values, weights) in self.hist_buffers.items():
+            if len(values) > 0:
+                self.hists[key].FillN(
+                    len(values),
+                    np.frombuffer(values, dtype=np.float64),
+                    np.frombuffer(weights, dtype=np.float64),
+                )
+                del values[:]
+                del weights[:]
+
+    def flush(self):
+        """
+        Write the buffered events to the histograms and the hftree and reset the
+        buffers.
+        """
+        self.flush_hists()
+        if self.row == 0:
+            return
+        start = time.perf_counter()
+        ROOT.hists_fill_tree(
+            self.tree,
+            self.row,
+            len(self.columns),
+            self._column_addresses,
+            self._buffer_addresses,
+            self._row_sizes,
+        )
+        self.tree_fill_seconds += time.perf_counter() - start
+        for column in self.columns.values():
+            column.fill(default_fill)
+        self.row = 0
+
+    def _next_row(self):
+        self.row += 1
+        if self.row == self.batch_size:
+            self.flush()
+
+    def _resolver(self, source, objects):
+        """
+        Function of the event giving the object the values of a spec are taken
+        from, or None if the event has no such object.
+        """
+        if source in EVENT_VECTORS:
+            return EVENT_VECTORS[source]
+
+        collection = attrgetter(source)
+        if objects == "value":
+            return collection
+        if objects == "count":
+            return lambda event: len(collection(event))
+        if objects == "all":
+            return collection
+
+        index = objects
+
+        def nth(event):
+            selected = collection(event)
+            return selected[index] if len(selected) > index else None
+
+        return nth
+
+    def _getter(self, spec):
+        """
+        Function of the resolved object giving the value of a spec.
+        """
+        if spec.objects in ("count", "value"):
+            return int
+        if spec.attribute == "P4":
+            return _p4_components
+        if spec.source in EVENT_VECTORS:
+            return methodcaller(spec.attribute)
+        if spec.attribute == "PID":
+            return self.lepton_pid
+        return attrgetter(spec.attribute)
+
+    def _compile_fill_plan(self):
+        """
+        Group the histograms and branches by the object their values come from,
+        so that fill resolves each object once per event and then makes a flat
+        pass over precomputed (histogram buffers or branch column, getter)
+        pairs.
+        """
+        groups = {}
+        for spec in HIST_SPECS:
+            hist_fills, _ = groups.setdefault((spec.source, spec.objects), ([], []))
+            hist_fills.append((*self.hist_buffers[spec.key], self._getter(spec)))
+        for spec in BRANCH_SPECS:
+            if spec.name not in self.branches:
+                continue
+            _, branch_fills = groups.setdefault((spec.source, spec.objects), ([], []))
+            branch_fills.append((self.columns[spec.name], self._getter(spec)))
+
+        # histograms filled for every object of a collection
+        self.object_plan = []
+        # histograms and branch columns filled from a single object per event
+        self.value_plan = []
+        for (source, objects), (hist_fills, branch_fills) in groups.items():
+            resolve = self._resolver(source, objects)
+            if objects == "all":
+                self.object_plan.append((resolve, hist_fills))
+            else:
+                self.value_plan.append((resolve, hist_fills, branch_fills))
+
     def write(self):
+        self.flush()
         self.newdir.cd()
         for i, k in self.hists.items():
             k.Write()
@@ -340,6 +660,8 @@ class Hists:
         self.topdir.cd()
 
     def add(self, coll):
+        self.flush_hists()
+        coll.flush_hists()
         for i, k in self.hists.items():
             if i in coll.hists:
                 k.Add(coll.hists[i])
@@ -347,221 +669,93 @@ class Hists:
             if i in coll.collections:
                 k.add(coll.collections[i])
 
-    def fill(self, event, weight=0):
+    def load(self, topdir):
+        """
+        The histograms and tree written by Hists of the same tag to another
+        file, in a form that can be merged into these with add or merge.
+        """
+        directory = topdir.Get(self.tag)
+        loaded = Hists.__new__(Hists)
+        loaded.topdir = topdir
+        loaded.tag = self.tag
+        loaded.newdir = directory
+        loaded.detaillevel = self.detaillevel
+        loaded.collections = {}
+        loaded.hists = {
+            name: directory.Get(hist.GetName()) for name, hist in self.hists.items()
+        }
+        loaded.hist_buffers = {}
+        loaded.branches = {}
+        loaded.columns = {}
+        loaded.row = 0
+        loaded.tree_fill_seconds = 0.0
+        loaded.tree = directory.Get("hftree")
+        return loaded
+
+    def merge(self, coll):
+        """
+        Add the histograms of coll to these and append its tree entries.
+        """
+        self.flush()
+        coll.flush()
+        self.add(coll)
+        self.tree.CopyEntries(coll.tree)
+
+    def fill_arrays(self, values, columns):
+        """
+        Fill a whole chunk of events at once. values maps histogram names to
+        (values, weights) pairs of float64 arrays and columns maps output branch
+        names to arrays with one entry per event.
+        """
+        for name, (hist_values, hist_weights) in values.items():
+            if len(hist_values) > 0:
+                self.hists[name].FillN(
+                    len(hist_values),
+                    np.ascontiguousarray(hist_values, dtype=np.float64),
+                    np.ascontiguousarray(hist_weights, dtype=np.float64),
+                )
+
+        columns = {
+            name: np.asarray(column)
+            for name, column in columns.items()
+            if name in self.columns
+        }
+        nevents = len(columns["weight"])
+        start = 0
+        while start < nevents:
+            stop = min(start + self.batch_size - self.row, nevents)
+            for name, column in columns.items():
+                self.columns[name][self.row : self.row + stop - start] = column[
+                    start:stop
+                ]
+            self.row += stop - start
+            if self.row == self.batch_size:
+                self.flush()
+            start = stop
 
-        default_fill = -999
+    def fill(self, event, weight=0):
 
         for i, k in self.collections.items():
             k.fill(event, weight)
 
-        self.branches["weight"][0] = weight
-
-        # Do some characterizations
-        # event.sorted_leptons are pT sorted in descending order
-        leading_lepton = (
-            event.sorted_leptons[0] if len(event.sorted_leptons) > 0 else None
-        )
-        subleading_lepton = (
-            event.sorted_leptons[1] if len(event.sorted_leptons) > 1 else None
-        )
-
-        leading_bjet = event.sorted_bjets[0] if len(event.sorted_bjets) > 0 else None
-        subleading_bjet = event.sorted_bjets[1] if len(event.sorted_bjets) > 1 else None
-
-        muons_momentum = ROOT.TLorentzVector()
-        muons_momentum.SetPtEtaPhiM(0, 0, 0, 0)
-        for muon in event.muons:
-            muons_momentum += muon.P4()
-
-        # Fill generic hists
-        self.hists["nElec"].Fill(len(event.elecs), weight)
-        self.hists["nMuon"].Fill(len(event.muons), weight)
-        self.hists["nTau"].Fill(len(event.tau_tags), weight)
-        self.hists["nbjets"].Fill(len(event.btags), weight)
-        self.hists["njet"].Fill(len(event.jets), weight)
-        self.hists["nleptons"].Fill(len(event.leptons), weight)
-        self.hists["MET"].Fill(event.met.Pt(), weight)
-        self.hists["MET_invismu"].Fill((event.met + muons_momentum).Pt(), weight)
-
-        self.branches["MET"][0] = event.met.Pt()
-        self.branches["METPhi"][0] = event.met.Phi()
-        self.branches["MET_invismu"][0] = (event.met + muons_momentum).Pt()
-        self.branches["METPhi_invismu"][0] = (event.met + muons_momentum).Phi()
-        self.branches["nElec"][0] = len(event.elecs)
-        self.branches["nMuon"][0] = len(event.muons)
-        self.branches["nTau"][0] = len(event.tau_tags)
-        self.branches["nbjets"][0] = len(event.btags)
-        self.branches["njet"][0] = len(event.jets)
-        self.branches["nleptons"][0] = len(event.leptons)
-
-        # B-jets
-        for aBJet in event.btags:
-            self.hists["bPT"].Fill(aBJet.PT, weight)
-            self.hists["bEta"].Fill(aBJet.Eta, weight)
-            self.hists["bPhi"].Fill(aBJet.Phi, weight)
-
-        # Jets
-        for aJet in event.excl_jets:
-            self.hists["jPT"].Fill(aJet.PT, weight)
-            self.hists["jEta"].Fill(aJet.Eta, weight)
-            self.hists["jPhi"].Fill(aJet.Phi, weight)
-        if len(event.excl_jets) > 1:
-            mjj = (event.excl_jets[0].P4() + event.excl_jets[1].P4()).M()
-            self.hists["mjj"].Fill(mjj, weight)
-            self.branches["mjj"][0] = mjj
-        # Electrons
-        for aElec in event.elecs:
-            self.hists["ePT"].Fill(aElec.PT, weight)
-            self.hists["eEta"].Fill(aElec.Eta, weight)
-            self.hists["ePhi"].Fill(aElec.Phi, weight)
-        if len(event.elecs) > 0:
-            self.hists["lePT"].Fill(event.elecs[0].PT, weight)
-            self.hists["leEta"].Fill(event.elecs[0].Eta, weight)
-            self.hists["lePhi"].Fill(event.elecs[0].Phi, weight)
-
-        # Muons
-        for aMuon in event.muons:
-            self.hists["mPT"].Fill(aMuon.PT, weight)
-            self.hists["mEta"].Fill(aMuon.Eta, weight)
-            self.hists["mPhi"].Fill(aMuon.Phi, weight)
-        if len(event.muons) > 0:
-            self.hists["lmPT"].Fill(event.muons[0].PT, weight)
-            self.hists["lmEta"].Fill(event.muons[0].Eta, weight)
-            self.hists["lmPhi"].Fill(event.muons[0].Phi, weight)
-
-        # Taus
-        for aTau in event.tau_tags:
-            self.hists["tPT"].Fill(aTau.PT, weight)
-            self.hists["tEta"].Fill(aTau.Eta, weight)
-            self.hists["tPhi"].Fill(aTau.Phi, weight)
-        if len(event.tau_tags) > 0:
-            self.hists["ltPT"].Fill(event.tau_tags[0].PT, weight)
-            self.hists["ltEta"].Fill(event.tau_tags[0].Eta, weight)
-            self.hists["ltPhi"].Fill(event.tau_tags[0].Phi, weight)
-            self.branches["tau1PT"][0] = event.tau_tags[0].PT
-            self.branches["tau1Eta"][0] = event.tau_tags[0].Eta
-            self.branches["tau1Phi"][0] = event.tau_tags[0].Phi
-        else:
-            self.branches["tau1PT"][0] = default_fill
-            self.branches["tau1Eta"][0] = default_fill
-            self.branches["tau1Phi"][0] = default_fill
-
-        # b-jets
-        if leading_bjet:
-            leading_bjet_p4 = leading_bjet.P4()
-            self.branches["bjet1_PT"][0] = leading_bjet_p4.Pt()
-            self.branches["bjet1_Eta"][0] = leading_bjet_p4.Eta()
-            self.branches["bjet1_Phi"][0] = leading_bjet_p4.Phi()
-
-            self.branches["bjet1_Px"][0] = leading_bjet_p4.Px()
-            self.branches["bjet1_Px"][0] = leading_bjet_p4.Py()
-            self.branches["bjet1_Pz"][0] = leading_bjet_p4.Pz()
-            self.branches["bjet1_E"][0] = leading_bjet_p4.E()
-        else:
-            for branch_name in [
-                "bjet1_PT",
-                "bjet1_Eta",
-                "bjet1_Phi",
-                "bjet1_Px",
-                "bjet1_Py",
-                "bjet1_Pz",
-                "bjet1_E",
-            ]:
-                self.branches[branch_name][0] = default_fill
-
-        if subleading_bjet:
-            subleading_bjet_p4 = subleading_bjet.P4()
-            self.branches["bjet2_PT"][0] = subleading_bjet_p4.Pt()
-            self.branches["bjet2_Eta"][0] = subleading_bjet_p4.Eta()
-            self.branches["bjet2_Phi"][0] = subleading_bjet_p4.Phi()
-
-            self.branches["bjet2_Px"][0] = subleading_bjet_p4.Px()
-            self.branches["bjet2_Px"][0] = subleading_bjet_p4.Py()
-            self.branches["bjet2_Pz"][0] = subleading_bjet_p4.Pz()
-            self.branches["bjet2_E"][0] = subleading_bjet_p4.E()
-        else:
-            for branch_name in [
-                "bjet2_PT",
-                "bjet2_Eta",
-                "bjet2_Phi",
-                "bjet2_Px",
-                "bjet2_Py",
-                "bjet2_Pz",
-                "bjet2_E",
-            ]:
-                self.branches[branch_name][0] = default_fill
-
-        # non-b/tau-jets
-        if len(event.excl_jets) > 0:
-            self.branches["j1PT"][0] = event.excl_jets[0].P4().Pt()
-            self.branches["j1Eta"][0] = event.excl_jets[0].P4().Eta()
-            self.branches["j1Phi"][0] = event.excl_jets[0].P4().Phi()
-        else:
-            self.branches["j1PT"][0] = default_fill
-            self.branches["j1Eta"][0] = default_fill
-            self.branches["j1Phi"][0] = default_fill
-        if len(event.excl_jets) > 1:
-            self.branches["j2PT"][0] = event.excl_jets[1].P4().Pt()
-            self.branches["j2Eta"][0] = event.excl_jets[1].P4().Eta()
-            self.branches["j2Phi"][0] = event.excl_jets[1].P4().Phi()
-        else:
-            self.branches["j2PT"][0] = default_fill
-            self.branches["j2Eta"][0] = default_fill
-            self.branches["j2Phi"][0] = default_fill
-
-        # Leptons
-        if leading_lepton:
-            leading_lepton_p4 = leading_lepton.P4()
-            # self.branches["lep1_p4"][0] = leading_lepton
-            self.branches["lep1_PID"][0] = leading_lepton.Particle.GetObject().PID
-            self.branches["lep1_Pt"][0] = leading_lepton_p4.Pt()
-            self.branches["lep1_Eta"][0] = leading_lepton_p4.Eta()
-            self.branches["lep1_Phi"][0] = leading_lepton_p4.Phi()
-            self.branches["lep1_M"][0] = leading_lepton_p4.M()
-            # Temporary hack to get 4-momentum components out
-            self.branches["lep1_Px"][0] = leading_lepton_p4.Px()
-            self.branches["lep1_Py"][0] = leading_lepton_p4.Py()
-            self.branches["lep1_Pz"][0] = leading_lepton_p4.Pz()
-            self.branches["lep1_E"][0] = leading_lepton_p4.E()
-        else:
-            for branch_name in [
-                "lep1_PID",
-                "lep1_Pt",
-                "lep1_Eta",
-                "lep1_Phi",
-                "lep1_M",
-                "lep1_Px",
-                "lep1_Py",
-                "lep1_Pz",
-                "lep1_E",
-            ]:
-                self.branches[branch_name][0] = default_fill
-
-        if subleading_lepton:
-            subleading_lepton_p4 = subleading_lepton.P4()
-            # self.branches["lep1_p4"][0] = subleading_lepton
-            self.branches["lep2_PID"][0] = subleading_lepton.Particle.GetObject().PID
-            self.branches["lep2_Pt"][0] = subleading_lepton_p4.Pt()
-            self.branches["lep2_Eta"][0] = subleading_lepton_p4.Eta()
-            self.branches["lep2_Phi"][0] = subleading_lepton_p4.Phi()
-            self.branches["lep2_M"][0] = subleading_lepton_p4.M()
-            # Temporary hack to get 4-momentum components out
-            self.branches["lep2_Px"][0] = subleading_lepton_p4.Px()
-            self.branches["lep2_Py"][0] = subleading_lepton_p4.Py()
-            self.branches["lep2_Pz"][0] = subleading_lepton_p4.Pz()
-            self.branches["lep2_E"][0] = subleading_lepton_p4.E()
-        else:
-            for branch_name in [
-                "lep2_PID",
-                "lep2_Pt",
-                "lep2_Eta",
-                "lep2_Phi",
-                "lep2_M",
-                "lep2_Px",
-                "lep2_Py",
-                "lep2_Pz",
-                "lep2_E",
-            ]:
-                self.branches[branch_name][0] = default_fill
-
-        self.tree.Fill()
+        row = self.row
+        self.columns["weight"][row] = weight
+
+        for collection, hist_fills in self.object_plan:
+            objects = collection(event)
+            for values, weights, get in hist_fills:
+                values.extend(map(get, objects))
+                weights.extend(repeat(weight, len(objects)))
+
+        for resolve, hist_fills, branch_fills in self.value_plan:
+            value = resolve(event)
+            # the columns are preset to default_fill
+            if value is None:
+                continue
+            for values, weights, get in hist_fills:
+                values.append(get(value))
+                weights.append(weight)
+            for column, get in branch_fills:
+                column[row] = get(value)
+
+        self._next_row()
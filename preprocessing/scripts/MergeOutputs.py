@@ -0,0 +1,282 @@
+# Merge preprocessing_output.root or momemta_weights.root files of many jobs
+# into a single file with a tree of parallel merges, replacing hadd, skipping
+# unreadable files and appending new files to an existing merged file
+import argparse
+import json
+import multiprocessing
+import os
+import shutil
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
+import ROOT
+from HistCollections import Hists
+
+# directories of Hists in the preprocessing outputs
+hists_tags = ["all_events", "event_selection"]
+# name of the record of the files merged into an output
+record_name = "merged_files"
+
+
+def hftree_branches(root_file):
+    """
+    Names of the hftree branches booked by Hists, without the event weight.
+    """
+    tree = root_file.Get(f"{hists_tags[0]}/hftree")
+    return sorted(
+        branch.GetName()
+        for branch in tree.GetListOfBranches()
+        if branch.GetName() != "weight"
+    )
+
+
+def inspect_file(path):
+    """
+    Kind of output of a file ("preprocessing" or "momemta") and its tree
+    branches, or None and the reason the file can't be merged.
+    """
+    root_file = ROOT.TFile.Open(path)
+    if not root_file or root_file.IsZombie():
+        return None, "unreadable or zombie file"
+    try:
+        if root_file.TestBit(ROOT.TFile.kRecovered):
+            return None, "file was not closed, keys were recovered"
+        if root_file.Get("momemta"):
+            tree = root_file.Get("momemta")
+            branches = sorted(branch.GetName() for branch in tree.GetListOfBranches())
+            return ("momemta", branches), None
+        for tag in hists_tags:
+            if not root_file.Get(f"{tag}/hftree"):
+                return None, f"no {tag}/hftree"
+        return ("preprocessing", hftree_branches(root_file)), None
+    finally:
+        root_file.Close()
+
+
+def quiet_root():
+    """
+    Silence the errors of ROOT about the files, their reasons are reported
+    instead.
+    """
+    ROOT.gErrorIgnoreLevel = ROOT.kFatal
+
+
+def read_record(path):
+    """
+    Absolute paths of the files merged into an output by earlier merges.
+    """
+    root_file = ROOT.TFile.Open(path)
+    record = root_file.Get(record_name)
+    merged = json.loads(record.GetTitle())["files"] if record else []
+    root_file.Close()
+    return merged
+
+
+def write_record(path, merged):
+    root_file = ROOT.TFile.Open(path, "UPDATE")
+    ROOT.TNamed(record_name, json.dumps({"files": merged})).Write(
+        "", ROOT.TObject.kOverwrite
+    )
+    root_file.Close()
+
+
+def merge_files(output, paths, kind="preprocessing", branches=None):
+    """
+    Merge the files into the output one at a time, in their order. The
+    histograms of the preprocessing outputs are summed with Hists.add and the
+    hftree or momemta trees are concatenated.
+    """
+    outfile = ROOT.TFile.Open(output, "RECREATE")
+    if kind == "momemta":
+        tree = None
+        for path in paths:
+            root_file = ROOT.TFile.Open(path)
+            if tree is None:
+                outfile.cd()
+                tree = root_file.Get("momemta").CloneTree(0)
+                tree.SetDirectory(outfile)
+            tree.CopyEntries(root_file.Get("momemta"))
+            root_file.Close()
+        outfile.cd()
+        tree.Write()
+        outfile.Close()
+        return
+
+    hists = [Hists(tag, outfile, branches=branches) for tag in hists_tags]
+    for path in paths:
+        root_file = ROOT.TFile.Open(path)
+        for coll in hists:
+            coll.merge(coll.load(root_file))
+        root_file.Close()
+    for coll in hists:
+        coll.write()
+    outfile.Close()
+
+
+def merge_group(group):
+    merge_files(**group)
+    return group["output"]
+
+
+def merge_tree(output, paths, kind, branches, jobs, fan_in, work_dir):
+    """
+    Merge the files in levels of parallel merges of fan_in contiguous files
+    each, until fan_in or fewer files are left to merge into the output. The
+    groups are contiguous, so the order of the entries is that of the files.
+    """
+    level = 0
+    with ProcessPoolExecutor(
+        max_workers=jobs, mp_context=multiprocessing.get_context("spawn")
+    ) as executor:
+        while len(paths) > fan_in:
+            groups = [
+                dict(
+                    output=os.path.join(work_dir, f"level_{level}_{idx:05d}.root"),
+                    paths=paths[start : start + fan_in],
+                    kind=kind,
+                    branches=branches,
+                )
+                for idx, start in enumerate(range(0, len(paths), fan_in))
+            ]
+            print(f"Merging {len(paths)} files into {len(groups)} files")
+            sys.stdout.flush()
+            merged = list(executor.map(merge_group, groups))
+            # only remove the merges of earlier levels, never the inputs
+            if level > 0:
+                for path in paths:
+                    os.remove(path)
+            paths = merged
+            level += 1
+    merge_files(output, paths, kind, branches)
+
+
+def read_file_list(path):
+    with open(path) as file_list:
+        return [line.strip() for line in file_list if line.strip()]
+
+
+def main(args):
+    paths = list(args.files)
+    if args.file_list:
+        paths += read_file_list(args.file_list)
+
+    appending = args.append and os.path.exists(args.output)
+    merged = []
+    if appending:
+        merged = read_record(args.output)
+        if not merged:
+            print(f"\nERROR: {args.output} has no record of the files merged into it.")
+            print("       Merge all the files again without --append.\n")
+            sys.exit(1)
+        already_merged = set(merged)
+        new_paths = [p for p in paths if os.path.abspath(p) not in already_merged]
+        print(f"Skipping {len(paths) - len(new_paths)} files already in {args.output}")
+        paths = new_paths
+    output_path = os.path.abspath(args.output)
+    paths = [path for path in paths if os.path.abspath(path) != output_path]
+    if not paths:
+        print(f"No new files to merge into {args.output}")
+        return
+
+    with ProcessPoolExecutor(
+        max_workers=args.jobs,
+        mp_context=multiprocessing.get_context("spawn"),
+        initializer=quiet_root,
+    ) as executor:
+        inspected = list(executor.map(inspect_file, paths))
+
+    valid = []
+    skipped = []
+    reference = None
+    for path, (layout, reason) in zip(paths, inspected):
+        if layout is not None and reference is None:
+            reference = layout
+        if layout is not None and layout != reference:
+            reason = f"other contents than {valid[0]}"
+        if reason is None:
+            valid.append(path)
+        else:
+            skipped.append((path, reason))
+
+    if skipped:
+        print(f"\nWARNING: Skipping {len(skipped)} of {len(paths)} files:")
+        for path, reason in skipped:
+            print(f"    {path}: {reason}")
+        print("")
+    if not valid:
+        print("\nERROR: There are no files to merge.\n")
+        sys.exit(1)
+
+    kind, branches = reference
+    inputs = valid
+    if appending:
+        existing_layout, reason = inspect_file(args.output)
+        if existing_layout != reference:
+            print(
+                f"\nERROR: {args.output} can't be appended to: {reason or 'other contents'}"
+            )
+            print("       Merge all the files again without --append.\n")
+            sys.exit(1)
+        inputs = [args.output] + valid
+
+    # next to the output first, as the output is one of the inputs when appending
+    work_dir = f"{args.output}.merge"
+    shutil.rmtree(work_dir, ignore_errors=True)
+    os.makedirs(work_dir)
+    tmp_output = os.path.join(work_dir, "merged.root")
+    try:
+        merge_tree(
+            tmp_output,
+            inputs,
+            kind,
+            branches if kind == "preprocessing" else None,
+            args.jobs,
+            args.fan_in,
+            work_dir,
+        )
+        write_record(tmp_output, merged + [os.path.abspath(path) for path in valid])
+        os.replace(tmp_output, args.output)
+    finally:
+        shutil.rmtree(work_dir)
+
+    print(f"Merged {len(valid)} {kind} files into {args.output}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "files",
+        nargs="*",
+        help="preprocessing_output.root or momemta_weights.root files to merge",
+    )
+    parser.add_argument(
+        "--file-list",
+        action="store",
+        default=None,
+        help="File with the paths of the files to merge, one per line",
+    )
+    parser.add_argument("--output", action="store", required=True)
+    parser.add_argument(
+        "--jobs",
+        action="store",
+        type=int,
+        default=os.cpu_count(),
+        help="Number of merges to run at once",
+    )
+    parser.add_argument(
+        "--fan-in",
+        action="store",
+        type=int,
+        default=32,
+        help="Number of files merged by each merge",
+    )
+    parser.add_argument(
+        "--append",
+        action="store_true",
+        help="Append the files not yet merged into an existing output, instead of merging all the files again",
+    )
+    args = parser.parse_args()
+    if args.fan_in < 2:
+        parser.error("--fan-in has to be at least 2")
+
+    main(args)
@@ -0,0 +1,180 @@
+# Time spent in each stage of a SimpleAna run, with the throughput, bytes read
+# and memory use, written to a JSON metrics file and optionally sampled to a
+# JSON Lines time series during the run for the batch monitoring
+import json
+import os
+import resource
+import time
+
+# Stages of the event processing:
+#   io: reading the events (GetEntry, or the arrays of the columnar engine)
+#   selection: the object selection (DelphesEvent.select), or the columnar
+#     selection with the kinematics of the selected objects
+#   hists_fill: the kinematics of the loop engine, and buffering and filling
+#     the histograms, without the tree fills
+#   tree_fill: filling the hftrees (TTree::Fill of the buffered events)
+#   write: writing the histograms and trees to the output file
+STAGES = ["io", "selection", "hists_fill", "tree_fill", "write"]
+
+
+def series_path(path):
+    return f"{path}.series.jsonl"
+
+
+def bytes_read():
+    """
+    Bytes read by the process so far, including those served from the page
+    cache, or 0 where /proc is not available.
+    """
+    try:
+        with open("/proc/self/io") as io_file:
+            for line in io_file:
+                if line.startswith("rchar:"):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return 0
+
+
+def rss_mb():
+    """
+    Current resident memory of the process in MB, or 0 where /proc is not
+    available.
+    """
+    try:
+        with open("/proc/self/statm") as statm_file:
+            pages = int(statm_file.read().split()[1])
+    except OSError:
+        return 0
+    return pages * os.sysconf("SC_PAGE_SIZE") / 2**20
+
+
+def peak_rss_mb():
+    # ru_maxrss is in kB on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+class Metrics:
+    """
+    Accumulates the seconds spent in each of the STAGES and the number of
+    processed events. With a path the metrics are written at the end of the
+    run, and with an interval they are also sampled every interval seconds.
+    """
+
+    def __init__(self, path=None, interval=0):
+        self.path = path
+        self.interval = interval
+        self.stages = dict.fromkeys(STAGES, 0.0)
+        self.events = 0
+        self.started_at = time.monotonic()
+        self.start_bytes = bytes_read()
+        self.series = None
+        if path and interval > 0:
+            self.series = open(series_path(path), "w")
+        self.sampled_at = self.started_at
+        self.sampled_events = 0
+
+    def add(self, stage, seconds):
+        self.stages[stage] += seconds
+
+    def call(self, stage, function, *args):
+        """
+        Call the function, adding the time it takes to the stage.
+        """
+        start = time.perf_counter()
+        result = function(*args)
+        self.add(stage, time.perf_counter() - start)
+        return result
+
+    def timed(self, iterable, stage):
+        """
+        The items of the iterable, adding the time taken to produce each of
+        them to the stage.
+        """
+        iterator = iter(iterable)
+        while True:
+            start = time.perf_counter()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                return
+            finally:
+                self.add(stage, time.perf_counter() - start)
+            yield item
+
+    def summary(self, hists=()):
+        """
+        The metrics of the run so far. The tree fills happen inside the
+        histogram fills of the hists, so their time is moved from hists_fill
+        to tree_fill.
+        """
+        stages = dict(self.stages)
+        tree_fill = sum(coll.tree_fill_seconds for coll in hists)
+        stages["hists_fill"] -= tree_fill
+        stages["tree_fill"] += tree_fill
+
+        elapsed = time.monotonic() - self.started_at
+        return {
+            "events": self.events,
+            "seconds": elapsed,
+            "events_per_second": self.events / elapsed if elapsed > 0 else 0,
+            "stages": stages,
+            "bytes_read": bytes_read() - self.start_bytes,
+            "rss_mb": rss_mb(),
+            "peak_rss_mb": peak_rss_mb(),
+        }
+
+    def maybe_sample(self, events, hists=()):
+        self.events = events
+        if self.series is None:
+            return
+        now = time.monotonic()
+        if now - self.sampled_at < self.interval:
+            return
+        sample = self.summary(hists)
+        # the rate since the previous sample, which shows slowdowns during the run
+        sample["events_per_second"] = (events - self.sampled_events) / (
+            now - self.sampled_at
+        )
+        self.series.write(json.dumps(sample) + "\n")
+        self.series.flush()
+        self.sampled_at = now
+        self.sampled_events = events
+
+    def write(self, events, hists=()):
+        self.events = events
+        if self.series is not None:
+            self.series.close()
+            self.series = None
+        if not self.path:
+            return
+        with open(self.path, "w") as metrics_file:
+            json.dump(self.summary(hists), metrics_file, indent=2)
+
+
+def combine_metrics(paths, output, seconds):
+    """
+    Write the metrics of the shards of a run in parallel processes as a single
+    metrics file of the whole run, which took seconds.
+    """
+    shards = []
+    for path in paths:
+        with open(path) as metrics_file:
+            shards.append(json.load(metrics_file))
+
+    events = sum(shard["events"] for shard in shards)
+    combined = {
+        "events": events,
+        "seconds": seconds,
+        "events_per_second": events / seconds if seconds > 0 else 0,
+        # summed over the processes, so in CPU seconds
+        "stages": {
+            stage: sum(shard["stages"][stage] for shard in shards) for stage in STAGES
+        },
+        "bytes_read": sum(shard["bytes_read"] for shard in shards),
+        "rss_mb": sum(shard["rss_mb"] for shard in shards),
+        "peak_rss_mb": max((shard["peak_rss_mb"] for shard in shards), default=0),
+        "shards": shards,
+    }
+    with open(output, "w") as metrics_file:
+        json.dump(combined, metrics_file, indent=2)
@@ -0,0 +1,561 @@
+# RDataFrame counterpart of HistCollections.DelphesEvent and Hists.fill: the
+# same event_cuts, histograms and hftree branches are computed in compiled code
+# by an RDataFrame event loop, which runs on all cores with EnableImplicitMT
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+import numpy as np
+import ROOT
+from HistCollections import (
+    BRANCH_SPECS,
+    EVENT_VECTORS,
+    HIST_SPECS,
+    EventCuts,
+    default_fill,
+    run_number,
+)
+from Metrics import Metrics
+
+# Selection of the DelphesEvent collections and four vectors of RVec columns of
+# the Delphes branches, with the arithmetic of the TLorentzVectors of the loop.
+# Collections are RVecs of the indices of their objects in the Delphes branch,
+# where the leptons index the electrons as i and the muons as -(i + 1), and
+# four vectors are RVecs with the vector, or empty if there is no such object.
+ROOT.gInterpreter.Declare(
+    """
+#include <algorithm>
+#include <cmath>
+#include "ROOT/RVec.hxx"
+#include "TLorentzVector.h"
+
+using ROOT::VecOps::RVec;
+
+template <typename T>
+RVec<int> rdf_select(const RVec<T> &pt, const RVec<T> &eta, double pt_cut,
+                     double eta_cut)
+{
+    RVec<int> selected;
+    for (std::size_t idx = 0; idx < pt.size(); ++idx)
+        if (pt[idx] > pt_cut && std::abs(eta[idx]) < eta_cut)
+            selected.push_back(idx);
+    return selected;
+}
+
+template <typename Tag>
+RVec<int> rdf_exclusive(const RVec<int> &jets, const RVec<Tag> &btag,
+                        const RVec<Tag> &tautag)
+{
+    RVec<int> selected;
+    for (int idx : jets)
+        if (!(tautag[idx] || btag[idx]))
+            selected.push_back(idx);
+    return selected;
+}
+
+template <typename Tag>
+RVec<int> rdf_tagged(const RVec<Tag> &tag)
+{
+    RVec<int> selected;
+    for (std::size_t idx = 0; idx < tag.size(); ++idx)
+        if (tag[idx])
+            selected.push_back(idx);
+    return selected;
+}
+
+template <typename T, typename Tag>
+RVec<int> rdf_btags(const RVec<Tag> &btag, const RVec<T> &eta, double eta_cut)
+{
+    RVec<int> selected;
+    for (std::size_t idx = 0; idx < btag.size(); ++idx)
+        if (btag[idx] && std::abs(eta[idx]) < eta_cut)
+            selected.push_back(idx);
+    return selected;
+}
+
+RVec<int> rdf_leptons(const RVec<int> &elecs, const RVec<int> &muons)
+{
+    RVec<int> leptons(elecs);
+    for (int idx : muons)
+        leptons.push_back(-(idx + 1));
+    return leptons;
+}
+
+template <typename T>
+T rdf_lepton_value(int lepton, const RVec<T> &elec_values, const RVec<T> &muon_values)
+{
+    return lepton >= 0 ? elec_values[lepton] : muon_values[-(lepton + 1)];
+}
+
+// stable and in descending order, like sorted(..., reverse=True)
+template <typename T>
+RVec<int> rdf_sort_by_pt(const RVec<int> &indices, const RVec<T> &pt)
+{
+    RVec<int> sorted(indices);
+    std::stable_sort(sorted.begin(), sorted.end(),
+                     [&pt](int a, int b) { return pt[a] > pt[b]; });
+    return sorted;
+}
+
+template <typename T>
+RVec<int> rdf_sort_leptons(const RVec<int> &leptons, const RVec<T> &elec_pt,
+                           const RVec<T> &muon_pt)
+{
+    RVec<int> sorted(leptons);
+    std::stable_sort(sorted.begin(), sorted.end(), [&](int a, int b) {
+        return rdf_lepton_value(a, elec_pt, muon_pt) >
+               rdf_lepton_value(b, elec_pt, muon_pt);
+    });
+    return sorted;
+}
+
+template <typename T>
+RVec<double> rdf_take(const RVec<int> &indices, const RVec<T> &values)
+{
+    RVec<double> taken;
+    for (int idx : indices)
+        taken.push_back(values[idx]);
+    return taken;
+}
+
+template <typename T>
+RVec<double> rdf_lepton_take(const RVec<int> &leptons, const RVec<T> &elec_values,
+                             const RVec<T> &muon_values)
+{
+    RVec<double> taken;
+    for (int lepton : leptons)
+        taken.push_back(rdf_lepton_value(lepton, elec_values, muon_values));
+    return taken;
+}
+
+// PDG ID of the generator lepton from the collection and the charge
+template <typename T>
+RVec<double> rdf_lepton_pids(const RVec<int> &leptons, const RVec<T> &elec_charge,
+                             const RVec<T> &muon_charge)
+{
+    RVec<double> pids;
+    for (int lepton : leptons)
+        pids.push_back(lepton >= 0 ? -11. * elec_charge[lepton]
+                                   : -13. * muon_charge[-(lepton + 1)]);
+    return pids;
+}
+
+RVec<double> rdf_nth(const RVec<double> &values, std::size_t index)
+{
+    return values.size() > index ? RVec<double>{values[index]} : RVec<double>{};
+}
+
+TLorentzVector rdf_p4(double pt, double eta, double phi, double mass)
+{
+    TLorentzVector p4;
+    p4.SetPtEtaPhiM(pt, eta, phi, mass);
+    return p4;
+}
+
+template <typename T>
+RVec<TLorentzVector> rdf_nth_p4(const RVec<int> &indices, std::size_t index,
+                                const RVec<T> &pt, const RVec<T> &eta,
+                                const RVec<T> &phi, const RVec<T> &mass)
+{
+    if (indices.size() <= index)
+        return {};
+    int idx = indices[index];
+    return {rdf_p4(pt[idx], eta[idx], phi[idx], mass[idx])};
+}
+
+template <typename T>
+RVec<TLorentzVector> rdf_nth_lepton_p4(const RVec<int> &leptons, std::size_t index,
+                                       const RVec<T> &elec_pt, const RVec<T> &elec_eta,
+                                       const RVec<T> &elec_phi, const RVec<T> &muon_pt,
+                                       const RVec<T> &muon_eta, const RVec<T> &muon_phi)
+{
+    if (leptons.size() <= index)
+        return {};
+    int lepton = leptons[index];
+    return {rdf_p4(rdf_lepton_value(lepton, elec_pt, muon_pt),
+                   rdf_lepton_value(lepton, elec_eta, muon_eta),
+                   rdf_lepton_value(lepton, elec_phi, muon_phi), 0.)};
+}
+
+template <typename T>
+RVec<TLorentzVector> rdf_met(const RVec<T> &met, const RVec<T> &eta, const RVec<T> &phi)
+{
+    if (met.empty())
+        return {};
+    return {rdf_p4(met[0], eta[0], phi[0], 0.)};
+}
+
+// TLorentzVector sum of the MET and all selected muons, summed in order
+template <typename T>
+RVec<TLorentzVector> rdf_met_invismu(const RVec<TLorentzVector> &met,
+                                     const RVec<int> &muons, const RVec<T> &pt,
+                                     const RVec<T> &eta, const RVec<T> &phi)
+{
+    if (met.empty())
+        return {};
+    TLorentzVector muons_momentum = rdf_p4(0., 0., 0., 0.);
+    for (int idx : muons)
+        muons_momentum += rdf_p4(pt[idx], eta[idx], phi[idx], 0.);
+    return {met[0] + muons_momentum};
+}
+
+RVec<TLorentzVector> rdf_dijet(const RVec<TLorentzVector> &jet1,
+                               const RVec<TLorentzVector> &jet2)
+{
+    if (jet2.empty())
+        return {};
+    return {jet1[0] + jet2[0]};
+}
+"""
+)
+
+# Copy of the entries of a snapshot into the branch buffers of an hftree, in the
+# order of their input_entry as the threads of the event loop snapshot them in
+# no particular order
+ROOT.gInterpreter.Declare(
+    """
+#include <string>
+#include <vector>
+#include "TTree.h"
+#include "TTreeIndex.h"
+
+Long64_t rdf_copy_snapshot(TTree *snapshot, TTree *tree,
+                           const std::vector<std::string> &columns,
+                           const std::vector<ULong64_t> &buffers)
+{
+    snapshot->SetBranchStatus("*", false);
+    snapshot->SetBranchStatus("input_entry", true);
+    for (std::size_t idx = 0; idx < columns.size(); ++idx) {
+        snapshot->SetBranchStatus(columns[idx].c_str(), true);
+        snapshot->SetBranchAddress(columns[idx].c_str(),
+                                   reinterpret_cast<void *>(buffers[idx]));
+    }
+    snapshot->BuildIndex("input_entry");
+    auto index = static_cast<TTreeIndex *>(snapshot->GetTreeIndex());
+    const Long64_t *entries = index->GetIndex();
+    for (Long64_t idx = 0; idx < index->GetN(); ++idx) {
+        snapshot->GetEntry(entries[idx]);
+        tree->Fill();
+    }
+    snapshot->ResetBranchAddresses();
+    return index->GetN();
+}
+"""
+)
+
+# C++ expressions of the DelphesEvent collections and of the EVENT_VECTORS
+COLLECTIONS = {
+    "elecs": "rdf_select(Electron.PT, Electron.Eta, {electron_pt}, {electron_eta})",
+    "muons": "rdf_select(Muon.PT, Muon.Eta, {muon_pt}, {muon_eta})",
+    "leptons": "rdf_leptons(elecs, muons)",
+    "sorted_leptons": "rdf_sort_leptons(leptons, Electron.PT, Muon.PT)",
+    "jets": "rdf_select(Jet.PT, Jet.Eta, {jet_pt}, {jet_eta})",
+    "excl_jets": "rdf_exclusive(jets, Jet.BTag, Jet.TauTag)",
+    "tau_tags": "rdf_tagged(Jet.TauTag)",
+    "btags": "rdf_btags(Jet.BTag, Jet.Eta, {btag_eta})",
+    "sorted_jets": "rdf_sort_by_pt(jets, Jet.PT)",
+    "sorted_bjets": "rdf_sort_by_pt(btags, Jet.PT)",
+}
+lepton_collections = ["leptons", "sorted_leptons"]
+VECTORS = {
+    "met": "rdf_met(MissingET.MET, MissingET.Eta, MissingET.Phi)",
+    "met_invismu": "rdf_met_invismu(met, muons, Muon.PT, Muon.Eta, Muon.Phi)",
+    "lep1": "rdf_nth_lepton_p4(sorted_leptons, 0, Electron.PT, Electron.Eta, Electron.Phi, Muon.PT, Muon.Eta, Muon.Phi)",
+    "lep2": "rdf_nth_lepton_p4(sorted_leptons, 1, Electron.PT, Electron.Eta, Electron.Phi, Muon.PT, Muon.Eta, Muon.Phi)",
+    "jet1": "rdf_nth_p4(excl_jets, 0, Jet.PT, Jet.Eta, Jet.Phi, Jet.Mass)",
+    "jet2": "rdf_nth_p4(excl_jets, 1, Jet.PT, Jet.Eta, Jet.Phi, Jet.Mass)",
+    "dijet": "rdf_dijet(jet1, jet2)",
+    "bjet1": "rdf_nth_p4(sorted_bjets, 0, Jet.PT, Jet.Eta, Jet.Phi, Jet.Mass)",
+    "bjet2": "rdf_nth_p4(sorted_bjets, 1, Jet.PT, Jet.Eta, Jet.Phi, Jet.Mass)",
+}
+# Delphes branch of the objects of each collection
+collection_branches = {
+    "elecs": "Electron",
+    "muons": "Muon",
+    "jets": "Jet",
+    "excl_jets": "Jet",
+    "tau_tags": "Jet",
+    "btags": "Jet",
+    "sorted_jets": "Jet",
+    "sorted_bjets": "Jet",
+}
+# C++ types of the array typecodes of the tree branches
+column_types = {"f": "float", "i": "int", "q": "Long64_t"}
+p4_components = ["Px", "Py", "Pz", "E"]
+
+
+def spec_values(source, objects, attribute):
+    """
+    C++ expression of the RVec<double> of the values of a histogram or branch
+    spec, with one value per filled object and none if there is no object.
+    """
+    if source in EVENT_VECTORS:
+        return (
+            f"{source}.empty() ? ROOT::VecOps::RVec<double>{{}}"
+            + f" : ROOT::VecOps::RVec<double>{{{source}[0].{attribute}()}}"
+        )
+    if objects == "count":
+        return f"ROOT::VecOps::RVec<double>{{double({source}.size())}}"
+    if source in lepton_collections:
+        if attribute == "PID":
+            values = f"rdf_lepton_pids({source}, Electron.Charge, Muon.Charge)"
+        else:
+            values = (
+                f"rdf_lepton_take({source}, Electron.{attribute}, Muon.{attribute})"
+            )
+    else:
+        values = f"rdf_take({source}, {collection_branches[source]}.{attribute})"
+    if objects == "all":
+        return values
+    return f"rdf_nth({values}, {objects})"
+
+
+def define_event(data_frame, cuts, weightscale, run_number):
+    """
+    Define the collections, four vectors, weight and event keys of the events.
+    """
+    cut_values = {name: repr(float(getattr(cuts, name))) for name in cuts.__slots__}
+    for name, expression in COLLECTIONS.items():
+        data_frame = data_frame.Define(name, expression.format(**cut_values))
+    for name, expression in VECTORS.items():
+        data_frame = data_frame.Define(name, expression)
+    # Only one event
+    return (
+        data_frame.Define(
+            "event_weight",
+            f"(Event.Weight.size() > 0 ? double(Event.Weight[0]) : 0.) * {weightscale!r}",
+        )
+        .Define("run_number", f"Long64_t({run_number}LL)")
+        .Define("event_number", "Event.Number.size() > 0 ? int(Event.Number[0]) : 0")
+    )
+
+
+def book_hists(node):
+    """
+    Book a weighted Histo1D for each of the HIST_SPECS.
+    """
+    results = {}
+    for spec in HIST_SPECS:
+        values = f"hist_{spec.key}_values"
+        weights = f"hist_{spec.key}_weights"
+        node = node.Define(
+            values, spec_values(spec.source, spec.objects, spec.attribute)
+        ).Define(weights, f"ROOT::VecOps::RVec<double>({values}.size(), event_weight)")
+        model = ROOT.RDF.TH1DModel(
+            f"rdf_{spec.name}", spec.title, spec.nbins, spec.low, spec.high
+        )
+        results[spec.key] = node.Histo1D(model, values, weights)
+    return node, results
+
+
+def define_column(node, name, values, column_type):
+    """
+    Define the column of the first of the values, or default_fill if there is
+    none.
+    """
+    node = node.Define(f"{name}_values", values)
+    return node.Define(
+        name,
+        f"{name}_values.empty() ? {column_type}({default_fill})"
+        + f" : {column_type}({name}_values[0])",
+    )
+
+
+def book_snapshot(node, branches, path):
+    """
+    Book a lazy Snapshot of every hftree column among the branches, and of the
+    entry numbers, to the path. The p4 branches are written as one column per
+    component. Returns the result and the snapshot columns of each branch.
+    """
+    node = node.Define("input_entry", "rdfentry_").Define(
+        "column_weight", "float(event_weight)"
+    )
+    columns = {"weight": ["column_weight"]}
+    for spec in BRANCH_SPECS:
+        if spec.name not in branches:
+            continue
+        if spec.objects == "value":
+            columns[spec.name] = [spec.source]
+            continue
+        if spec.attribute == "P4":
+            columns[spec.name] = []
+            for component in p4_components:
+                values = spec_values(spec.source, spec.objects, component)
+                name = f"column_{spec.name}_{component}"
+                node = define_column(node, name, values, "float")
+                columns[spec.name].append(name)
+            continue
+        values = spec_values(spec.source, spec.objects, spec.attribute)
+        column_type = column_types[spec.type]
+        node = define_column(node, f"column_{spec.name}", values, column_type)
+        columns[spec.name] = [f"column_{spec.name}"]
+
+    options = ROOT.RDF.RSnapshotOptions()
+    options.fLazy = True
+    snapshot_columns = ["input_entry"] + [
+        name for names in columns.values() for name in names
+    ]
+    result = node.Snapshot(
+        "hftree", path, ROOT.std.vector["std::string"](snapshot_columns), options
+    )
+    return result, columns
+
+
+def copy_snapshot(path, hists, columns):
+    """
+    Fill the hftree of the hists with the entries of a snapshot in input order,
+    reading each column straight into the branch buffer of the hftree.
+    Returns the number of entries.
+    """
+    names = ROOT.std.vector["std::string"]()
+    buffers = ROOT.std.vector["ULong64_t"]()
+    for branch, snapshot_columns in columns.items():
+        address, _ = hists.branches[branch].buffer_info()
+        itemsize = hists.branches[branch].itemsize
+        for idx, name in enumerate(snapshot_columns):
+            names.push_back(name)
+            buffers.push_back(address + idx * itemsize)
+
+    start = time.perf_counter()
+    snapshot_file = ROOT.TFile.Open(path)
+    nentries = ROOT.rdf_copy_snapshot(
+        snapshot_file.Get("hftree"), hists.tree, names, buffers
+    )
+    snapshot_file.Close()
+    hists.topdir.cd()
+    hists.tree_fill_seconds += time.perf_counter() - start
+    return nentries
+
+
+def rdataframe_events(
+    input_files,
+    all_events,
+    event_selection,
+    weightscale,
+    event_cuts,
+    work_dir=None,
+    metrics=None,
+):
+    """
+    Fill the histograms and trees with an RDataFrame event loop over each of
+    the input files, which runs on the threads of EnableImplicitMT. Reading and
+    selecting the events happen in the same loop, so both count as selection.
+    The hftree columns are snapshot to temporary files in work_dir, so the
+    memory use doesn't grow with the size of the input files.
+    """
+    if metrics is None:
+        metrics = Metrics()
+    hists = {"all_events": all_events, "event_selection": event_selection}
+    cuts = EventCuts(**event_cuts)
+    entry = 0
+    for path in input_files:
+        events = define_event(
+            ROOT.RDataFrame("Delphes", path), cuts, weightscale, run_number(path)
+        )
+        # Require two leptons in the event that pass event_cuts
+        nodes = {
+            "all_events": events,
+            "event_selection": events.Filter("leptons.size() >= 2"),
+        }
+        snapshot_dir = tempfile.mkdtemp(prefix=".rdf_snapshot_", dir=work_dir)
+        try:
+            booked = {}
+            for tag, node in nodes.items():
+                node, hist_results = book_hists(node)
+                snapshot_path = os.path.join(snapshot_dir, f"{tag}.root")
+                booked[tag] = (
+                    hist_results,
+                    snapshot_path,
+                    book_snapshot(node, hists[tag].branches, snapshot_path),
+                )
+            # the first result runs the event loop of all the booked results
+            metrics.call("selection", booked["all_events"][2][0].GetValue)
+
+            start = time.perf_counter()
+            for tag, (hist_results, snapshot_path, (_, columns)) in booked.items():
+                for key, result in hist_results.items():
+                    hists[tag].hists[key].Add(result.GetValue())
+                nentries = copy_snapshot(snapshot_path, hists[tag], columns)
+                if tag == "all_events":
+                    entry += nentries
+            metrics.add("hists_fill", time.perf_counter() - start)
+        finally:
+            shutil.rmtree(snapshot_dir, ignore_errors=True)
+
+        print(f"{entry} events processed")
+        sys.stdout.flush()
+        metrics.maybe_sample(entry, hists.values())
+    return entry
+
+
+def read_output(path):
+    """
+    The histograms, as (contents, errors, entries), and the hftree columns of
+    each Hists directory of an output.
+    """
+    output = {}
+    root_file = ROOT.TFile.Open(path)
+    for tag in ["all_events", "event_selection"]:
+        directory = root_file.Get(tag)
+        hists = {}
+        for key in directory.GetListOfKeys():
+            obj = key.ReadObj()
+            if obj.InheritsFrom("TH1"):
+                nbins = obj.GetNbinsX() + 2
+                hists[obj.GetName()] = (
+                    np.array([obj.GetBinContent(idx) for idx in range(nbins)]),
+                    np.array([obj.GetBinError(idx) for idx in range(nbins)]),
+                    obj.GetEntries(),
+                )
+        columns = {}
+        for name, values in ROOT.RDataFrame(f"{tag}/hftree", path).AsNumpy().items():
+            if values.dtype == object:
+                values = np.array([np.asarray(row) for row in values])
+            columns[name] = values
+        output[tag] = (hists, columns)
+    root_file.Close()
+    return output
+
+
+def compare_outputs(path, reference_path):
+    """
+    Differences of the histograms and hftree columns of an output from those
+    of a reference output, such as the output of the loop engine.
+
+    Both engines compute the values with the same TLorentzVector arithmetic in
+    double precision, so the hftree columns must be identical. The loop engine
+    adds every fill to the float bin contents of the TH1F, while the RDataFrame
+    engine sums them in double precision and adds the sums, so the contents may
+    differ by a float rounding per fill, a relative 2**-24 times the entries.
+    The sums of squared weights are doubles in both, and only differ by the
+    order of the additions, a relative 2**-52 times the entries.
+    """
+    output = read_output(path)
+    reference = read_output(reference_path)
+    differences = []
+    for tag, (reference_hists, reference_columns) in reference.items():
+        hists, columns = output[tag]
+        for name, (contents, errors, entries) in reference_hists.items():
+            if name not in hists:
+                differences.append(f"{tag}/{name} is missing")
+                continue
+            content_rtol = max(entries, 1) * 2.0**-24
+            # the errors are square roots of the sums of squared weights
+            error_rtol = max(entries, 1) * 2.0**-53
+            if not (
+                np.allclose(hists[name][0], contents, rtol=content_rtol, atol=0)
+                and np.allclose(hists[name][1], errors, rtol=error_rtol, atol=0)
+            ):
+                differences.append(f"{tag}/{name} has other bin contents or errors")
+        for name, values in reference_columns.items():
+            if name not in columns:
+                differences.append(f"{tag}/hftree/{name} is missing")
+            elif columns[name].shape != values.shape:
+                differences.append(
+                    f"{tag}/hftree/{name} has {len(columns[name])} entries instead of {len(values)}"
+                )
+            elif not np.array_equal(columns[name], values):
+                differences.append(f"{tag}/hftree/{name} has other values")
+    return differences
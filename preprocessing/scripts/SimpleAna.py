@@ -3,29 +3,71 @@
 # Code inspired by and based partially on https://gitlab.cern.ch/scipp/mario-mapyde
 
 import argparse
+import multiprocessing
 import os
 import re
+import shutil
 import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
 
+import numpy as np
 import ROOT
-from HistCollections import DelphesEvent, Hists
+from Checkpoint import Checkpoint, checkpoint_path, read_checkpoint, restore
+from DelphesBranches import prune_branches, report_branch_bytes
+from EventCache import EventCache, cache_key
+from HistCollections import (
+    MOMEMTA_BRANCHES,
+    DelphesEvent,
+    EventCuts,
+    Hists,
+    run_number,
+)
+from MergeOutputs import merge_files
+from Metrics import Metrics, combine_metrics
+from SumOfWeights import sum_of_weights
 
-if __name__ == "__main__":
-    parser = argparse.ArgumentParser()
-    parser.add_argument("--input", action="store", default="input.txt")
-    parser.add_argument("--output", action="store", default="hist.root")
-    parser.add_argument("--lumi", action="store", default=1000.0)  # 1 fb-1
-    parser.add_argument("--debug", action="store_true")
-    parser.add_argument("--XS", action="store", default=0)
-    args = parser.parse_args()
+# Object selection of the DelphesEvents
+EVENT_CUTS = {
+    "e_pt_cut": 25,  # GeV
+    "e_eta_cut": 2.5,
+    "mu_pt_cut": 25,  # GeV
+    "mu_eta_cut": 2.5,
+    "jet_pt_cut": 25,  # GeV
+    "jet_eta_cut": 4.5,
+    "bjet_eta_cut": 4.0,
+}
 
-    def strip_ansi_codes(s):
-        """
-        Remove ANSI color codes from the string.
-        """
-        return re.sub("\033\\[([0-9]+)(;[0-9]+)*m", "", s)
 
-    # Environment setup
+def strip_ansi_codes(s):
+    """
+    Remove ANSI color codes from the string.
+    """
+    return re.sub("\033\\[([0-9]+)(;[0-9]+)*m", "", s)
+
+
+def step_size(value):
+    """
+    Number of entries, or a memory size such as "100 MB", to read at once.
+    """
+    return int(value) if value.isdigit() else value
+
+
+def byte_size(value):
+    """
+    Number of bytes of a size such as "20 GB".
+    """
+    units = {"B": 1, "KB": 1e3, "MB": 1e6, "GB": 1e9, "TB": 1e12}
+    match = re.fullmatch(r"\s*([0-9.]+)\s*([KMGT]?B)?\s*", value.upper())
+    if match is None:
+        raise argparse.ArgumentTypeError(f"invalid size: {value}")
+    return float(match.group(1)) * units[match.group(2) or "B"]
+
+
+def setup_root():
+    """
+    Load the Delphes classes into ROOT.
+    """
     if "ROOT_INCLUDE_PATH" not in os.environ:
         print(
             "\nERROR: export the shell variable ROOT_INCLUDE_PATH to be the include directory that contains Delphes files."
@@ -40,74 +82,113 @@ if __name__ == "__main__":
     # Prevent the canvas from displaying
     ROOT.gROOT.SetBatch(True)
 
-    reweightEvents = False
-    XS = 0
-    if float(args.XS) > 0:
-        XS = float(strip_ansi_codes(args.XS))
-        print(XS)
-        reweightEvents = True
 
-    chain = ROOT.TChain("Delphes")
+def count_entries(input_files):
+    """
+    Number of events in the Delphes tree of each input file.
+    """
+    file_entries = []
+    for input_file in input_files:
+        root_file = ROOT.TFile.Open(input_file)
+        file_entries.append(root_file.Get("Delphes").GetEntries())
+        root_file.Close()
+    return file_entries
 
-    if args.input[-4:] == "root":
-        print("Running over single root file:")
-        print(f"   > {args.input}")
-        chain.Add(args.input)
-    else:
-        print("Running over list of root files:")
-        for line in open(args.input):
-            print("   > " + line.rstrip("\n"))
-            chain.Add(line.rstrip("\n"))
 
-    numFiles = chain.GetNtrees()
-    print(f"Loaded {numFiles} chains...")
+def shard_ranges(total_entries, n_shards):
+    """
+    Split the entries of the chain into n_shards contiguous [first, last) ranges
+    of nearly equal size.
+    """
+    bounds = [total_entries * shard // n_shards for shard in range(n_shards + 1)]
+    return [(first, last) for first, last in zip(bounds, bounds[1:]) if last > first]
 
-    # a histogram for our output
-    outfile = ROOT.TFile.Open(args.output, "RECREATE")
 
-    # Book histograms
-    all_events = Hists("all_events", outfile)
-    event_selection = Hists("event_selection", outfile)
-
-    event_cuts = {
-        "e_pt_cut": 25,  # GeV
-        "e_eta_cut": 2.5,
-        "mu_pt_cut": 25,  # GeV
-        "mu_eta_cut": 2.5,
-        "jet_pt_cut": 25,  # GeV
-        "jet_eta_cut": 4.5,
-        "bjet_eta_cut": 4.0,
-    }
+def file_ranges(input_files, file_entries, first, last):
+    """
+    The (path, entry_start, entry_stop) ranges of the input files covering the
+    [first, last) entries of the chain.
+    """
+    ranges = []
+    offset = 0
+    for input_file, entries in zip(input_files, file_entries):
+        entry_start = max(first - offset, 0)
+        entry_stop = min(last - offset, entries)
+        if entry_start < entry_stop:
+            ranges.append((input_file, entry_start, entry_stop))
+        offset += entries
+    return ranges
 
-    weightscale = float(args.lumi) / numFiles
-    # Loop through all events in chain to get the sum of weights before filling trees and hists
-    # There should be a better way to do this....
-    if reweightEvents:
-        print("Computing sum of weights")
-        entry = 0
-        sumofweights = 0
-        for event in chain:
-            entry += 1
 
-            if entry != 0 and entry % 10000 == 0:
-                print(f"{entry} events processed for sum of weights")
-                sys.stdout.flush()
+def used_branches(engine, truth_pid=False):
+    """
+    Top-level Delphes branches the engine reads.
+    """
+    if engine == "columnar":
+        import ColumnarSelection
 
-            # wrapper around Delphes events to make some things easier
-            delphes_event = DelphesEvent(event, **event_cuts)
-            sumofweights += delphes_event.weight
+        return set(ColumnarSelection.delphes_branches)
+    branches = set(DelphesEvent.delphes_branches) | set(Hists.delphes_branches)
+    if truth_pid:
+        branches |= set(Hists.truth_delphes_branches)
+    return branches
 
-        # compute appropriate weights for each event
-        weightscale *= XS / sumofweights
 
-    # Loop through all events in chain
-    print("Processing events")
-    total_nevents = chain.GetEntries()
-    fraction_of_events = int(total_nevents / 20)
-    entry = 0
+def output_branches(value):
+    """
+    Names of the hftree branches to write: all of them (None), the ones read by
+    MoMEMta, or a comma separated list.
+    """
+    if value == "all":
+        return None
+    if value == "momemta":
+        return MOMEMTA_BRANCHES
+    return value.split(",")
+
+
+def loop_events(
+    chain,
+    first,
+    last,
+    all_events,
+    event_selection,
+    weightscale,
+    event_cuts,
+    entry=0,
+    checkpoint=None,
+    run_numbers=None,
+    metrics=None,
+    poll_every=1000,
+):
+    """
+    Fill the histograms and trees one event at a time, skipping the first entry
+    events that have already been processed. run_numbers are the run numbers
+    of the files of the chain. The checkpoint and the metrics, which both read
+    the clock, are only polled every poll_every events.
+    """
+    total_nevents = last - first
+    fraction_of_events = max(int(total_nevents / 20), 1)
+    if metrics is None:
+        metrics = Metrics()
+    hists = [all_events, event_selection]
+    stages = metrics.stages
+    cuts = EventCuts(**event_cuts)
+    clock = time.perf_counter
+    next_poll = entry
 
-    for event in chain:
+    for chain_entry in range(first + entry, last):
+        if entry >= next_poll:
+            if checkpoint is not None:
+                checkpoint.maybe_save(chain_entry, entry)
+            metrics.maybe_sample(entry, hists)
+            next_poll = entry + poll_every
+
+        start = clock()
+        chain.GetEntry(chain_entry)
+        event = chain
         entry += 1
+        read_done = clock()
+        stages["io"] += read_done - start
 
         if entry % fraction_of_events == 0:
             print(
@@ -115,22 +196,544 @@ if __name__ == "__main__":
             )
             sys.stdout.flush()
 
-        # wrapper around Delphes events to make some things easier
-        delphes_event = DelphesEvent(event, **event_cuts)
+        # wrapper around Delphes events to make some things easier, with all
+        # objects selected here so that the selection stage covers them
+        delphes_event = DelphesEvent(
+            event,
+            run_number=run_numbers[chain.GetTreeNumber()] if run_numbers else 0,
+            cuts=cuts,
+        ).select()
         weight = delphes_event.weight * weightscale
+        selection_done = clock()
+        stages["selection"] += selection_done - read_done
 
         # fill histograms for all events
         all_events.fill(delphes_event, weight)
 
         # Require two leptons in the event that pass event_cuts
-        if len(delphes_event.leptons) < 2:
-            continue
+        if len(delphes_event.leptons) >= 2:
+            event_selection.fill(delphes_event, weight)
+        stages["hists_fill"] += clock() - selection_done
 
-        event_selection.fill(delphes_event, weight)
+    return entry
+
+
+def selected_columns(arrays, event_cuts, run_number=0, entry_start=0):
+    """
+    Unscaled histogram values and output columns of all events of a chunk and
+    of the events passing the event selection, with the input file entry of
+    each event in the entry column. entry_start is the entry of the first
+    event of the chunk.
+    """
+    import ColumnarSelection
+
+    delphes_events = ColumnarSelection.ColumnarEvents(
+        arrays, run_number=run_number, **event_cuts
+    )
+    entries = entry_start + np.arange(len(delphes_events), dtype=np.int64)
+    # Require two leptons in the event that pass event_cuts
+    selected = delphes_events.count("leptons") >= 2
+    chunk = {
+        "all_events": ColumnarSelection.unscaled_columns(delphes_events),
+        "event_selection": ColumnarSelection.unscaled_columns(delphes_events[selected]),
+    }
+    chunk["all_events"][1]["entry"] = entries
+    chunk["event_selection"][1]["entry"] = entries[selected]
+    return chunk
+
+
+def range_chunks(file_range, event_cuts, step_size, cache=None, metrics=None):
+    """
+    The selected_columns of the chunks of a (path, entry_start, entry_stop)
+    file range, read from the cache if it holds them and written to it
+    otherwise.
+    """
+    import ColumnarSelection
+
+    path, entry_start, entry_stop = file_range
+    if metrics is None:
+        metrics = Metrics()
+    if cache is not None:
+        key = cache_key(path, event_cuts)
+        cached = cache.load(key, entry_start, entry_stop)
+        if cached is not None:
+            print(f"Reading {path} from the event cache")
+            yield from metrics.timed(cached, "io")
+            return
+
+    def delphes_chunks():
+        file_run_number = run_number(path)
+        chunk_start = entry_start
+        for arrays in metrics.timed(
+            ColumnarSelection.iterate_delphes([file_range], step_size=step_size),
+            "io",
+        ):
+            yield metrics.call(
+                "selection",
+                selected_columns,
+                arrays,
+                event_cuts,
+                file_run_number,
+                chunk_start,
+            )
+            chunk_start += len(arrays)
+
+    chunks = delphes_chunks()
+    if cache is not None:
+        chunks = cache.store(key, chunks)
+    yield from chunks
 
-    print(f"{entry} events processed")
-    all_events.write()
-    event_selection.write()
+
+def columnar_events(
+    ranges,
+    all_events,
+    event_selection,
+    weightscale,
+    event_cuts,
+    step_size,
+    cache=None,
+    first=0,
+    entry=0,
+    checkpoint=None,
+    metrics=None,
+):
+    """
+    Fill the histograms and trees from chunks of events read as arrays. The
+    ranges start at chain entry first plus the entry events already processed.
+    """
+    import ColumnarSelection
+
+    if metrics is None:
+        metrics = Metrics()
+    hists = {"all_events": all_events, "event_selection": event_selection}
+    for file_range in ranges:
+        for chunk in range_chunks(file_range, event_cuts, step_size, cache, metrics):
+            start = time.perf_counter()
+            for tag, (values, columns) in chunk.items():
+                hists[tag].fill_arrays(
+                    *ColumnarSelection.scale_columns(values, columns, weightscale)
+                )
+            metrics.add("hists_fill", time.perf_counter() - start)
+
+            entry += len(chunk["all_events"][1]["weight"])
+            print(f"{entry} events processed")
+            sys.stdout.flush()
+
+            if checkpoint is not None:
+                checkpoint.maybe_save(first + entry, entry)
+            metrics.maybe_sample(entry, hists.values())
+
+    return entry
+
+
+def process_events(
+    output,
+    input_files,
+    file_entries,
+    first,
+    last,
+    weightscale,
+    event_cuts,
+    engine="loop",
+    step_size="100 MB",
+    truth_pid=False,
+    branches=None,
+    cache_dir=None,
+    cache_size=20e9,
+    checkpoint_interval=0,
+    resume=False,
+    metrics_path=None,
+    metrics_interval=0,
+):
+    """
+    Fill the histograms and trees for the [first, last) entries of the chain of
+    input files and write them to the output file.
+
+    Every checkpoint_interval seconds the histograms and trees are saved to a
+    checkpoint file next to the output file, which is removed at the end. With
+    resume the run continues from its checkpoint, if there is one.
+
+    The time spent in each stage is written to the metrics_path, and sampled
+    every metrics_interval seconds if it is positive.
+    """
+    # options that change the output, which a checkpoint has to match
+    run = dict(
+        input_files=[os.path.abspath(input_file) for input_file in input_files],
+        file_entries=file_entries,
+        first=first,
+        last=last,
+        weightscale=weightscale,
+        event_cuts=event_cuts,
+        engine=engine,
+        truth_pid=truth_pid,
+        branches=branches,
+    )
+    checkpoint_file = checkpoint_path(output)
+    state = read_checkpoint(checkpoint_file, run) if resume else None
+
+    metrics = Metrics(metrics_path, metrics_interval)
+
+    # a histogram for our output
+    outfile = ROOT.TFile.Open(output, "RECREATE")
+
+    # Book histograms
+    all_events = Hists("all_events", outfile, truth_pid=truth_pid, branches=branches)
+    event_selection = Hists(
+        "event_selection", outfile, truth_pid=truth_pid, branches=branches
+    )
+
+    entry = 0
+    if state is not None:
+        print(f"Resuming after {state['entry']} events from {checkpoint_file}")
+        restore(checkpoint_file, [all_events, event_selection])
+        entry = state["entry"]
+    checkpoint = Checkpoint(
+        checkpoint_file,
+        checkpoint_interval,
+        run,
+        [all_events, event_selection],
+        branches=branches,
+    )
+
+    if engine == "columnar":
+        entry = columnar_events(
+            file_ranges(input_files, file_entries, first + entry, last),
+            all_events,
+            event_selection,
+            weightscale,
+            event_cuts,
+            step_size,
+            cache=EventCache(cache_dir, cache_size) if cache_dir else None,
+            first=first,
+            entry=entry,
+            checkpoint=checkpoint,
+            metrics=metrics,
+        )
+    elif engine == "rdataframe":
+        import RDataFrameSelection
+
+        # the entries of a multithreaded event loop can't be limited to a range
+        if first + entry != 0 or last != sum(file_entries):
+            print("\nERROR: The rdataframe engine only processes whole inputs.\n")
+            sys.exit(1)
+        entry = RDataFrameSelection.rdataframe_events(
+            input_files,
+            all_events,
+            event_selection,
+            weightscale,
+            event_cuts,
+            work_dir=os.path.dirname(os.path.abspath(output)),
+            metrics=metrics,
+        )
+    else:
+        chain = ROOT.TChain("Delphes")
+        for input_file in input_files:
+            chain.Add(input_file)
+        prune_branches(chain, used_branches(engine, truth_pid))
+        entry = loop_events(
+            chain,
+            first,
+            last,
+            all_events,
+            event_selection,
+            weightscale,
+            event_cuts,
+            entry=entry,
+            checkpoint=checkpoint,
+            run_numbers=[run_number(input_file) for input_file in input_files],
+            metrics=metrics,
+        )
+        print(f"Read {ROOT.TFile.GetFileBytesRead() / 1e6:.1f} MB from the input files")
+
+    # the buffered events are filled before the write, which is timed on its own
+    hists = [all_events, event_selection]
+    for coll in hists:
+        metrics.call("hists_fill", coll.flush)
+    for coll in hists:
+        metrics.call("write", coll.write)
 
     outfile.Close()
+    metrics.write(entry, hists)
+    if os.path.exists(checkpoint_file):
+        os.remove(checkpoint_file)
+    return entry
+
+
+def processed_entries(output):
+    """
+    Number of events processed into an output file.
+    """
+    outfile = ROOT.TFile.Open(output)
+    entries = outfile.Get("all_events/hftree").GetEntries()
+    outfile.Close()
+    return entries
+
+
+def process_shard(shard):
+    """
+    Process one shard of the chain in a worker process. The shard output only
+    appears once the shard is complete, so resumed runs skip complete shards.
+    """
+    output = shard["output"]
+    if shard.get("resume") and os.path.exists(output):
+        return processed_entries(output)
+
+    partial_output = f"{output}.part"
+    entry = process_events(**dict(shard, output=partial_output))
+    os.replace(partial_output, output)
+    return entry
+
+
+def process_in_parallel(output, workers, **kwargs):
+    """
+    Split the chain into contiguous shards of entries, process them in a pool
+    of worker processes and merge the shard outputs into the output file.
+    """
+    started_at = time.monotonic()
+    total_entries = sum(kwargs["file_entries"])
+    shards = shard_ranges(total_entries, workers)
+    print(f"Processing {total_entries} events in {len(shards)} shards")
+
+    # at a fixed path, so that the shards can be resumed
+    shard_dir = f"{output}.shards"
+    if not kwargs.get("resume"):
+        shutil.rmtree(shard_dir, ignore_errors=True)
+    os.makedirs(shard_dir, exist_ok=True)
+    shard_outputs = [
+        os.path.join(shard_dir, f"shard_{idx}.root") for idx in range(len(shards))
+    ]
+    metrics_path = kwargs.get("metrics_path")
+    # next to the shard outputs, so that they are kept for resumed shards
+    shard_metrics = [f"{shard_output}.metrics.json" for shard_output in shard_outputs]
+    try:
+        with ProcessPoolExecutor(
+            max_workers=len(shards),
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=setup_root,
+        ) as executor:
+            entries = executor.map(
+                process_shard,
+                [
+                    dict(
+                        kwargs,
+                        output=shard_output,
+                        first=first,
+                        last=last,
+                        metrics_path=shard_metric if metrics_path else None,
+                    )
+                    for shard_output, shard_metric, (first, last) in zip(
+                        shard_outputs, shard_metrics, shards
+                    )
+                ],
+            )
+            entry = sum(entries)
+
+        print(f"Merging {len(shard_outputs)} shards")
+        merge_files(output, shard_outputs, branches=kwargs.get("branches"))
+        if metrics_path:
+            combine_metrics(
+                [path for path in shard_metrics if os.path.exists(path)],
+                metrics_path,
+                time.monotonic() - started_at,
+            )
+    except BaseException:
+        # keep the shard checkpoints and complete shards for --resume
+        if not kwargs.get("checkpoint_interval"):
+            shutil.rmtree(shard_dir)
+        raise
+    shutil.rmtree(shard_dir)
+
+    return entry
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--input", action="store", default="input.txt")
+    parser.add_argument("--output", action="store", default="hist.root")
+    parser.add_argument("--lumi", action="store", default=1000.0)  # 1 fb-1
+    parser.add_argument("--debug", action="store_true")
+    parser.add_argument("--XS", action="store", default=0)
+    parser.add_argument(
+        "--engine",
+        action="store",
+        choices=["loop", "columnar", "rdataframe"],
+        default="loop",
+        help="Process events one at a time (loop), as chunks of arrays (columnar) or with a multithreaded RDataFrame (rdataframe)",
+    )
+    parser.add_argument(
+        "--threads",
+        action="store",
+        type=int,
+        default=0,
+        help="Number of threads of the rdataframe engine, all cores if 0",
+    )
+    parser.add_argument(
+        "--validate",
+        action="store_true",
+        help="Also process the events with the loop engine and compare the outputs of the rdataframe engine to its output",
+    )
+    parser.add_argument(
+        "--step-size",
+        action="store",
+        type=step_size,
+        default="100 MB",
+        help="Amount of events read at once by the columnar engine",
+    )
+    parser.add_argument(
+        "--no-sumw-cache",
+        action="store_true",
+        help="Always scan the input files for the sum of weights instead of reusing the cached sums",
+    )
+    parser.add_argument(
+        "--workers",
+        action="store",
+        type=int,
+        default=1,
+        help="Number of processes to split the events across",
+    )
+    parser.add_argument(
+        "--truth-pid",
+        action="store_true",
+        help="Take the lepton PIDs from the referenced generator particles, which requires reading the Delphes Particle branch",
+    )
+    parser.add_argument(
+        "--branches",
+        action="store",
+        type=output_branches,
+        default="all",
+        help='Branches of the output trees: "all", "momemta" for only those read by MoMEMta, or a comma separated list',
+    )
+    parser.add_argument(
+        "--cache-dir",
+        action="store",
+        default=None,
+        help="Directory of the cache of the selected events of the columnar engine, keyed by the input files and event cuts",
+    )
+    parser.add_argument(
+        "--cache-size",
+        action="store",
+        type=byte_size,
+        default="20 GB",
+        help="Size above which the least recently used event cache entries are removed",
+    )
+    parser.add_argument(
+        "--checkpoint-interval",
+        action="store",
+        type=float,
+        default=0,
+        help="Seconds between checkpoints of the histograms and trees, which are not written if 0",
+    )
+    parser.add_argument(
+        "--resume",
+        action="store_true",
+        help="Continue from the checkpoint of an interrupted run with the same options",
+    )
+    parser.add_argument(
+        "--metrics",
+        action="store",
+        default=None,
+        help="JSON file to write the time spent in each stage, the throughput and memory use to",
+    )
+    parser.add_argument(
+        "--metrics-interval",
+        action="store",
+        type=float,
+        default=0,
+        help="Seconds between samples of the metrics written to <metrics>.series.jsonl during the run, none if 0",
+    )
+    args = parser.parse_args()
+    if args.truth_pid and args.engine != "loop":
+        parser.error("--truth-pid is only supported by the loop engine")
+    if args.engine == "rdataframe":
+        if args.workers > 1:
+            parser.error("the rdataframe engine runs on --threads instead of --workers")
+        if args.checkpoint_interval > 0 or args.resume:
+            parser.error("the rdataframe engine doesn't support checkpoints")
+    elif args.validate:
+        parser.error("--validate is only supported by the rdataframe engine")
+    if args.cache_dir and args.engine != "columnar":
+        parser.error("--cache-dir is only supported by the columnar engine")
+    if args.metrics_interval > 0 and not args.metrics:
+        parser.error("--metrics-interval requires --metrics")
+
+    # Environment setup
+    setup_root()
+    if args.engine == "rdataframe":
+        ROOT.EnableImplicitMT(args.threads)
+
+    reweightEvents = False
+    XS = 0
+    if float(args.XS) > 0:
+        XS = float(strip_ansi_codes(args.XS))
+        print(XS)
+        reweightEvents = True
+
+    if args.input[-4:] == "root":
+        print("Running over single root file:")
+        input_files = [args.input]
+    else:
+        print("Running over list of root files:")
+        input_files = [line.rstrip("\n") for line in open(args.input)]
+    for input_file in input_files:
+        print(f"   > {input_file}")
+
+    file_entries = count_entries(input_files)
+    numFiles = len(input_files)
+    print(f"Loaded {numFiles} chains...")
+
+    event_cuts = dict(EVENT_CUTS)
+
+    weightscale = float(args.lumi) / numFiles
+    if reweightEvents:
+        print("Computing sum of weights")
+        sumofweights = sum_of_weights(input_files, use_cache=not args.no_sumw_cache)
+
+        # compute appropriate weights for each event
+        weightscale *= XS / sumofweights
+
+    report_branch_bytes(input_files, used_branches(args.engine, args.truth_pid))
+
+    # Loop through all events in chain
+    print("Processing events")
+    processing_options = dict(
+        input_files=input_files,
+        file_entries=file_entries,
+        weightscale=weightscale,
+        event_cuts=event_cuts,
+        engine=args.engine,
+        truth_pid=args.truth_pid,
+        branches=args.branches,
+        step_size=args.step_size,
+        cache_dir=args.cache_dir,
+        cache_size=args.cache_size,
+        checkpoint_interval=args.checkpoint_interval,
+        resume=args.resume,
+        metrics_path=args.metrics,
+        metrics_interval=args.metrics_interval,
+    )
+    if args.workers > 1:
+        entry = process_in_parallel(args.output, args.workers, **processing_options)
+    else:
+        entry = process_events(
+            args.output, first=0, last=sum(file_entries), **processing_options
+        )
+
+    print(f"{entry} events processed")
+
+    if args.validate:
+        import RDataFrameSelection
+
+        reference = f"{os.path.splitext(args.output)[0]}_loop.root"
+        print(f"Processing events with the loop engine into {reference}")
+        reference_options = dict(processing_options, engine="loop", metrics_path=None)
+        process_events(reference, first=0, last=sum(file_entries), **reference_options)
+        differences = RDataFrameSelection.compare_outputs(args.output, reference)
+        if differences:
+            print(f"\nERROR: {args.output} differs from the loop engine output:")
+            for difference in differences:
+                print(f"    {difference}")
+            print("")
+            sys.exit(1)
+        print(f"{args.output} matches the loop engine output")
+
     print("Done!")
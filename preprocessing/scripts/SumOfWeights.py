@@ -0,0 +1,94 @@
+# Sum of the Delphes event weights of input files, needed to normalize the
+# events to a cross section, cached next to each file so re-runs skip the scan
+import json
+import os
+
+cache_suffix = ".sumw.json"
+
+
+def file_fingerprint(path):
+    """
+    Key identifying the current contents of a file.
+    """
+    stat = os.stat(path)
+    return {
+        "path": os.path.abspath(path),
+        "mtime": stat.st_mtime,
+        "size": stat.st_size,
+    }
+
+
+def read_cache(path):
+    """
+    Cached (sum of weights, entries) of a file, or None if there is no cache
+    entry for the current contents of the file.
+    """
+    cache_path = path + cache_suffix
+    try:
+        with open(cache_path) as cache_file:
+            cache = json.load(cache_file)
+    except (OSError, ValueError):
+        return None
+
+    if cache.get("key") != file_fingerprint(path):
+        return None
+    return cache["sum_of_weights"], cache["entries"]
+
+
+def write_cache(path, sum_of_weights, entries):
+    cache_path = path + cache_suffix
+    cache = {
+        "key": file_fingerprint(path),
+        "sum_of_weights": sum_of_weights,
+        "entries": entries,
+    }
+    try:
+        with open(cache_path, "w") as cache_file:
+            json.dump(cache, cache_file, indent=2)
+    except OSError as err:
+        print(f"WARNING: Unable to write sum of weights cache {cache_path}: {err}")
+
+
+def scan_file(path, tree_name="Delphes"):
+    """
+    Sum of weights and number of entries of a Delphes file. Only the
+    Event.Weight branch is read, in a single compiled event loop.
+    """
+    import ROOT
+
+    data_frame = ROOT.RDataFrame(tree_name, path)
+    # Only one event
+    weights = data_frame.Define(
+        "event_weight", "Event.Weight.size() > 0 ? double(Event.Weight[0]) : 0."
+    )
+    sum_of_weights = weights.Sum("event_weight")
+    entries = weights.Count()
+    return sum_of_weights.GetValue(), int(entries.GetValue())
+
+
+def file_sum_of_weights(path, use_cache=True):
+    """
+    Sum of weights and number of entries of a Delphes file, from its cache if
+    the file has not changed since it was last scanned.
+    """
+    if use_cache:
+        cached = read_cache(path)
+        if cached is not None:
+            return cached
+
+    sum_of_weights, entries = scan_file(path)
+    if use_cache:
+        write_cache(path, sum_of_weights, entries)
+    return sum_of_weights, entries
+
+
+def sum_of_weights(input_files, use_cache=True):
+    """
+    Sum of the event weights of all input files.
+    """
+    total = 0.0
+    for path in input_files:
+        file_sum, entries = file_sum_of_weights(path, use_cache)
+        print(f"   > {path}: {entries} events, sum of weights {file_sum}")
+        total += file_sum
+    return total
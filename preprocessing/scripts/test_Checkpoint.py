@@ -0,0 +1,58 @@
+import numpy as np
+import pytest
+
+ROOT = pytest.importorskip("ROOT")
+
+# isort: split
+from Checkpoint import Checkpoint, read_checkpoint, restore
+from HistCollections import Hists
+
+BRANCHES = ["run_number", "event_number"]
+
+
+def fill(hists, events):
+    ones = np.ones(len(events))
+    hists.fill_arrays(
+        {"nElec": (events % 3 * 1.0, ones)},
+        {
+            "weight": ones,
+            "run_number": np.full(len(events), 2**62, dtype=np.int64),
+            "event_number": events,
+        },
+    )
+
+
+def save_checkpoint(tmp_path, events, run="run"):
+    path = str(tmp_path.joinpath("output.root.checkpoint.root"))
+    outfile = ROOT.TFile.Open(str(tmp_path.joinpath("output.root")), "RECREATE")
+    hists = Hists("all_events", outfile, branches=BRANCHES)
+    fill(hists, events)
+    Checkpoint(path, 0, run, [hists], branches=BRANCHES).save(len(events), len(events))
+    outfile.Close()
+    return path
+
+
+def test_restore_gives_the_saved_hists(tmp_path):
+    path = save_checkpoint(tmp_path, np.arange(10))
+
+    state = read_checkpoint(path, "run")
+    assert state["next_entry"] == 10
+    assert state["entry"] == 10
+
+    resumed_file = ROOT.TFile.Open(str(tmp_path.joinpath("resumed.root")), "RECREATE")
+    resumed = Hists("all_events", resumed_file, branches=BRANCHES)
+    restore(path, [resumed])
+    hist = resumed.hists["nElec"]
+    assert [hist.GetBinContent(idx) for idx in [1, 2, 3]] == [4.0, 3.0, 3.0]
+    assert resumed.tree.GetEntries() == 10
+    resumed_file.Close()
+
+
+def test_read_checkpoint_of_another_run(tmp_path):
+    path = save_checkpoint(tmp_path, np.arange(3))
+    with pytest.raises(SystemExit):
+        read_checkpoint(path, "other run")
+
+
+def test_read_checkpoint_without_checkpoint(tmp_path):
+    assert read_checkpoint(str(tmp_path.joinpath("missing.root")), "run") is None
@@ -0,0 +1,63 @@
+import math
+
+import numpy as np
+import pytest
+from ColumnarSelection import lorentz_components
+from EventCuts import EventCuts
+
+
+def reference_components(pt, eta, phi, mass):
+    """
+    TLorentzVector::SetPtEtaPhiM and its getters, one object at a time with the
+    C math library like the loop engine.
+    """
+    px = pt * math.cos(phi)
+    py = pt * math.sin(phi)
+    pz = pt * math.sinh(eta)
+    p2 = px * px + py * py + pz * pz
+    energy = math.sqrt(p2 + mass * mass)
+    m2 = energy * energy - p2
+    return {
+        "Px": px,
+        "Py": py,
+        "Pz": pz,
+        "E": energy,
+        "Pt": math.sqrt(px * px + py * py),
+        "Eta": math.asinh(pz / math.sqrt(px * px + py * py)),
+        "Phi": math.atan2(py, px),
+        "M": math.copysign(math.sqrt(abs(m2)), m2),
+    }
+
+
+@pytest.mark.parametrize("massless", [False, True])
+def test_lorentz_components_agree_with_the_loop_engine(massless):
+    rng = np.random.default_rng(1)
+    pt = rng.uniform(1.0, 500.0, 1000)
+    eta = rng.uniform(-4.5, 4.5, 1000)
+    phi = rng.uniform(-math.pi, math.pi, 1000)
+    mass = np.zeros(1000) if massless else rng.uniform(0.1, 100.0, 1000)
+
+    components = lorentz_components(pt, eta, phi, mass)
+
+    for idx in range(len(pt)):
+        reference = reference_components(pt[idx], eta[idx], phi[idx], mass[idx])
+        for name in ["Px", "Py", "Pz", "E", "Pt", "Eta", "Phi"]:
+            assert components[name][idx] == pytest.approx(
+                reference[name], rel=1e-12, abs=1e-12
+            )
+        # E^2 - p^2 cancels, worst for massless objects
+        assert abs(components["M"][idx] - reference["M"]) <= 1e-7 * reference["E"]
+
+
+def test_lorentz_components_of_objects_at_rest():
+    components = lorentz_components([0.0], [0.0], [0.0], [5.0])
+    assert components["Eta"][0] == 0.0
+    assert components["Phi"][0] == 0.0
+    assert components["M"][0] == 5.0
+
+
+def test_event_cuts_defaults():
+    cuts = EventCuts(e_pt_cut=25.0, e_eta_cut=2.5, jet_eta_cut=4.5, unknown=1)
+    assert (cuts.muon_pt, cuts.muon_eta) == (25.0, 2.5)
+    assert cuts.btag_eta == 4.5
+    assert EventCuts(high_lumi=True, jet_eta_cut=4.5).btag_eta == 4.0
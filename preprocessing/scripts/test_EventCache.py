@@ -0,0 +1,117 @@
+import os
+
+import numpy as np
+import pytest
+from EventCache import EventCache, cache_key, covering_chunks, slice_chunk
+
+EVENT_CUTS = {"e_pt_cut": 25.0, "e_eta_cut": 2.5}
+
+
+@pytest.fixture
+def input_file(tmp_path):
+    path = tmp_path.joinpath("delphes_output.root")
+    path.write_bytes(b"events")
+    return str(path)
+
+
+def make_chunk(entry_start, entry_stop):
+    """
+    A chunk of the events of the entries, where every event has as many
+    histogram values as its entry modulo 3 and odd entries are selected.
+    """
+    chunk = {}
+    entries = np.arange(entry_start, entry_stop)
+    selected = entries[entries % 2 == 1]
+    for tag, events in [("all_events", entries), ("event_selection", selected)]:
+        rows = np.repeat(np.arange(len(events)), events % 3)
+        values = {"ePT": (events[rows] * 10.0, events[rows] * 0.5, rows)}
+        columns = {"weight": events * 0.5, "entry": events}
+        chunk[tag] = (values, columns)
+    return chunk
+
+
+def test_cache_key_ignores_the_entry_range(input_file):
+    # cache_key takes no range, so workers and resumed runs share the entries
+    assert cache_key(input_file, EVENT_CUTS) == cache_key(input_file, dict(EVENT_CUTS))
+
+
+def test_cache_key_depends_on_the_cuts(input_file):
+    key = cache_key(input_file, EVENT_CUTS)
+    assert key != cache_key(input_file, dict(EVENT_CUTS, e_pt_cut=30.0))
+    assert key != cache_key(input_file, dict(EVENT_CUTS, high_lumi=True))
+    assert key == cache_key(input_file, dict(EVENT_CUTS, high_lumi=False))
+
+
+def test_cache_key_depends_on_the_file(input_file):
+    key = cache_key(input_file, EVENT_CUTS)
+    with open(input_file, "ab") as delphes_file:
+        delphes_file.write(b"more events")
+    assert key != cache_key(input_file, EVENT_CUTS)
+
+
+def test_covering_chunks():
+    chunks = [(0, 10), (10, 20), (5, 15), (20, 30)]
+    assert covering_chunks(chunks, 0, 30) == [(0, 10), (10, 20), (20, 30)]
+    assert covering_chunks(chunks, 12, 25) == [(10, 20), (20, 30)]
+    assert covering_chunks(chunks, 0, 31) is None
+    assert covering_chunks([(0, 10), (11, 20)], 0, 20) is None
+
+
+def test_slice_chunk():
+    sliced = slice_chunk(make_chunk(0, 10), 3, 8)
+    expected = make_chunk(3, 8)
+    for tag, (values, columns) in expected.items():
+        sliced_values, sliced_columns = sliced[tag]
+        for name, column in columns.items():
+            np.testing.assert_array_equal(sliced_columns[name], column)
+        for name, arrays in values.items():
+            for sliced_array, array in zip(sliced_values[name], arrays):
+                np.testing.assert_array_equal(sliced_array, array)
+
+
+def read_all(chunks):
+    return np.concatenate([chunk["all_events"][1]["entry"] for chunk in chunks])
+
+
+def test_store_and_load_any_range(tmp_path, input_file):
+    cache = EventCache(str(tmp_path.joinpath("cache")), max_bytes=1e9)
+    key = cache_key(input_file, EVENT_CUTS)
+    assert cache.load(key, 0, 10) is None
+
+    # two workers storing their halves of the file
+    for entry_start, entry_stop in [(0, 6), (6, 10)]:
+        chunks = [
+            make_chunk(start, min(start + 4, entry_stop))
+            for start in range(entry_start, entry_stop, 4)
+        ]
+        assert len(list(cache.store(key, iter(chunks)))) == len(chunks)
+
+    np.testing.assert_array_equal(read_all(cache.load(key, 0, 10)), np.arange(10))
+    for entry_start, entry_stop in [(0, 6), (3, 9), (5, 6)]:
+        loaded = list(cache.load(key, entry_start, entry_stop))
+        np.testing.assert_array_equal(
+            read_all(loaded), np.arange(entry_start, entry_stop)
+        )
+        selection = np.concatenate(
+            [chunk["event_selection"][1]["entry"] for chunk in loaded]
+        )
+        assert all(selection % 2 == 1)
+    assert cache.load(key, 0, 11) is None
+
+
+def test_evict_least_recently_used(tmp_path, input_file):
+    cache_dir = str(tmp_path.joinpath("cache"))
+    cache = EventCache(cache_dir, max_bytes=1e9)
+    keys = [cache_key(input_file, dict(EVENT_CUTS, e_pt_cut=cut)) for cut in [1, 2, 3]]
+    for idx, key in enumerate(keys):
+        list(cache.store(key, iter([make_chunk(0, 100)])))
+        entry_dir = os.path.join(cache_dir, key)
+        os.utime(entry_dir, (idx, idx))
+    entry_bytes = sum(
+        entry.stat().st_size for entry in os.scandir(os.path.join(cache_dir, keys[0]))
+    )
+
+    cache.max_bytes = 2 * entry_bytes
+    cache.evict(keep=keys[0])
+
+    assert sorted(os.listdir(cache_dir)) == sorted([keys[0], keys[2]])
@@ -0,0 +1,79 @@
+import argparse
+
+import numpy as np
+import pytest
+import uproot
+
+ROOT = pytest.importorskip("ROOT")
+
+# isort: split
+from HistCollections import Hists
+from MergeOutputs import hists_tags, main, read_record
+
+BRANCHES = ["run_number", "event_number"]
+
+
+def write_output(path, events):
+    outfile = ROOT.TFile.Open(path, "RECREATE")
+    for tag in hists_tags:
+        hists = Hists(tag, outfile, branches=BRANCHES)
+        ones = np.ones(len(events))
+        hists.fill_arrays(
+            {"nElec": (np.ones(len(events)), ones)},
+            {
+                "weight": ones,
+                "run_number": np.full(len(events), 2**62, dtype=np.int64),
+                "event_number": events,
+            },
+        )
+        hists.write()
+    outfile.Close()
+    return path
+
+
+def merge_args(output, files, append=False):
+    return argparse.Namespace(
+        files=files, file_list=None, output=output, jobs=2, fan_in=2, append=append
+    )
+
+
+def merged_events(path):
+    with uproot.open(path) as merged_file:
+        events = merged_file["all_events/hftree"]["event_number"].array(library="np")
+        n_elec = merged_file["all_events/h_all_events_nElec"].values()
+    return events.tolist(), n_elec[1]
+
+
+def test_merge_in_file_order_skipping_unreadable_files(tmp_path):
+    paths = [
+        write_output(str(tmp_path.joinpath(f"output_{idx}.root")), events)
+        for idx, events in enumerate(
+            [np.arange(0, 3), np.arange(3, 5), np.arange(5, 9)]
+        )
+    ]
+    broken = tmp_path.joinpath("broken.root")
+    broken.write_bytes(b"not a ROOT file")
+    output = str(tmp_path.joinpath("merged.root"))
+
+    main(merge_args(output, [paths[0], str(broken), paths[1], paths[2]]))
+
+    assert merged_events(output) == (list(range(9)), 9.0)
+    assert len(read_record(output)) == 3
+
+
+def test_append_only_new_files(tmp_path):
+    first = write_output(str(tmp_path.joinpath("first.root")), np.arange(0, 3))
+    second = write_output(str(tmp_path.joinpath("second.root")), np.arange(3, 5))
+    output = str(tmp_path.joinpath("merged.root"))
+
+    main(merge_args(output, [first]))
+    main(merge_args(output, [first, second], append=True))
+
+    assert merged_events(output) == (list(range(5)), 5.0)
+
+
+def test_append_without_record(tmp_path):
+    output = write_output(str(tmp_path.joinpath("merged.root")), np.arange(3))
+    other = write_output(str(tmp_path.joinpath("other.root")), np.arange(3, 5))
+    with pytest.raises(SystemExit):
+        main(merge_args(output, [other], append=True))
@@ -0,0 +1,152 @@
+import json
+
+import click
+import pytest
+
+from generate_config import (
+    allocate_seeds,
+    check_configs,
+    job_dir,
+    parse_seeds,
+    plan_jobs,
+    process_dir,
+    write_batch,
+)
+
+
+def make_config(**run_options):
+    return {
+        "type": "madgraph5",
+        "process": "p p > l+ l-",
+        "output": "drell-yan_ll",
+        "options": {
+            "madevent": {"run_mode": 2},
+            "run": dict(
+                {"shower": "Pythia8", "nevents": 5000, "iseed": 0}, **run_options
+            ),
+        },
+        "version": "0.1.0",
+    }
+
+
+def manifest_seeds(output_path):
+    manifest = json.loads(output_path.joinpath("manifest.json").read_text())
+    return [card["seed"] for card in manifest["cards"]]
+
+
+def test_parse_seeds():
+    assert parse_seeds("1-3,7, 9-10") == [1, 2, 3, 7, 9, 10]
+
+
+def test_allocate_seeds_counts_up():
+    assert allocate_seeds(2, jobs=3, first_seed=5) == [[5, 6, 7], [8, 9, 10]]
+
+
+def test_allocate_seeds_splits_given_seeds():
+    assert allocate_seeds(2, seeds=[3, 1, 4, 2]) == [[3, 1], [4, 2]]
+
+
+@pytest.mark.parametrize(
+    "seeds, jobs",
+    [
+        ([1, 2, 2], None),  # repeated
+        ([0, 1], None),  # MadGraph picks the seed of iseed 0 itself
+        ([1, 2, 3], 2),  # too few for 2 points of 2 jobs
+        ([1, 2, 3, 4, 5], 2),  # one seed left unused
+    ],
+)
+def test_allocate_seeds_rejects(seeds, jobs):
+    with pytest.raises(click.BadParameter):
+        allocate_seeds(2, seeds=seeds, jobs=jobs)
+
+
+def test_write_batch_continues_after_used_seeds(tmp_path):
+    assert write_batch(make_config(), tmp_path, jobs=3) == [1, 2, 3]
+    assert write_batch(make_config(), tmp_path, jobs=2) == [4, 5]
+    assert manifest_seeds(tmp_path) == [1, 2, 3, 4, 5]
+    assert "set iseed 5" in tmp_path.joinpath("drell-yan_ll_seed_5.mg5").read_text()
+
+
+def test_write_batch_starts_at_iseed(tmp_path):
+    assert write_batch(make_config(iseed=100), tmp_path, jobs=2) == [100, 101]
+
+
+def test_write_batch_refuses_used_seeds(tmp_path):
+    write_batch(make_config(), tmp_path, seeds=[1, 2])
+    with pytest.raises(click.BadParameter):
+        write_batch(make_config(), tmp_path, seeds=[2, 3])
+    assert manifest_seeds(tmp_path) == [1, 2]
+
+
+def test_write_batch_grid_points(tmp_path):
+    grid = {"options.run.nevents": [100, 200]}
+    assert write_batch(make_config(), tmp_path, jobs=2, grid=grid) == [1, 2, 3, 4]
+    card = tmp_path.joinpath("drell-yan_ll_point_1_seed_3.mg5").read_text()
+    assert "set nevents 200" in card
+
+
+def test_launch_only_cards_launch_their_own_copy(tmp_path):
+    config = make_config()
+    write_batch(config, tmp_path, jobs=2, launch_only=True)
+    manifest = json.loads(tmp_path.joinpath("manifest.json").read_text())
+
+    job_dirs = [card["job_dir"] for card in manifest["cards"]]
+    assert len(set(job_dirs)) == 2
+    for card in manifest["cards"]:
+        assert card["process_dir"] == process_dir(config)
+        assert tmp_path.joinpath(card["build_card"]).exists()
+        text = tmp_path.joinpath(card["card"]).read_text()
+        assert f"shell cp -r {card['process_dir']}/. {card['job_dir']}" in text
+        assert f"launch {card['job_dir']}" in text
+        assert f"launch {card['process_dir']}\n" not in text
+
+
+def test_process_dir_ignores_run_options():
+    assert process_dir(make_config(iseed=1)) == process_dir(make_config(iseed=2))
+    assert job_dir(make_config(iseed=1)) != job_dir(make_config(iseed=2))
+
+
+def test_plan_jobs():
+    # 10 events per core-second on 4 cores for 0.8 * 100 seconds: 3200 events
+    plan = plan_jobs(10000, cores_per_node=4, walltime=100, rate=10, nodes=2)
+    assert plan["n_jobs"] == 4
+    assert plan["nevents"] == 2500
+    assert plan["total_events"] == 10000
+    assert plan["rounds"] == 2
+    assert plan["expected_seconds"] == pytest.approx(62.5)
+
+
+def test_plan_jobs_rounds_events_up():
+    plan = plan_jobs(10001, cores_per_node=4, walltime=100, rate=10)
+    assert plan["n_jobs"] == 4
+    assert plan["total_events"] >= 10001
+    assert "rounds" not in plan
+
+
+def test_plan_jobs_rejects_too_short_walltime():
+    with pytest.raises(click.BadParameter):
+        plan_jobs(100, cores_per_node=1, walltime=1, rate=0.1)
+
+
+def test_check_configs_skips_unchanged_cards(tmp_path):
+    config_path = tmp_path.joinpath("config.json")
+    config_path.write_text(json.dumps(make_config()))
+    output_path = tmp_path.joinpath("cards")
+    card_path = output_path.joinpath("drell-yan_ll.mg5")
+
+    assert check_configs([config_path], output_path) == 0
+    card_path.write_text("edited")
+    check_configs([config_path], output_path)
+    assert card_path.read_text() == "edited"
+
+    config_path.write_text(json.dumps(make_config(nevents=10)))
+    check_configs([config_path], output_path)
+    assert "set nevents 10" in card_path.read_text()
+
+
+def test_check_configs_counts_invalid(tmp_path):
+    config_path = tmp_path.joinpath("config.json")
+    config = make_config()
+    del config["process"]
+    config_path.write_text(json.dumps(config))
+    assert check_configs([config_path]) == 1